@@ -11,6 +11,7 @@
 """
 
 import re
+import zlib
 import logging
 logging = logging.getLogger(__name__)
 
@@ -28,6 +29,13 @@ CF_default_colfamily = CONF['default_colfamily']
 CF_default_cf_super = CONF['default_cf_super']
 CF_default_namespace = CONF['default_namespace']
 CF_default_key = CONF['default_key']
+CF_default_shards = CONF.getValue('default_shards', 0)
+
+# Most columns read by a slice (the thrift count is an i32)
+MAX_COLUMNS = 2**31 - 1
+# Slice end of a column prefix: sorts after any column starting with the
+# prefix, and is valid UTF-8
+PREFIX_END = u'\uffff'.encode('utf8')
 
 
 class CassandraStore(IStore):
@@ -35,6 +43,12 @@ class CassandraStore(IStore):
     Store interface for interacting with the Cassandra key/value store
     @see http://github.com/vomjom/pycassa
     @Note Default behavior is to use a random super column name space!
+    @note Keys are columns of the row self.key. With shards=N (N > 1) they
+    are spread over the N rows self.key:0 ... self.key:N-1 by a hash of the
+    key instead, so the writes and reads of a store are not all served by
+    the replicas of one row. Reads of many keys, and queries, are one
+    multiget of the rows involved. The number of shards of a store can not
+    change once it holds data.
     """
     def __init__(self, **kwargs):
         self.kvs = None
@@ -44,6 +58,8 @@ class CassandraStore(IStore):
         self.cf_super = True
         self.namespace = None
         self.key=None
+        self.shards = 0
+        self.rows = []
 
     @classmethod
     def create_store(cls, **kwargs):
@@ -63,6 +79,11 @@ class CassandraStore(IStore):
         
         if not inst.key:
             inst.key = str(uuid.uuid4())
+        inst.shards = kwargs.get('shards', CF_default_shards)
+        if inst.shards > 1:
+            inst.rows = ['%s:%d' % (inst.key, i) for i in range(inst.shards)]
+        else:
+            inst.rows = [inst.key]
         
         if inst.cf_super:
             inst.namespace = kwargs.get('namespace', CF_default_namespace)
@@ -88,8 +109,45 @@ class CassandraStore(IStore):
         logging.info('colfamily: '+str(inst.colfamily))
         logging.info('cf_super: '+str(inst.cf_super))
         logging.info('namespace: '+str(inst.namespace))
+        logging.info('shards: '+str(inst.shards))
         return defer.succeed(inst)
 
+    def _row(self, col):
+        """
+        @brief Row key of the shard holding column col
+        """
+        if len(self.rows) == 1:
+            return self.key
+        return self.rows[(zlib.crc32(col) & 0xffffffff) % len(self.rows)]
+
+    def _read(self, rows, **kwargs):
+        """
+        @brief Read columns of rows, of the super column namespace if the
+        column family has super columns, in one request.
+        @param kwargs column selection arguments of pycassa ColumnFamily.get
+        @retval dict of column:value over all rows
+        """
+        if self.cf_super:
+            kwargs['super_column'] = self.namespace
+        if len(rows) == 1:
+            try:
+                return self.kvs.get(rows[0], **kwargs)
+            except pycassa.NotFoundException:
+                return {}
+        values = {}
+        for row_values in self.kvs.multiget(rows, **kwargs).values():
+            values.update(row_values)
+        return values
+
+    def _read_cols(self, cols):
+        """
+        @brief Read the given columns from the rows holding them
+        """
+        if not cols:
+            return {}
+        rows = list(set([self._row(col) for col in cols]))
+        return self._read(rows, columns=cols)
+
 
     def clear_store(self):
         """
@@ -97,7 +155,8 @@ class CassandraStore(IStore):
         @note This is complicated by the persistence across many 
         """
         if self.cf_super:
-            self.kvs.remove(self.key,super_column=self.namespace)
+            for row in self.rows:
+                self.kvs.remove(row, super_column=self.namespace)
         else:
             logging.info('Can not clear root of persistent store!')
         return defer.succeed(None)
@@ -109,18 +168,8 @@ class CassandraStore(IStore):
         @param col Cassandra column
         @retval Deferred, for value from the ion dictionary, or None
         """
-        value = None
-        try:
-            if self.cf_super:
-                value = self.kvs.get(self.key, columns=[col], super_column=self.namespace)
-            else:
-                value = self.kvs.get(self.key, columns=[col])
-            #logging.debug('Key "%s":"%s"' % (key, val))
-            #this could fail if insert did it wrong
-            value=value.get(col)
-        except pycassa.NotFoundException:
-            #logging.debug('Key "%s" not found' % key)
-            pass
+        #this could fail if insert did it wrong
+        value = self._read([self._row(col)], columns=[col]).get(col)
         return defer.succeed(value)
 
     def put(self, col, value):
@@ -133,25 +182,77 @@ class CassandraStore(IStore):
         """
         #logging.debug('writing key %s value %s' % (key, value))
         if self.cf_super:
-            self.kvs.insert(self.key, {self.namespace:{col:value}})
+            self.kvs.insert(self._row(col), {self.namespace:{col:value}})
         else:
-            self.kvs.insert(self.key, {col:value})
+            self.kvs.insert(self._row(col), {col:value})
+        return defer.succeed(None)
+
+    def get_many(self, cols):
+        """
+        @brief Return the values corresponding to a list of keys, read in
+        one request
+        @param cols list of Cassandra columns
+        @retval Deferred, for list of values, with None for each column not
+        found
+        @note Without shards all keys are columns of the one row self.key,
+        so this is a single get of many columns; with shards it is one
+        multiget of the rows holding them.
+        """
+        cols = list(cols)
+        values = self._read_cols(cols)
+        return defer.succeed([values.get(col) for col in cols])
+
+    def put_many(self, items):
+        """
+        @brief Write many key/value pairs into cassandra, with one insert
+        per row (shard) written to
+        @param items list of (key, value) pairs, or a dict
+        @retval Deferred for success
+        """
+        if isinstance(items, dict):
+            items = items.items()
+        rows = {}
+        for col, value in items:
+            rows.setdefault(self._row(col), {})[col] = value
+        for row, cols in rows.items():
+            if self.cf_super:
+                self.kvs.insert(row, {self.namespace:cols})
+            else:
+                self.kvs.insert(row, cols)
         return defer.succeed(None)
 
+    def exists(self, col):
+        """
+        @brief Check for a value at a key
+        @param col Cassandra column
+        @retval Deferred, for True if the column exists
+        """
+        d = self.exists_many([col])
+        d.addCallback(lambda found: found[0])
+        return d
+
+    def exists_many(self, cols):
+        """
+        @brief Check many keys for values in one request
+        @param cols list of Cassandra columns
+        @retval Deferred, for list of bools, True for each column that exists
+        @note Thrift has no column existence call; the columns are read in
+        one get, the same as get_many.
+        """
+        cols = list(cols)
+        found = self._read_cols(cols)
+        return defer.succeed([col in found for col in cols])
+
     def query(self, regex):
         """
         @brief Search by regular expression
         @param regex Regular expression to match against the keys
         @retval Deferred, for list, possibly empty, of keys that match.
-        @note Uses get_range generator of unknown efficiency.
+        @note Reads every column of the store (all shards, in one
+        multiget); see query_prefix.
         """
-        #@todo This implementation is very inefficient. Do smarter, but how?
         matched_list = []
-        if self.cf_super:
-            klist = self.kvs.get(self.key, super_column=self.namespace)
-        else:
-            klist = self.kvs.get(self.key)
-
+        klist = self._read(self.rows, column_count=MAX_COLUMNS)
         for x in klist.keys():
             #m = re.search(regex, x[0])
             m = re.findall(regex, x)
@@ -160,6 +261,24 @@ class CassandraStore(IStore):
 
         return defer.succeed(matched_list)
 
+    def query_prefix(self, prefix, regex):
+        """
+        @brief Search the keys starting with prefix by regular expression
+        @retval Deferred, for list of matches of prefix + regex
+        @note Columns are sorted by name, so only the slice of columns
+        starting with prefix is read from each shard, in one multiget.
+        The prefix is matched literally.
+        """
+        pattern = re.escape(prefix) + regex
+        matched_list = []
+        klist = self._read(self.rows, column_start=prefix,
+                            column_finish=prefix + PREFIX_END,
+                            column_count=MAX_COLUMNS)
+        for x in klist.keys():
+            if x.startswith(prefix):
+                matched_list.extend(re.findall(pattern, x))
+        return defer.succeed(matched_list)
+
     def remove(self, col):
         """
         @brief delete a key/value pair
@@ -168,7 +287,23 @@ class CassandraStore(IStore):
         @note Deletes are lazy, so key may still be visible for some time.
         """
         if self.cf_super:
-            self.kvs.remove(self.key, columns=[col], super_column=self.namespace)
+            self.kvs.remove(self._row(col), columns=[col], super_column=self.namespace)
         else:
-            self.kvs.remove(self.key, columns=[col])
+            self.kvs.remove(self._row(col), columns=[col])
+        return defer.succeed(None)
+
+    def remove_many(self, cols):
+        """
+        @brief delete many key/value pairs, with one remove per row (shard)
+        @param cols list of keys to delete
+        @retval Deferred, for success of operation
+        """
+        rows = {}
+        for col in cols:
+            rows.setdefault(self._row(col), []).append(col)
+        for row, row_cols in rows.items():
+            if self.cf_super:
+                self.kvs.remove(row, columns=row_cols, super_column=self.namespace)
+            else:
+                self.kvs.remove(row, columns=row_cols)
         return defer.succeed(None)
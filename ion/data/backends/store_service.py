@@ -75,6 +75,35 @@ class StoreService(BaseService):
         val = yield self.store.get(key)
         yield self.reply_ok(msg, {'value':val})
 
+    @defer.inlineCallbacks
+    def op_put_many(self, content, headers, msg):
+        """
+        Service operation: Puts many key/value pairs into the store.
+        """
+        items = [(str(key), val) for key, val in content['items']]
+        logging.info("op_put_many: %d items" % len(items))
+        res = yield self.store.put_many(items)
+        yield self.reply_ok(msg, {'result':res})
+
+    @defer.inlineCallbacks
+    def op_get_many(self, content, headers, msg):
+        """
+        Service operation: Gets the values of many keys from the store.
+        """
+        keys = [str(key) for key in content['keys']]
+        logging.info("op_get_many: %d keys" % len(keys))
+        vals = yield self.store.get_many(keys)
+        yield self.reply_ok(msg, {'values':vals})
+
+    @defer.inlineCallbacks
+    def op_exists_many(self, content, headers, msg):
+        """
+        Service operation: Checks which of many keys have values.
+        """
+        keys = [str(key) for key in content['keys']]
+        found = yield self.store.exists_many(keys)
+        yield self.reply_ok(msg, {'exists':found})
+
     @defer.inlineCallbacks
     def op_query(self, content, headers, msg):
         """
@@ -93,6 +122,16 @@ class StoreService(BaseService):
         res = yield self.store.remove(key)
         yield self.reply_ok(msg, {'result':res})
 
+    @defer.inlineCallbacks
+    def op_remove_many(self, content, headers, msg):
+        """
+        Service operation: Delete the values of many keys.
+        """
+        keys = [str(key) for key in content['keys']]
+        logging.info("op_remove_many: %d keys" % len(keys))
+        res = yield self.store.remove_many(keys)
+        yield self.reply_ok(msg, {'result':res})
+
     @defer.inlineCallbacks
     def op_clear_store(self, content, headers, msg):
         """
@@ -125,6 +164,35 @@ class StoreServiceClient(BaseServiceClient, IStore):
         logging.info('Service put reply: '+str(content))
         defer.returnValue(str(content))
 
+    @defer.inlineCallbacks
+    def get_many(self, keys):
+        yield self._check_init()
+        (content, headers, msg) = yield self.rpc_send('get_many', {'keys':[str(key) for key in keys]})
+        logging.info('Service get_many reply: %d values' % len(content['values']))
+        defer.returnValue(content['values'])
+
+    @defer.inlineCallbacks
+    def put_many(self, items):
+        yield self._check_init()
+        if isinstance(items, dict):
+            items = items.items()
+        items = [(str(key), value) for key, value in items]
+        (content, headers, msg) = yield self.rpc_send('put_many', {'items':items})
+        logging.info('Service put_many reply: '+str(content))
+        defer.returnValue(str(content))
+
+    def exists(self, key):
+        d = self.exists_many([key])
+        d.addCallback(lambda found: found[0])
+        return d
+
+    @defer.inlineCallbacks
+    def exists_many(self, keys):
+        yield self._check_init()
+        (content, headers, msg) = yield self.rpc_send('exists_many', {'keys':[str(key) for key in keys]})
+        logging.info('Service exists_many reply: '+str(content))
+        defer.returnValue(content['exists'])
+
     @defer.inlineCallbacks
     def query(self, regex):
         (content, headers, msg) = yield self.rpc_send('query', {'regex':regex})
@@ -137,6 +205,13 @@ class StoreServiceClient(BaseServiceClient, IStore):
         logging.info('Service remove reply: '+str(content))
         defer.returnValue(content['result'])
 
+    @defer.inlineCallbacks
+    def remove_many(self, keys):
+        yield self._check_init()
+        (content, headers, msg) = yield self.rpc_send('remove_many', {'keys':[str(key) for key in keys]})
+        logging.info('Service remove_many reply: '+str(content))
+        defer.returnValue(content['result'])
+
     @defer.inlineCallbacks
     def clear_store(self):
         (content, headers, msg) = yield self.rpc_send('clear_store', {})
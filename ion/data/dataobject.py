@@ -9,29 +9,48 @@
 
 NULL_CHR = '\x00'
 
+import logging
+logging = logging.getLogger(__name__)
+
 try:
     import json
 except:
     import simplejson as json
 import uuid
 import re
+import hashlib
+import base64
+import msgpack
 
 from twisted.python import reflect
 
+class DataObjectError(Exception):
+    """
+    Exception class for DataObject encoding and decoding
+    """
+
 class TypedAttribute(object):
     """
     @brief Descriptor class for Data Object attributes. Data Objects are
     containers of typed attributes.
     """
 
-    def __init__(self, type, default=None):
+    def __init__(self, type, default=None, tag=None):
+        """
+        @param tag small positive integer naming the field in compact
+        encodings; give one to keep the tag of the field the same in every
+        layout of its class (see layout_tags)
+        """
         self.name = None
         self.type = type
-        self.default = default if default else type()
+        self.default = default if default else empty_value(type)
+        self.tag = tag
         self.cache = self.default
 
     def __get__(self, inst, cls):
         value = getattr(inst, self.name, self.default)
+        if isinstance(value, LazyValue):
+            value = value.load(inst, self.name)
         #return self.cache
         return value
 
@@ -39,6 +58,9 @@ class TypedAttribute(object):
         if not isinstance(value, self.type):
             raise TypeError("Error setting typed attribute %s \n Attribute must be of class %s \n Received Value of Class: %s" % (self.name, self.type, value.__class__))
         setattr(inst, self.name, value)
+        changes = getattr(inst, '_dirty', None)
+        if changes is not None:
+            changes.add(self.name[1:])
         #self.cache = value
 
 
@@ -49,48 +71,449 @@ class TypedAttribute(object):
         @param value is the string which is to be decoded
         @param _types is a dictionary of types which can be decoded
         """
-
-        #print '=================================================='
-        types = _types.copy()
-        stype, default = value.split(NULL_CHR)
-        #print '---------- ', stype, default
-
-        #the use of str is temporary unti lcaarch msging is fixed
-        mytype = eval(str(stype), types)
+        stype, default = value.split(NULL_CHR, 1)
+        mytype = lookup_type(stype, _types)
 
         # If a value is given for the typed attribute decode it.
         if default:
-            #print 'type, default:',type, default
-            #return cls(type, eval(str(default), types))
-            if issubclass(mytype, DataObject):
-                data_object = mytype.decode(json.loads(default),header=False)
-                return cls(mytype, data_object)
-
-            elif issubclass(mytype, (list, set, tuple)):
-                list_enc = json.loads(default)
-
-                objs=[]
-                for item in list_enc:
-                    itype, ival = item.split(NULL_CHR)
-                    itype = eval(str(itype), types)
-
-                    if issubclass(itype, DataObject):
-                        objs.append(itype.decode(json.loads(ival),header=False) )
-                    else:
-                        objs.append(itype(str(ival)))
+            return cls(mytype, value_decoder(mytype)(mytype, default))
+        return cls(mytype)
+
+
+"""
+Codec plans: the encoding of a DataObject is worked out once per class
+instead of reflecting on every attribute of every instance.
+"""
+
+_builtin_types = dict([(t.__name__, t) for t in
+        (str, unicode, int, long, float, bool, list, tuple, set, dict, buffer)])
+
+def empty_value(mytype):
+    """
+    @brief The empty value of a type; buffer() needs an object to view.
+    """
+    if mytype is buffer:
+        return buffer('')
+    return mytype()
+
+def lookup_type(name, types=None):
+    """
+    @brief Resolve an encoded type name to a class without using eval.
+    Registered DataObject types take precedence over the builtin types.
+    @param name type name as it appears in the encoded object
+    @param types dictionary of name:class, defaults to DataObject._types
+    """
+    if types is None:
+        types = DataObject._types
+    name = str(name)
+    try:
+        return types[name]
+    except KeyError:
+        return _builtin_types[name]
+
+def _encode_scalar(value):
+    return "%s%s%s" % (type(value).__name__, NULL_CHR, str(value),)
+
+def _encode_buffer(value):
+    # Binary payload goes out as is: no base64, no escaping
+    return "%s%s%s" % ('buffer', NULL_CHR, value,)
+
+# Marks a slot which holds no value
+_UNSET = object()
+
+# First bytes of a msgpack array; json arrays start with '['
+_PACKED = frozenset([chr(c) for c in range(0x90, 0xa0)] + ['\xdc', '\xdd'])
+
+def _binary(encoded):
+    """
+    @retval True if encoded ("type\x00value") is a buffer or a nested value
+    packed with msgpack, which json can not carry.
+    """
+    stype, sep, raw = encoded.partition(NULL_CHR)
+    return stype == 'buffer' or raw[:1] in _PACKED
+
+def _dumps_nested(items, binary):
+    """
+    @brief Encode the item encodings of a nested DataObject or sequence:
+    json, or msgpack if an item is binary, so binary goes as is.
+    """
+    if binary:
+        return msgpack.packb(items)
+    return json.dumps(items)
+
+def _loads_nested(raw):
+    """
+    @brief Decode what _dumps_nested encoded; json arrays start with '['.
+    """
+    if raw[:1] == '[':
+        return json.loads(raw)
+    return msgpack.unpackb(str(raw))
+
+def _encode_dataobject(value):
+    value_enc = value.encode(header=False)
+    binary = any([_binary(enc) for name, enc in value_enc])
+    return "%s%s%s" % (type(value).__name__, NULL_CHR, _dumps_nested(value_enc, binary),)
+
+def _encode_sequence(value):
+    # List can contain other data object or decodable types
+    list_enc = []
+    for val in value:
+        if isinstance(val, DataObject):
+            list_enc.append(_encode_dataobject(val))
+        elif isinstance(val, buffer):
+            list_enc.append(_encode_buffer(val))
+        else:
+            list_enc.append(_encode_scalar(val))
+    binary = any([_binary(enc) for enc in list_enc])
+    return "%s%s%s" % (type(value).__name__, NULL_CHR, _dumps_nested(list_enc, binary),)
+
+def _encode_dict(value):
+    # dict can only contain JSONable types!
+    return "%s%s%s" % (type(value).__name__, NULL_CHR, json.dumps(value),)
+
+def _encode_any(value):
+    """
+    @brief Encoder for attributes whose declared type does not determine
+    the encoding (e.g. object); dispatch on the value itself.
+    """
+    if isinstance(value, DataObject):
+        return _encode_dataobject(value)
+    elif isinstance(value, buffer):
+        return _encode_buffer(value)
+    elif isinstance(value, (list, tuple, set)):
+        return _encode_sequence(value)
+    elif isinstance(value, dict):
+        return _encode_dict(value)
+    return _encode_scalar(value)
+
+def value_encoder(atype):
+    """
+    @brief Select the encoder for values of a TypedAttribute of type atype.
+    """
+    if issubclass(atype, DataObject):
+        return _encode_dataobject
+    elif issubclass(atype, (list, tuple, set)):
+        return _encode_sequence
+    elif issubclass(atype, dict):
+        return _encode_dict
+    elif atype is buffer:
+        return _encode_buffer
+    elif atype is object:
+        return _encode_any
+    return _encode_scalar
+
+class LazyValue(object):
+    """
+    @brief Placeholder for a nested DataObject or sequence attribute which
+    was decoded lazily. It holds the encoded "type\x00value" string until
+    the attribute is first read; TypedAttribute.__get__ then decodes it and
+    replaces the placeholder with the value.
+    @note Encoding an object whose lazy attributes were never read reuses
+    the encoded strings as they are.
+    @note Subclasses may produce encoded on demand (see
+    ion.data.datastore.objstore.LazyBlob); any typed attribute can hold one.
+    """
+    __slots__ = ('encoded',)
+
+    def __init__(self, encoded):
+        self.encoded = encoded
+
+    def decode(self):
+        stype, raw = self.encoded.split(NULL_CHR, 1)
+        mytype = lookup_type(stype)
+        if not raw:
+            return empty_value(mytype)
+        if issubclass(mytype, DataObject):
+            return mytype.decode(_loads_nested(raw), header=False, lazy=True)
+        return value_decoder(mytype)(mytype, raw)
+
+    def load(self, obj, slot):
+        """
+        @brief Decode the value and memoize it in obj
+        """
+        value = self.decode()
+        setattr(obj, slot, value)
+        return value
+
+class ChangeSet(set):
+    """
+    @brief Names of the typed attributes set on a DataObject since
+    DataObject.track_changes.
+    """
+
+    def __init__(self, base=None):
+        set.__init__(self)
+        self.base = base
+
+def _keep_lazy(encoder):
+    """
+    @brief Wrap the encoder of an attribute which may hold a LazyValue
+    """
+    def encode(value):
+        if isinstance(value, LazyValue):
+            return value.encoded
+        return encoder(value)
+    return encode
+
+def _decode_scalar(mytype, raw):
+    return mytype(str(raw))
+
+def _decode_bool(mytype, raw):
+    return str(raw) == 'True'
+
+def _decode_buffer(mytype, raw):
+    return buffer(str(raw))
+
+def _decode_dataobject(mytype, raw):
+    return mytype.decode(_loads_nested(raw), header=False)
+
+def _decode_dict(mytype, raw):
+    # since dicts are 'just' json encoded load and return!
+    return json.loads(raw)
+
+def _decode_sequence(mytype, raw):
+    objs = []
+    for item in _loads_nested(raw):
+        itype, ival = item.split(NULL_CHR, 1)
+        itype = lookup_type(itype)
+        if issubclass(itype, DataObject):
+            objs.append(itype.decode(_loads_nested(ival), header=False))
+        else:
+            objs.append(itype(str(ival)))
+    return mytype(objs)
+
+_value_decoders = {}
+
+def value_decoder(mytype):
+    """
+    @brief Select (and memoize) the decoder for an encoded value of type
+    mytype. The decoder is called as decoder(mytype, raw).
+    """
+    try:
+        return _value_decoders[mytype]
+    except KeyError:
+        pass
+    if issubclass(mytype, DataObject):
+        decoder = _decode_dataobject
+    elif issubclass(mytype, (list, set, tuple)):
+        decoder = _decode_sequence
+    elif issubclass(mytype, dict):
+        decoder = _decode_dict
+    elif issubclass(mytype, bool):
+        decoder = _decode_bool
+    elif mytype is buffer:
+        decoder = _decode_buffer
+    else:
+        decoder = _decode_scalar
+    _value_decoders[mytype] = decoder
+    return decoder
+
+def set_decoded(obj, name, value):
+    """
+    @brief Set a decoded field on obj. A compact (slotted) object can only
+    hold its typed attributes; other fields in the encoding are dropped
+    (logged at debug level).
+    """
+    try:
+        setattr(obj, name, value)
+    except AttributeError:
+        if not type(obj).__dict__.get('_compact'):
+            raise
+        logging.debug('Dropped field %s not declared by compact %s' % (name, type(obj).__name__))
 
-                return cls(mytype, mytype(objs))
-            elif issubclass(mytype, dict):
-                # since dicts are 'just' json encoded load and return!
+_layouts = {}
 
-                return cls(mytype, json.loads(default))
+def layout_tags(names, explicit=None):
+    """
+    @brief Tags of the fields of a layout in compact (tagged) encodings:
+    small integers, which msgpack writes in one byte. A field declared
+    with a tag keeps it; the others are numbered in name order after the
+    largest declared tag, so their tags hold for this layout only.
+    @param names field names of the layout
+    @param explicit dict of name:tag of the fields declared with a tag
+    @retval dict of name:tag
+    """
+    tags = dict(explicit or {})
+    tag = max(tags.values() or [0])
+    for name in sorted(names):
+        if name not in tags:
+            tag += 1
+            tags[name] = tag
+    return tags
+
+def register_layout(fingerprint, names, explicit=None):
+    """
+    @brief Make a field layout known to decoders of compact (tagged)
+    encodings. A layout other than the local class's one is only named
+    if registered here, but for the fields declared with a tag.
+    @param fingerprint schema fingerprint of the layout
+    @param names field names of the layout
+    @param explicit dict of name:tag of the fields declared with a tag
+    """
+    layout = dict([(tag, name) for name, tag in layout_tags(names, explicit).items()])
+    if _layouts.get(fingerprint, layout) != layout:
+        raise DataObjectError('Layouts with the same fingerprint %d: %r and %r' %
+                (fingerprint, sorted(_layouts[fingerprint].values()), sorted(names)))
+    _layouts[fingerprint] = layout
 
-            elif issubclass(mytype, bool):
-                return cls(mytype, eval(str(default)))
+def lookup_layout(fingerprint):
+    """
+    @brief Field names by tag of a registered layout.
+    @retval dict of tag:name, empty for a layout not registered here
+    """
+    return _layouts.get(fingerprint, {})
 
+def schema_fingerprint(typedatts):
+    """
+    @brief Deterministic fingerprint of a set of TypedAttribute
+    declarations (field names, types and declared tags).
+    @param typedatts dict of name:TypedAttribute
+    @retval 32 bit integer
+    """
+    schema = ','.join(['%s:%s:%s' % (name, typedatts[name].type.__name__, typedatts[name].tag)
+                        for name in sorted(typedatts)])
+    return int(hashlib.sha1(schema).hexdigest()[:8], 16)
+
+class DataObjectCodec(object):
+    """
+    @brief Encode/decode plan for one DataObject class. Holds the field
+    order and the encoder of each TypedAttribute so that encoding an
+    instance is a single pass over its fields.
+    @note Fields in mutable (containers, nested DataObjects) can change in
+    place without their TypedAttribute being set.
+    @note Fields in lazy (name:slot of nested DataObjects and sequences) are kept
+    encoded when decoding with lazy=True; see LazyValue.
+    @note tags maps each field name to its tag for compact encodings (see
+    layout_tags), names maps the tags back and declared the tags given in
+    the TypedAttribute declarations; fingerprint identifies the layout.
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+        typedatts = cls._typedatts
+        self.fields = cls._attnames
+        plan = []
+        lazy = {}
+        mutable = []
+        for name in self.fields:
+            att = typedatts.get(name)
+            if att is None:
+                plan.append((name, '_' + name, None, _encode_any))
+                mutable.append(name)
+            elif issubclass(att.type, (DataObject, list, tuple, set)):
+                plan.append((name, att.name, att.default, _keep_lazy(value_encoder(att.type))))
+                lazy[name] = att.name
+                mutable.append(name)
             else:
-                return cls(mytype, mytype(str(default)))
-        return cls(mytype)
+                plan.append((name, att.name, att.default, _keep_lazy(value_encoder(att.type))))
+                if issubclass(att.type, dict) or att.type is object:
+                    mutable.append(name)
+        self.plan = tuple(plan)
+        self.lazy = lazy
+        self.slots = dict([(name, att.name) for name, att in typedatts.items()])
+        self.mutable = frozenset(mutable)
+        explicit = dict([(name, att.tag) for name, att in typedatts.items()
+                        if att.tag is not None])
+        self.declared = dict([(tag, name) for name, tag in explicit.items()])
+        if len(self.declared) != len(explicit):
+            raise DataObjectError('Fields of %s declared with the same tag' % cls.__name__)
+        self.tags = layout_tags(typedatts, explicit)
+        self.names = dict([(tag, name) for name, tag in self.tags.items()])
+        self.fingerprint = schema_fingerprint(typedatts)
+        register_layout(self.fingerprint, typedatts, explicit)
+
+    def encode(self, obj, header=True):
+        encoded = []
+        if header:
+            encoded.append(('Object_Type', "%s" % (type(obj).__name__)))
+        plan = self.plan
+        projection = getattr(obj, '_projection', None)
+        if projection is not None:
+            plan = [p for p in plan if p[1] in projection]
+        for name, slot, default, encoder in plan:
+            encoded.append((name, encoder(getattr(obj, slot, default))))
+        return encoded
+
+    def project(self, obj, names):
+        """
+        @brief A new object of the class of obj holding only the fields
+        names of obj, which are the only ones it encodes. Values are copied
+        as stored: a lazy value (see LazyValue) is not decoded.
+        """
+        cls = type(obj)
+        part = cls.__new__(cls)
+        DataObject.__init__(part)
+        fields = set()
+        for name, slot, default, encoder in self.plan:
+            if name in names:
+                value = getattr(obj, slot, _UNSET)
+                if value is not _UNSET:
+                    setattr(part, slot, value)
+                fields.add(slot)
+        part._projection = frozenset(fields)
+        return part
+
+    def encode_field(self, obj, name):
+        """
+        @retval the encoding of field name of obj, as in encode
+        """
+        for field, slot, default, encoder in self.plan:
+            if field == name:
+                return encoder(getattr(obj, slot, default))
+        raise KeyError(name)
+
+    def encode_changes(self, obj, changes, previous):
+        """
+        @brief Encode obj against a previous encoding of it.
+        @param changes names of the attributes set since the previous encoding
+        @param previous names of the fields in the previous encoding
+        @retval list of (name, encoded value); the value is None where the
+        previous encoding of the field still holds. Mutable fields are
+        encoded unless they still hold a LazyValue (never read, so never
+        changed in place).
+        """
+        encoded = []
+        mutable = self.mutable
+        for name, slot, default, encoder in self.plan:
+            if name in changes or name not in previous:
+                encoded.append((name, encoder(getattr(obj, slot, default))))
+            elif name in mutable:
+                value = getattr(obj, slot, default)
+                if isinstance(value, LazyValue):
+                    encoded.append((name, None))
+                else:
+                    encoded.append((name, encoder(value)))
+            else:
+                encoded.append((name, None))
+        return encoded
+
+    def decode_into(self, obj, attrs, lazy=False):
+        """
+        @param attrs list of (name, "type\x00value"); a value may also be a
+        LazyValue, which is kept as the placeholder of a typed attribute
+        """
+        lazyfields = self.lazy if lazy else {}
+        for name, value in attrs:
+            if name in lazyfields:
+                # Bypass the TypedAttribute type check for the placeholder
+                setattr(obj, lazyfields[name], LazyValue(value))
+                continue
+            if isinstance(value, LazyValue):
+                if name in self.slots:
+                    setattr(obj, self.slots[name], value)
+                    continue
+                value = value.encoded
+            idx = value.index(NULL_CHR)
+            mytype = lookup_type(value[:idx])
+            if mytype is buffer and isinstance(value, str):
+                # A view on the received string, the payload is not copied
+                value = buffer(value, idx + 1)
+            elif idx + 1 < len(value):
+                value = value_decoder(mytype)(mytype, value[idx + 1:])
+            else:
+                value = empty_value(mytype)
+            set_decoded(obj, name, value)
+        return obj
 
 
 class DataObjectType(type):
@@ -121,8 +544,42 @@ class DataObjectType(type):
                 value.name = '_' + key
                 d[value.name] = value.default
 
+        if dict.get('_compact', False):
+            # Store the typed attributes in slots instead of an instance
+            # dict. Only takes effect if every base is compact as well.
+            slotted = set()
+            for base in bases:
+                for yb in base.__mro__:
+                    slotted.update(yb.__dict__.get('__slots__', ()))
+            dict['__slots__'] = tuple(sorted(set(d) - slotted)) + tuple(dict.get('__slots__', ()))
+        else:
+            dict['_compact'] = False
+
         dict['__dict__'] = d
-        return type.__new__(cls, name, bases, dict)
+        newcls = type.__new__(cls, name, bases, dict)
+        newcls._build_metadata()
+        return newcls
+
+    def _build_metadata(cls):
+        """
+        @brief Compute the per class attribute metadata once, at class
+        creation: the ordered attribute names, the TypedAttribute of each
+        name and the container attributes which need a fresh instance per
+        object.
+        """
+        typedatts = {}
+        for yb in reversed(reflect.allYourBase(cls)):
+            if isinstance(yb, DataObjectType):
+                typedatts.update(yb.__dict__)
+        typedatts.update(cls.__dict__)
+        typedatts = dict([(key, value)
+                for key, value in typedatts.items()
+                if isinstance(value, TypedAttribute)])
+
+        cls._typedatts = typedatts
+        cls._attnames = tuple([key[1:] for key in cls.__dict__['__dict__']])
+        cls._containers = tuple([(att.name, att.type)
+                for att in typedatts.values() if att.type in (list, dict, set)])
 
 class DataObject(object):
     """
@@ -133,16 +590,26 @@ class DataObject(object):
     """
     __metaclass__ = DataObjectType
 
+    # Set _compact = True in the body of a subclass to store its typed
+    # attributes in __slots__ (no per instance dict). The flag is not
+    # inherited; every DataObject base of a compact class must be compact
+    # too for the instance dict to go away. A compact object can not hold
+    # undeclared fields: decoding an encoding with fields its class does
+    # not declare (e.g. a newer layout) drops them, see set_decoded.
+    _compact = True
+
+    # ChangeSet while changes are tracked (see track_changes), and the
+    # slots of the fields of a projection (see project), the only ones
+    # encoded; None for all
+    __slots__ = ('_dirty', '_projection')
+
     _types = {}
 
     def __init__(self):
-        for name, att in self.get_typedattributes().items():
-            if att.type == list:
-                setattr(self,name,[])
-            if att.type == dict:
-                setattr(self,name,{})
-            if att.type == set:
-                setattr(self,name,set([]))
+        self._dirty = None
+        self._projection = None
+        for slot, ctype in self._containers:
+            setattr(self, slot, ctype())
 
 
     def __eq__(self, other):
@@ -255,7 +722,7 @@ class DataObject(object):
         # unless you pull the class definition from _types, the defaults
         # are incorrect when using the results of a message?
         r_class = self._types[self.__class__.__name__]
-        typedatts = r_class.get_typedattributes()
+        typedatts = r_class._typedatts
 
         if not attnames:
             attnames=self.attributes
@@ -299,33 +766,16 @@ class DataObject(object):
         """
         @Brief Get the typed attributes of the class
         @Note What about typed attributes that are over ridden?
+        @note Computed once per class by the metaclass; this returns a copy.
         """
-        d={}
-        ayb = reflect.allYourBase(cls)
-        for yb in reversed(ayb):
-            if issubclass(yb, DataObject):
-                d.update(yb.__dict__)
-
-        d.update(cls.__dict__)
-
-        atts = {}
-        for key,value in d.items():
-            if isinstance(value, TypedAttribute):
-                atts[key]=value
-        return  atts
-
-
+        return cls._typedatts.copy()
 
     @property
-
     def attributes(self):
         """
         @bug It would be nice if the attributes function only returned the set of keys for attributes that were defined within the object, rather than all attributes (even the ones relating to the underlying registry)
         """
-        names = []
-        for key in self.__dict__:
-            names.append(key[1:])
-        return names
+        return list(self._attnames)
 
     def get_attributes(self):
         atts={}
@@ -337,77 +787,58 @@ class DataObject(object):
         return atts
 
 
-    def encode(self,header=True):
+    @classmethod
+    def get_codec(cls):
         """
+        @brief Get the codec plan of this class, compiling it on first use.
         """
-        encoded = []
-        if header:
-            encoded.append(('Object_Type', "%s" % (type(self).__name__)))
-
-        for name in self.attributes:
-            value = getattr(self, name)
-
-            # Attempt to handle nested Resources
-            if isinstance(value, DataObject):
-                value_enc = value.encode(header = False)
-                encoded.append((name, "%s%s%s" % (type(value).__name__, NULL_CHR, json.dumps(value_enc),)))
-            elif isinstance(value,(list,tuple,set)):
-                # List can contain other data object or decodable types
-                list_enc = []
-                for val in value:
-                    if isinstance(val, DataObject):
-                        val_enc = val.encode(header = False)
-                        list_enc.append("%s%s%s" % (type(val).__name__, NULL_CHR, json.dumps(val_enc),))
-                    else:
-                        list_enc.append("%s%s%s" % (type(val).__name__, NULL_CHR, str(val)))
+        codec = cls.__dict__.get('_codec')
+        if codec is None:
+            codec = DataObjectCodec(cls)
+            cls._codec = codec
+        return codec
 
-                encoded.append((name, "%s%s%s" % (type(value).__name__, NULL_CHR, json.dumps(list_enc),)))
-            elif isinstance(value,dict):
-                # dict can only contain JSONable types!
-                encoded.append((name, "%s%s%s" % (type(value).__name__, NULL_CHR, json.dumps(value),)))
-
-            else:
-                encoded.append((name, "%s%s%s" % (type(value).__name__, NULL_CHR, str(value),)))
+    def track_changes(self, base=None):
+        """
+        @brief Record the names of the typed attributes set on this object
+        from now on.
+        @param base what the changes are relative to (e.g. the tree this
+        object was checked out from)
+        """
+        self._dirty = ChangeSet(base)
 
+    def get_changes(self):
+        """
+        @retval ChangeSet of the attributes set since track_changes, None if
+        changes are not tracked.
+        @note In place changes of containers and nested DataObjects are not
+        recorded.
+        """
+        return getattr(self, '_dirty', None)
 
-        return encoded
+    def encode(self,header=True):
+        """
+        @brief Encode the typed attributes of this object as a list of
+        (name, "type\x00value") pairs, optionally headed by the class name.
+        """
+        return type(self).get_codec().encode(self, header)
 
 
     @classmethod
-    def decode(cls, attrs,header=True):
+    def decode(cls, attrs,header=True,lazy=False):
         """
         decode store object[s]
+        @param lazy if True, nested DataObject and sequence attributes are
+        decoded on first access instead of up front (see LazyValue)
         """
-        #d = dict([(str(name), TypedAttribute.decode(value)) for name, value in attrs])
-        d={}
         clsobj = cls
-        if isinstance(attrs, tuple):
-            attrs = list(attrs)
-
         if header:
-            header,clsname = attrs.pop(0)
-            #print 'header',header
-            #print 'clsname',clsname
-            clsobj = eval(str(clsname), cls._types)
+            header,clsname = attrs[0]
+            attrs = attrs[1:]
+            clsobj = lookup_type(clsname, cls._types)
 
         obj = clsobj()
-
-
-        for name, value in attrs:
-            #print 'name',name
-            #print 'value',value
-            ta = TypedAttribute.decode(value, cls._types)
-            #print 'ta',ta.default
-
-            setattr(obj,name, ta.default)
-            #print name, d[str(name)].default
-        #print 'clsobj', clsobj
-
-
-
-        #
-        #return type(clsobj.__name__, (clsobj,), d)
-        return obj
+        return clsobj.get_codec().decode_into(obj, attrs, lazy)
 
 
 
@@ -633,6 +1064,7 @@ class DEncoder(object):
                 str:self.encode_python_type,
                 bool:self.encode_python_type,
                 list:self.encode_list,
+                buffer:self.encode_buffer,
                 #dict:self.encode_dict,
                 LCState:self.encode_lcstate,
                 DataObject:self.encode_dataobject
@@ -644,6 +1076,7 @@ class DEncoder(object):
                 'str':self.decode_python_type,
                 'bool':self.decode_python_type,
                 'list':self.decode_list,
+                'buffer':self.decode_buffer,
                 #'dict':self.decode_dict,
                 'LCState':self.decode_lcstate,
                 'DataObject':self.decode_dataobject
@@ -672,6 +1105,12 @@ class DEncoder(object):
         """
         return {'type':'LCState', 'value':str(o)}
 
+    def encode_buffer(self, o):
+        """
+        @note JSON can not carry binary; base64 it
+        """
+        return {'type':'buffer', 'value':base64.b64encode(o)}
+
     def encode_list(self, o):
         """
         """
@@ -713,6 +1152,11 @@ class DEncoder(object):
         """
         return LCStates[odict['value']]
 
+    def decode_buffer(self, odict):
+        """
+        """
+        return buffer(base64.b64decode(odict['value']))
+
     def decode_list(self, odict):
         """
         """
@@ -753,6 +1197,162 @@ class JSONDEncoder(object):
         odict = json.loads(data)
         return self._dencoder.decode(odict)
 
+class MsgpackEncoder(object):
+    """
+    @brief Encode a DataObject tree straight into msgpack native structures.
+    Scalars keep their type (ints stay ints, floats stay floats), sequences
+    become arrays and a DataObject becomes a map {class name: {field: value}}
+    nested as deep as the tree goes; no string escaping at any level.
+    @note The declared TypedAttribute type of each field selects how a value
+    is rebuilt (list/tuple/set, LCState, nested DataObject). Items of
+    untyped containers are rebuilt as DataObjects when they are single entry
+    maps keyed by a registered DataObject class name.
+    @note With compact=True a DataObject becomes
+    {class name: [fingerprint, {tag: value}]}; field names are replaced by
+    small integer tags (see layout_tags). The tags of the local layout and
+    of registered layouts (see register_layout) are named through the
+    fingerprint; of any other layout only the fields declared with a tag
+    are, and the rest are dropped. Both forms are always decodable.
+    """
+
+    native_types = (str, unicode, int, long, float, bool, type(None))
+
+    def __init__(self, compact=False):
+        self.compact = compact
+        self._plans = {}
+
+    def _plan(self, cls):
+        """
+        @brief Per class list of (key, slot, default, packer) used to encode
+        and dict of name:unpacker used to decode.
+        """
+        try:
+            return self._plans[cls]
+        except KeyError:
+            pass
+        typedatts = cls._typedatts
+        codec = cls.get_codec()
+        packers = []
+        unpackers = {}
+        for name, slot, default, encoder in codec.plan:
+            att = typedatts.get(name)
+            atype = att.type if att is not None else object
+            key = name
+            if self.compact:
+                key = codec.tags.get(name, name)
+            packers.append((key, slot, default, self._packer(atype)))
+            unpackers[name] = self._unpacker(atype)
+        plan = (tuple(packers), unpackers, codec.fingerprint)
+        self._plans[cls] = plan
+        return plan
+
+    def _packer(self, atype):
+        if issubclass(atype, DataObject):
+            return self.pack_object
+        elif issubclass(atype, (list, tuple, set)):
+            return self.pack_sequence
+        elif issubclass(atype, dict) or issubclass(atype, self.native_types):
+            return None
+        elif atype is buffer:
+            # packed as raw bytes straight from the buffer
+            return memoryview
+        elif atype is object:
+            return self.pack_item
+        return str
+
+    def _unpacker(self, atype):
+        if issubclass(atype, DataObject):
+            return self.unpack_object
+        elif issubclass(atype, (list, tuple, set)):
+            return lambda value: atype([self.unpack_item(v) for v in value])
+        elif issubclass(atype, dict) or issubclass(atype, self.native_types):
+            return None
+        elif atype is object:
+            return self.unpack_item
+        return atype
+
+    def pack_object(self, o):
+        packers, unpackers, fingerprint = self._plan(type(o))
+        projection = getattr(o, '_projection', None)
+        if projection is not None:
+            packers = [p for p in packers if p[1] in projection]
+        fields = {}
+        for key, slot, default, packer in packers:
+            value = getattr(o, slot, default)
+            if isinstance(value, LazyValue):
+                value = value.load(o, slot)
+            if packer is None:
+                fields[key] = value
+            else:
+                fields[key] = packer(value)
+        if self.compact:
+            return {type(o).__name__:[fingerprint, fields]}
+        return {type(o).__name__:fields}
+
+    def pack_sequence(self, value):
+        return [self.pack_item(v) for v in value]
+
+    def pack_item(self, value):
+        if isinstance(value, DataObject):
+            return self.pack_object(value)
+        elif isinstance(value, (list, tuple, set)):
+            return self.pack_sequence(value)
+        elif isinstance(value, (dict,) + self.native_types):
+            return value
+        elif isinstance(value, buffer):
+            return memoryview(value)
+        return str(value)
+
+    def unpack_object(self, packed):
+        (clsname, fields), = packed.items()
+        cls = lookup_type(clsname)
+        unpackers = self._plan(cls)[1]
+        if isinstance(fields, list):
+            fingerprint, tagged = fields
+            codec = cls.get_codec()
+            if fingerprint == codec.fingerprint:
+                names = codec.names
+            else:
+                names = lookup_layout(fingerprint) or codec.declared
+            fields = {}
+            for tag, value in tagged.iteritems():
+                if isinstance(tag, basestring):
+                    # untyped fields keep their names
+                    fields[tag] = value
+                elif tag in names:
+                    fields[names[tag]] = value
+                else:
+                    logging.warn('Dropped field tag %r of %s layout %d' % (tag, clsname, fingerprint))
+        obj = cls()
+        for name, value in fields.iteritems():
+            unpacker = unpackers.get(name, self.unpack_item)
+            if unpacker is not None:
+                value = unpacker(value)
+            set_decoded(obj, name, value)
+        return obj
+
+    def unpack_item(self, value):
+        if isinstance(value, dict) and len(value) == 1:
+            (clsname, fields), = value.items()
+            if isinstance(fields, (dict, list)) and clsname in DataObject._types:
+                return self.unpack_object(value)
+        elif isinstance(value, list):
+            return [self.unpack_item(v) for v in value]
+        return value
+
+    def encode(self, o):
+        """
+        @param o instance of subclass of DataObject
+        """
+        assert isinstance(o, DataObject)
+        return msgpack.packb(self.pack_object(o))
+
+    def decode(self, data):
+        """
+        @param data msgpack encoded DataObject
+        """
+        return self.unpack_object(msgpack.unpackb(data))
+
 class Serializer(object):
     """
     @brief Registry of DataObject Encoders and uniform interface for
@@ -834,7 +1434,21 @@ def register_jsond():
         content_type='application/ion-jsond',
         content_encoding='utf-8')
 
+def register_msgpack():
+    mp = MsgpackEncoder()
+    serializer.register('msgpack-dataobject', mp.encode, mp.decode,
+        content_type='application/ion-msgpack-dataobject',
+        content_encoding='binary')
+
+def register_msgpack_compact():
+    mp = MsgpackEncoder(compact=True)
+    serializer.register('msgpack-compact', mp.encode, mp.decode,
+        content_type='application/ion-msgpack-compact',
+        content_encoding='binary')
+
 register_alpha()
 register_jsond()
+register_msgpack()
+register_msgpack_compact()
 register_dencoder()
 serializer.set_default('alpha')
@@ -13,17 +13,43 @@ twisted.internet.defer.Deferred objects.
 """
 
 import re
+import math
+import time
+import uuid
+import zlib
 import hashlib
-import struct
+import binascii
 import logging
+from collections import OrderedDict
 
 from zope.interface import Interface
 from zope.interface import implements
 from zope.interface import Attribute 
 
+from twisted.internet import defer
+
+try:
+    import lz4
+except ImportError:
+    lz4 = None
+
 
 NULL_CHR = "\x00"
 
+# Stored objects starting with this are compressed; the next byte is the
+# flag of the codec. Uncompressed encodings start with the type name.
+COMPRESSED = NULL_CHR
+
+# codec name: (flag, compress, decompress)
+CODECS = {
+        'zlib':('z', zlib.compress, zlib.decompress),
+        }
+if lz4 is not None:
+    _lz4 = getattr(lz4, 'block', lz4)
+    CODECS['lz4'] = ('4', _lz4.compress, _lz4.decompress)
+
+_DECOMPRESSORS = dict((flag, decompress) for flag, compress, decompress in CODECS.values())
+
 def sha1hex(val):
     return hashlib.sha1(val).hexdigest()
 
@@ -32,7 +58,11 @@ def sha1bin(val):
 
 def sha1(val, bin=True):
     if isinstance(val, BaseObject):
-        val = val.value
+        # computed along with the encoding
+        digest = val.digest()
+        if bin:
+            return digest
+        return sha1_to_hex(digest)
     if bin:
         return sha1bin(val)
     return sha1hex(val)
@@ -40,15 +70,48 @@ def sha1(val, bin=True):
 def sha1_to_hex(bytes):
     """binary form (20 bytes) of sha1 digest to hex string (40 char)
     """
-    hex_bytes = struct.unpack('!20B', bytes)
-    almosthex = map(hex, hex_bytes)
-    return ''.join([y[-2:] for y in [x.replace('x', '0') for x in almosthex]])
+    assert len(bytes) == 20
+    return binascii.hexlify(bytes)
 
 class CAStoreError(Exception):
     """
     Exception class for CAStore
     """
 
+def encode_pack(objs):
+    """
+    @brief Pack store objects for bulk transfer. Encoded objects delimit
+    themselves by their header, so the pack is just their concatenation,
+    zlib compressed.
+    @param objs list of store objects (BaseObject instances)
+    @retval pack string
+    """
+    return zlib.compress(''.join([obj.encode() for obj in objs]))
+
+def iter_pack(pack):
+    """
+    @brief Iterate over the encoded objects of a pack made by encode_pack.
+    @param pack string
+    @retval generator of encoded objects
+    """
+    try:
+        data = zlib.decompress(pack)
+    except zlib.error, e:
+        raise CAStoreError("Malformed pack: %s" % e)
+    pos = 0
+    end = len(data)
+    while pos < end:
+        head_end = data.find(NULL_CHR, pos)
+        try:
+            length = int(data[pos:head_end].split(' ', 1)[1])
+        except (IndexError, ValueError):
+            raise CAStoreError("Malformed pack object header at %d" % pos)
+        obj_end = head_end + 1 + length
+        if head_end == -1 or obj_end > end:
+            raise CAStoreError("Truncated pack object at %d" % pos)
+        yield data[pos:obj_end]
+        pos = obj_end
+
 class Element(tuple):
     """
     Represents a child element of a tree object. Not an object itself, but
@@ -133,6 +196,8 @@ class BaseObject(object):
     type = None
     _value_cache = None
     _encoded_cache = None
+    _digest_cache = None
+    _parts_cache = None
 
     @classmethod
     def get_type(cls):
@@ -154,15 +219,57 @@ class BaseObject(object):
     def encode(self):
         """
         @brief Encode this instance.
-        @note This is where a cache should be. BaseObject.value is DEPRECATED.
-        @todo Use cStringIO buffer instead of python str.
+        @note BaseObject.value is DEPRECATED.
+        @note The sha1 is computed along with the encoding and kept with
+        it, see digest.
         """
         if not self._encoded_cache:
-            body = self._encode_body()
-            header = self._encode_header(body)
-            self._encoded_cache = "%s%s" % (header, body,)
+            header, body = self._parts()
+            self._encoded_cache = header + body
+            self._parts_cache = None
         return self._encoded_cache
 
+    def _parts(self):
+        """
+        @brief Header and body of the encoding, hashed in turn as they are
+        made; kept until encode joins them.
+        """
+        parts = self._parts_cache
+        if parts is None:
+            body = self._encode_body()
+            header = self._header(len(body))
+            digest = hashlib.sha1(header)
+            digest.update(body)
+            self._digest_cache = digest.digest()
+            parts = self._parts_cache = (header, body)
+        return parts
+
+    def digest(self):
+        """
+        @brief Binary sha1 of the encoded object; the key it is stored at.
+        @note The header and body are not joined for it, so an object only
+        hashed (e.g. a blob found unchanged) is never copied.
+        """
+        if not self._digest_cache:
+            self._parts()
+        return self._digest_cache
+
+    def copy(self):
+        """
+        @brief An instance of this object to hand out from a cache. Objects
+        which reference others (trees, commits) get a new instance, without
+        the referenced objects loaded, so loading into it leaves this one
+        as it is. Leaves are shared.
+        """
+        return self
+
+    def _copy_caches(self, other):
+        other._value_cache = self._value_cache
+        other._encoded_cache = self._encoded_cache
+        other._digest_cache = self._digest_cache
+        other._parts_cache = self._parts_cache
+        return other
+
     @staticmethod
     def decode(value, types):
         """
@@ -200,9 +307,10 @@ class BaseObject(object):
         @note Header format:
             [type][space][content-length][null-char]
         """
-        length = len(body)
-        header = "%s %d%s" % (self.type, length, NULL_CHR,)
-        return header
+        return self._header(len(body))
+
+    def _header(self, length):
+        return "%s %d%s" % (self.type, length, NULL_CHR,)
 
     @staticmethod
     def _decode_header(encoded_obj):
@@ -303,18 +411,26 @@ class Tree(BaseObject):
 
     def __getitem__(self, key):
         return self._names[key].obj
+
+    def copy(self):
+        """
+        @see BaseObject.copy
+        """
+        children = [self.elementFactory(name, id, mode) for name, id, mode in self.children]
+        return self._copy_caches(type(self)(*children))
         
     def _encode_body(self):
         """
         format for each child in body of tree object
         [6 bytes][space][name][null char][hash]
         @note should hash be string or binary of sha1 hexdigest?
+        @note the entries are joined in one pass
         """
-        body = "" #@todo use buffer
+        parts = []
         for (name, obj_hash, mode) in self.children:
             assert len(obj_hash) == 20 #bin sha1 (not hex)
-            body += "%s %s\x00%s" % (mode, name, obj_hash,)
-        return body
+            parts.append("%s %s\x00%s" % (mode, name, obj_hash,))
+        return ''.join(parts)
 
     def __str__(self):
         head = "="*10
@@ -361,34 +477,28 @@ class Tree(BaseObject):
     @staticmethod
     def _decode_body_parser(raw):
         """
-        @brief Parse encoded Tree using a two part processing loop. First
-        look for a null character; the bytes before the null are the mode +
-        name seperated by a space character. The 20 bytes that follow make
-        up the sha1 hash.
-        """
-        raw = list(raw)
-        def read_to_null(raw):
-            buf = ''
-            while raw:
-                char = raw.pop(0)
-                if char == NULL_CHR:
-                    break
-                buf += char
-            return buf, raw
-
-        def read_sha1(raw):
-            hash, raw = ''.join(raw[0:20]), raw[20:]
-            return hash, raw
-
-        children = []
-        while True:
-            mode_name, raw = read_to_null(raw)
-            mode, name = mode_name.split()
-            hash, raw = read_sha1(raw)
-            children.append((name, hash, mode))
-            if not raw:
-                break
-        return children
+        @brief Parse encoded Tree. Each entry is the mode and name seperated
+        by a space, a null character, then the 20 byte binary sha1 hash.
+        """
+        return list(Tree.iter_body(raw))
+
+    @staticmethod
+    def iter_body(raw, pos=0):
+        """
+        @brief Generate the (name, hash, mode) entries of an encoded Tree
+        body one at a time, without copying the body.
+        @param raw encoded tree body; a str or anything with str style
+        find and slicing (e.g. mmap)
+        @param pos offset of the first entry in raw
+        """
+        end = len(raw)
+        while pos < end:
+            null = raw.find(NULL_CHR, pos)
+            space = raw.find(' ', pos, null)
+            if null < 0 or space < 0 or null + 21 > end:
+                raise CAStoreError("Malformed tree entry at offset %d" % pos)
+            yield (raw[space+1:null], raw[null+1:null+21], raw[pos:space])
+            pos = null + 21
 
     @classmethod
     def child(cls, name, obj, mode=None):
@@ -411,7 +521,7 @@ class Commit(BaseObject):
         @param log Record of commit reason/context/change/etc.
         """
         if isinstance(tree, BaseObject):
-            tree_obj, tree = tree, sha1hex(tree)
+            tree_obj, tree = tree, sha1(tree, bin=False)
         else:
             tree_obj = None
         self.tree = tree
@@ -420,6 +530,12 @@ class Commit(BaseObject):
         self.log = str(log) #or unicode? or what?
         self.other = other
 
+    def copy(self):
+        """
+        @see BaseObject.copy
+        """
+        return self._copy_caches(type(self)(self.tree, list(self.parents), self.log, **self.other))
+
     def __str__(self):
         head = "="*10
         strng ="""\n%s Store Type: %s %s\n""" % (head, self.type, head,)
@@ -445,12 +561,12 @@ class Commit(BaseObject):
         \n
         
         """
-        body = ""
-        body += "%s %s\n" % ('tree', self.tree,)
+        parts = ["%s %s\n" % ('tree', self.tree,)]
         for parent in self.parents:
-            body += "%s %s\n" % ('parent', parent,)
-        body += "\n%s" % self.log
-        return body
+            parts.append("%s %s\n" % ('parent', parent,))
+        parts.append("\n")
+        parts.append(self.log)
+        return ''.join(parts)
 
     @classmethod
     def _decode_body(cls, encoded_body):
@@ -514,6 +630,20 @@ class ICAStore(Interface):
         @retval defer.Deferred that fires with the obj id.
         """
 
+    def get_many(ids):
+        """
+        @param ids list of keys of content objects.
+        @retval defer.Deferred that fires with a list of objects that
+        provide ICAStoreObject, in the order of ids.
+        """
+
+    def put_many(objs):
+        """
+        @brief Like put, for many objects in one backend write.
+        @param objs list of objects providing ICAStoreObject
+        @retval defer.Deferred that fires with the list of obj ids.
+        """
+
 class StoreContextWrapper(object):
     """
     Context wrapper around backend store.
@@ -537,12 +667,177 @@ class StoreContextWrapper(object):
     def put(self, id, val):
         return self.backend.put(self._key(id), val)
 
+    def get_many(self, ids):
+        return self.backend.get_many([self._key(id) for id in ids])
+
+    def put_many(self, items):
+        if isinstance(items, dict):
+            items = items.items()
+        return self.backend.put_many([(self._key(id), val) for id, val in items])
+
+    def exists(self, id):
+        return self.backend.exists(self._key(id))
+
+    def exists_many(self, ids):
+        return self.backend.exists_many([self._key(id) for id in ids])
+
     def remove(self, id):
         return self.backend.remove(self._key(id))
 
+    def remove_many(self, ids):
+        return self.backend.remove_many([self._key(id) for id in ids])
+
     def query(self, regex):
-        pattern = "%s%s" % (self.prefix, regex,)
-        return self.backend.query(pattern)
+        return self.backend.query_prefix(self.prefix, regex)
+
+    def query_prefix(self, prefix, regex):
+        return self.backend.query_prefix(self.prefix + prefix, regex)
+
+class ObjectCache(object):
+    """
+    @brief Bounded map of object id to decoded store object with least
+    recently used eviction. Content addressed objects never change, so
+    entries need no invalidation.
+    @note Hand out copies of the objects (see BaseObject.copy), so that
+    objects loaded into them are not kept alive beyond the byte bound.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=32 * 2**20):
+        """
+        @param max_entries most objects held
+        @param max_bytes most encoded bytes held (objects larger than this
+        are not cached)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._objs = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, id):
+        """
+        @retval the cached object, or None
+        """
+        try:
+            entry = self._objs.pop(id)
+        except KeyError:
+            self.misses += 1
+            return None
+        self._objs[id] = entry
+        self.hits += 1
+        return entry[0]
+
+    def put(self, id, obj, size):
+        """
+        @param size encoded size of obj in bytes
+        """
+        if id in self._objs or size > self.max_bytes or not self.max_entries:
+            return
+        self._objs[id] = (obj, size)
+        self.bytes += size
+        while len(self._objs) > self.max_entries or self.bytes > self.max_bytes:
+            old_id, (old_obj, old_size) = self._objs.popitem(last=False)
+            self.bytes -= old_size
+            self.evictions += 1
+
+    def clear(self):
+        self._objs.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._objs)
+
+    def stats(self):
+        """
+        @retval dict of counters for monitoring
+        """
+        return {'entries':len(self._objs),
+                'bytes':self.bytes,
+                'hits':self.hits,
+                'misses':self.misses,
+                'evictions':self.evictions}
+
+def _unseen(ids, seen):
+    """
+    @brief ids (as hex) not in seen, without duplicates; they are added to
+    seen.
+    """
+    result = []
+    for id in ids:
+        if not id:
+            continue
+        if len(id) == 20:
+            id = sha1_to_hex(id)
+        if id not in seen:
+            seen.add(id)
+            result.append(id)
+    return result
+
+class BloomFilter(object):
+    """
+    @brief Set of object ids (hex sha1) with no false negatives and a
+    bounded rate of false positives, in a fixed amount of memory.
+    @note The ids are already uniformly distributed hashes, so the bit
+    positions are taken from the id itself (double hashing) instead of
+    hashing it again. When more than capacity ids have been added the
+    filter is cleared, which keeps the false positive rate bounded.
+    """
+
+    def __init__(self, capacity=100000, error_rate=1e-9):
+        """
+        @param capacity number of ids held at the given error_rate;
+        capacity=0 makes an always empty filter
+        @param error_rate probability of a false positive
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        if capacity:
+            nbits = -capacity * math.log(error_rate) / math.log(2) ** 2
+            self.num_bits = int(math.ceil(nbits))
+            self.num_hashes = max(1, int(round(nbits / capacity * math.log(2))))
+        else:
+            self.num_bits = 0
+            self.num_hashes = 0
+        self._steps = range(self.num_hashes)
+        self.clear()
+
+    def _positions(self, id):
+        # 32 bit slices keep the arithmetic in machine ints
+        h1 = int(id[:8], 16)
+        h2 = int(id[8:16], 16) | 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in self._steps]
+
+    def add(self, id):
+        """
+        @param id hex sha1 of an object
+        """
+        if not self.capacity or id in self:
+            return
+        if self.count >= self.capacity:
+            self.clear()
+        bits = self.bits
+        for pos in self._positions(id):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, id):
+        if not self.count:
+            return False
+        bits = self.bits
+        for pos in self._positions(id):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def clear(self):
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
 
 class CAStore(object):
     """
@@ -557,16 +852,41 @@ class CAStore(object):
             Commit.type:Commit,
             }
 
-    def __init__(self, backend, namespace='', compression=None):
+    def __init__(self, backend, namespace='', compression=None,
+                    cache_entries=10000, cache_bytes=32 * 2**20,
+                    known_entries=100000, compress_min=256, known_ttl=10):
         """
         @param backend instance that provides the ion.data.store.IStore
         interface.
         @param namespace root prefix qualifying context for this CAS with in the
         general space of the backend store.
+        @param compression name of the codec in CODECS ('zlib', or 'lz4'
+        if installed) objects are stored with; None stores them as
+        encoded. Objects stored with any codec can be read either way.
+        @param compress_min objects whose encoding is shorter than this are
+        stored uncompressed
+        @param cache_entries, cache_bytes bounds of the cache of decoded
+        objects; cache_entries=0 disables it
+        @param known_entries capacity of the filter of ids known to be in
+        the backend; known_entries=0 disables it
+        @param known_ttl seconds the known filter is trusted before the
+        sweep epoch of the partition is read again (see check_epoch)
         """
         self.backend = backend
         self.namespace = namespace
         self.objs = StoreContextWrapper(backend, namespace + '.objs.')
+        self.cache = ObjectCache(cache_entries, cache_bytes)
+        self.known = BloomFilter(known_entries)
+        self.known_ttl = known_ttl
+        self.epoch = None
+        self.epoch_checked = time.time()
+        if compression is not None and compression not in CODECS:
+            raise CAStoreError("Compression %s is not available" % compression)
+        self.compression = compression
+        self.compress_min = compress_min
+        # ids put while a garbage collection runs; see
+        # ion.data.datastore.objstore.ObjectStore.collect_garbage
+        self.written = None
 
     def decode(self, encoded_obj):
         """
@@ -595,11 +915,133 @@ class CAStore(object):
         can always be assumed that a hash corresponds to an object in the
         store.
         """
-        data = obj.encode() #compress arg
-        hash = sha1(data)
-        id = sha1_to_hex(hash)
-        d = self.objs.put(id, data)
-        d.addCallback(lambda _: id)
+        data = obj.encode()
+        # the hash comes out of encode with the bytes; the id is the hash
+        # of the uncompressed encoding
+        id = sha1_to_hex(obj.digest())
+        return self._put_new([(id, self._compress(data))], id)
+
+    def put_many(self, objs):
+        """
+        @brief Store many objects with one write to the backend.
+        @param objs list of hashable objects to store
+        @retval defer.Deferred that fires with the list of obj ids.
+        """
+        ids = []
+        items = []
+        for obj in objs:
+            data = obj.encode()
+            id = sha1_to_hex(obj.digest())
+            ids.append(id)
+            items.append((id, self._compress(data)))
+        return self._put_new(items, ids)
+
+    def _compress(self, data):
+        """
+        @brief Stored form of an encoded object: compressed with the codec
+        of this store and flagged, if that makes it smaller.
+        """
+        if not self.compression or len(data) < self.compress_min:
+            return data
+        flag, compress, decompress = CODECS[self.compression]
+        stored = COMPRESSED + flag + compress(data)
+        if len(stored) >= len(data):
+            return data
+        return stored
+
+    def _decompress(self, data):
+        """
+        @brief Encoded object from its stored form.
+        """
+        if not data.startswith(COMPRESSED):
+            return data
+        try:
+            decompress = _DECOMPRESSORS[data[1]]
+        except KeyError:
+            raise CAStoreError("Object compressed with unknown codec flag %r" % data[1:2])
+        return decompress(data[2:])
+
+    def _epoch_key(self):
+        return self.namespace + '.epoch'
+
+    def check_epoch(self):
+        """
+        @brief Read the sweep epoch of the partition, which a garbage
+        collection changes when it deletes objects; if it changed since the
+        last read, the known filter and the cache are cleared, as they may
+        hold deleted ids.
+        @retval defer.Deferred
+        """
+        def _epoch_cb(epoch):
+            if epoch != self.epoch:
+                self.known.clear()
+                self.cache.clear()
+            self.epoch = epoch
+            self.epoch_checked = time.time()
+        d = self.backend.get(self._epoch_key())
+        d.addCallback(_epoch_cb)
+        return d
+
+    def new_epoch(self):
+        """
+        @brief Change the sweep epoch of the partition, so that stores on it
+        (in this and other processes) drop their known filters within
+        known_ttl seconds.
+        @retval defer.Deferred
+        """
+        self.epoch = uuid.uuid4().hex
+        self.epoch_checked = time.time()
+        self.known.clear()
+        self.cache.clear()
+        return self.backend.put(self._epoch_key(), self.epoch)
+
+    def _known_fresh(self):
+        """
+        @brief Deferred which fires once the known filter can be trusted:
+        right away, or after check_epoch if known_ttl has passed.
+        """
+        if self.known and time.time() - self.epoch_checked >= self.known_ttl:
+            return self.check_epoch()
+        return defer.succeed(None)
+
+    def _put_new(self, items, result):
+        """
+        @brief Write the (id, data) items the backend does not hold yet.
+        Ids in the known filter are skipped without asking the backend; the
+        rest are checked with one exists_many, and only the missing ones
+        are written.
+        @retval defer.Deferred that fires with result
+        """
+        if self.written is not None:
+            self.written.update([id for id, data in items])
+        d = self._known_fresh()
+        d.addCallback(lambda _: self._put_unknown(items, result))
+        return d
+
+    def _put_unknown(self, items, result):
+        new = []
+        for id, data in items:
+            if id not in self.known:
+                new.append((id, data))
+        if not new:
+            return defer.succeed(result)
+
+        def _write_cb(found):
+            missing = dict((id, data) for (id, data), present
+                                in zip(new, found) if not present)
+            if len(missing) == 1:
+                return self.objs.put(*missing.popitem())
+            elif missing:
+                return self.objs.put_many(missing)
+
+        def _known_cb(_):
+            for id, data in new:
+                self.known.add(id)
+            return result
+
+        d = self.objs.exists_many([id for id, data in new])
+        d.addCallback(_write_cb)
+        d.addCallback(_known_cb)
         return d
 
     def get(self, id):
@@ -610,23 +1052,161 @@ class CAStore(object):
         """
         if len(id) == 20:
             id = sha1_to_hex(id)
+        obj = self.cache.get(id)
+        if obj is not None:
+            # Already decoded and verified
+            return defer.succeed(obj.copy())
         d = self.objs.get(id)
-        def _decode_cb(data):
-            if not data:
-                raise CAStoreError("Object with id: %s not found" % id)
-            obj = self.decode(data)
-            # assure integrity 
-            if not id == sha1(obj, bin=False):
-                raise CAStoreError("Object Integrity Error!")
-            return obj
-        d.addCallback(_decode_cb)
+        d.addCallback(lambda data: self._decode_verified(id, data))
         # d.addErrback
         return d
 
+    def get_many(self, ids):
+        """
+        @param ids list of keys where objects are stored (object hashes)
+        @retval defer.Deferred that fires with the list of store objects, in
+        the order of ids. Objects not in the cache are read from the backend
+        with one get_many.
+        """
+        ids = [sha1_to_hex(id) if len(id) == 20 else id for id in ids]
+        objs = [self.cache.get(id) for id in ids]
+        objs = [obj.copy() if obj is not None else None for obj in objs]
+        missing = [id for id, obj in zip(ids, objs) if obj is None]
+        if not missing:
+            return defer.succeed(objs)
+
+        def _decode_cb(datas):
+            found = dict((id, self._decode_verified(id, data))
+                            for id, data in zip(missing, datas))
+            return [obj if obj is not None else found[id]
+                        for id, obj in zip(ids, objs)]
+        d = self.objs.get_many(missing)
+        d.addCallback(_decode_cb)
+        return d
+
+    def _decode_verified(self, id, data):
+        """
+        @brief decode raw data read from the backend for id, check its hash
+        and cache it.
+        """
+        if not data:
+            raise CAStoreError("Object with id: %s not found" % id)
+        data = self._decompress(data)
+        obj = self.decode(data)
+        # assure integrity 
+        if not id == sha1(obj, bin=False):
+            raise CAStoreError("Object Integrity Error!")
+        # The cache keeps the decoded object as it is, callers get copies
+        self.cache.put(id, obj, len(data))
+        self.known.add(id)
+        return obj.copy()
+
+    def exists_many(self, ids):
+        """
+        @param ids list of keys of objects (object hashes)
+        @retval defer.Deferred that fires with a list of bools, True for
+        each object the backend holds.
+        """
+        ids = [sha1_to_hex(id) if len(id) == 20 else id for id in ids]
+
+        def _exists(_):
+            unknown = [id for id in ids if id not in self.known]
+            if not unknown:
+                return [True] * len(ids)
+
+            def _found_cb(found):
+                found = dict(zip(unknown, found))
+                return [found.get(id, True) for id in ids]
+            d = self.objs.exists_many(unknown)
+            d.addCallback(_found_cb)
+            return d
+        d = self._known_fresh()
+        d.addCallback(_exists)
+        return d
+
+    def put_pack(self, pack):
+        """
+        @brief Store the objects of a pack (see encode_pack). The objects
+        are decoded and hashed here, so ids always match content.
+        @retval defer.Deferred that fires with the list of object ids.
+        """
+        try:
+            objs = self.read_pack(pack)
+        except CAStoreError:
+            return defer.fail()
+        return self.put_many(objs)
+
+    def read_pack(self, pack):
+        """
+        @brief Decode the objects of a pack (see encode_pack) without
+        storing them.
+        @retval list of store objects
+        """
+        return [self.decode(data) for data in iter_pack(pack)]
+
+    @defer.inlineCallbacks
+    def walk_commits(self, heads, stop=(), shallow=()):
+        """
+        @brief Find the commits reachable from heads through their parents.
+        Each generation of the history is read with one get_many.
+        @param heads commit ids to start from
+        @param stop ids of commits to neither return nor walk past
+        @param shallow ids of commits whose parents are not stored (see
+        ion.data.datastore.objstore.ObjectStore.collect_garbage); they are
+        returned but not walked past
+        @retval defer.Deferred that fires with a list of (id, Commit), in
+        breadth first order from heads.
+        """
+        seen = set(stop)
+        found = []
+        ids = _unseen(heads, seen)
+        while ids:
+            commits = yield self.get_many(ids)
+            found.extend(zip(ids, commits))
+            ids = _unseen([p for id, c in zip(ids, commits) if id not in shallow
+                            for p in c.parents], seen)
+        defer.returnValue(found)
+
+    @defer.inlineCallbacks
+    def walk_objects(self, ids, exclude=()):
+        """
+        @brief Find the objects reachable from ids: the objects themselves,
+        the tree of each commit and the children of each tree (but not the
+        parents of commits). Each level is read with one get_many.
+        @param ids object ids to start from
+        @param exclude ids of objects to neither return nor walk into
+        @retval defer.Deferred that fires with a list of (id, object).
+        """
+        seen = set(exclude)
+        found = []
+        ids = _unseen(ids, seen)
+        while ids:
+            objs = yield self.get_many(ids)
+            found.extend(zip(ids, objs))
+            next = []
+            for obj in objs:
+                if isinstance(obj, Commit):
+                    next.append(obj.tree)
+                elif isinstance(obj, Tree):
+                    next.extend([child[1] for child in obj.children])
+            ids = _unseen(next, seen)
+        defer.returnValue(found)
+
     def _obj_exists(self, id):
-        """Store (backend) interface does not have an 'exists' method; this
-        has to be implemented by trying to get the whole object, which
-        could be just as inefficient as writing over the existing object.
         """
+        @param id key of an object (object hash)
+        @retval defer.Deferred that fires with True if the backend holds
+        the object.
+        """
+        if len(id) == 20:
+            id = sha1_to_hex(id)
+
+        def _exists(_):
+            if id in self.known:
+                return True
+            return self.objs.exists(id)
+        d = self._known_fresh()
+        d.addCallback(_exists)
+        return d
 
 
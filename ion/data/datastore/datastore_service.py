@@ -1,12 +1,11 @@
 #!/usr/bin/env python
 
 """
-@file ion/play/rdf_store/rdf_service.py
-@package ion.play.rdf_store.rdf_service
+@file ion/data/datastore/datastore_service.py
+@package ion.data.datastore.datastore_service
 @author David Stuebe
-@brief A service that provides git symantics for push pull commit and diff to
-the rdf workspace composed of associations and objects.
-The associations can be walked to find content.
+@brief A service that provides git symantics for push pull and clone of
+the repositories (object store objects) of an object store.
 """
 
 import logging
@@ -15,67 +14,111 @@ from twisted.internet import defer
 from magnet.spawnable import Receiver
 
 import ion.util.procutils as pu
+from ion.core import ioninit
 from ion.core.base_process import ProtocolFactory
+from ion.data import store
+from ion.data.datastore import cas
+from ion.data.datastore.objstore import ObjectStore, ObjectStoreError
 from ion.services.base_service import BaseService, BaseServiceClient
 
+CONF = ioninit.config(__name__)
+
 class DataStoreService(BaseService):
     """
-    Example service interface
+    Service holding an object store that repositories (object store
+    objects and their commit history) are pushed to, pulled and cloned
+    from. Objects travel in packs; see ObjectStore.make_pack.
     """
     # Declaration of service
     declare = BaseService.service_declare(name='DataStoreService',
                                           version='0.1.0',
                                           dependencies=[])
 
-    def __init__(self, receiver, spawnArgs=None):
-        """
-        @brief Init method for the DataStore Frontend service
-        @param frontend - an instance of a CAStore Frontend
-        """
-        # Service class initializer. Basic config, but no yields allowed.
-        self.frontend = spawnArgs['MyFrontend']
-        BaseService.__init__(self, receiver, spawnArgs)
-        logging.info('DataStoreService.__init__()')
-
-#    @defer.inlineCallbacks
+    @defer.inlineCallbacks
     def slc_init(self):
-        pass
+        # use spawn args to determine backend class, second config file
+        backendcls = self.spawn_args.get('backend_class', CONF.getValue('backend_class', None))
+        backendargs = self.spawn_args.get('backend_args', CONF.getValue('backend_args', {}))
+        partition = self.spawn_args.get('partition', CONF.getValue('partition', ''))
+        compression = self.spawn_args.get('compression', CONF.getValue('compression', None))
+
+        if backendcls:
+            self.backend = pu.get_class(backendcls)
+        else:
+            self.backend = store.Store
+        assert issubclass(self.backend, store.IStore)
+
+        s = yield self.backend.create_store(**backendargs)
+        self.frontend = ObjectStore(s, partition, compression=compression)
+        logging.info('DataStoreService initialized; backend:%s; backend args:%s' % (backendcls, backendargs))
 
     @defer.inlineCallbacks
     def op_push(self, content, headers, msg):
-        logging.info('op_push: '+str(content)+ ', Remote Frontend:'+self.frontend)
-
-
-
-        # The following line shows how to reply to a message
-        yield self.reply_ok(msg)
+        """
+        Service operation: Receive a repository in two steps. Given the
+        commits of the client's history, reply with the ones missing here;
+        given a pack, store it and fast forward the head.
+        """
+        name = str(content['name'])
+        logging.info('op_push: ' + name)
+        try:
+            if 'pack' in content:
+                count = yield self.frontend.receive_pack(name,
+                        str(content['pack']),
+                        str(content['object']), content['head'] and str(content['head']),
+                        shallow=[str(id) for id in content.get('shallow', [])])
+                yield self.reply_ok(msg, {'count':count})
+            else:
+                commits = [str(id) for id in content['commits']]
+                found = yield self.frontend.exists_many(commits)
+                exists = yield self.frontend.refs.get(name)
+                missing = [id for id, present in zip(commits, found) if not present]
+                yield self.reply_ok(msg, {'missing':missing, 'exists':bool(exists)})
+        except (ObjectStoreError, cas.CAStoreError), e:
+            yield self.reply_err(msg, str(e))
 
     @defer.inlineCallbacks
     def op_pull(self, content, headers, msg):
-        logging.info('op_pull: '+str(content) + ', Remote Frontend:'+self.frontend)
-
-
-        # The following line shows how to reply to a message
-        yield self.reply_ok(msg)
+        """
+        Service operation: Reply with a pack of the history of a repository
+        not among the commits the client has.
+        """
+        name = str(content['name'])
+        logging.info('op_pull: ' + name)
+        have = [str(id) for id in content.get('commits', [])]
+        yield self._reply_pack(msg, name, have, content.get('include_object', False))
 
     @defer.inlineCallbacks
     def op_clone(self, content, headers, msg):
-        logging.info('op_clone: '+str(content)+ ', Remote Frontend:'+self.frontend)
-
-        # The following line shows how to reply to a message
-        yield self.reply_ok(msg)
+        """
+        Service operation: Reply with a pack of a whole repository.
+        """
+        name = str(content['name'])
+        logging.info('op_clone: ' + name)
+        yield self._reply_pack(msg, name, [], True)
 
+    @defer.inlineCallbacks
+    def _reply_pack(self, msg, name, have, include_object):
+        try:
+            packed = yield self.frontend.make_pack(name, have, include_object)
+        except (ObjectStoreError, cas.CAStoreError), e:
+            yield self.reply_err(msg, str(e))
+            return
+        logging.info('Packed %d objects of %s' % (packed['count'], name))
+        yield self.reply_ok(msg, packed)
 
 
 class DataStoreServiceClient(BaseServiceClient):
     """
-    This is an exemplar service client that calls the hello service. It
-    makes service calls RPC style.
+    Client pushing repositories of a local object store to the data store
+    service, and pulling or cloning them from it. Each operation moves all
+    objects in one pack message; the (compressed) pack goes as raw bytes,
+    which the msgpack message serializer carries without escaping.
     """
     def __init__(self, frontend, proc=None, **kwargs):
         """
         @brief Init method for the DataStore Frontend client
-        @param frontend - an instance of a CAStore Frontend
+        @param frontend - the local ObjectStore
         """
         if not 'targetname' in kwargs:
             kwargs['targetname'] = "DataStoreService"
@@ -83,69 +126,87 @@ class DataStoreServiceClient(BaseServiceClient):
         self.frontend=frontend
         logging.info('DataStoreServiceClient.__init__()')
 
+    @defer.inlineCallbacks
+    def _local_commits(self, repository_name):
+        chassis = self.frontend.objectChassis(self.frontend,
+                                self.frontend._keyspace(repository_name))
+        head = yield chassis.get_head()
+        commits, shallow = yield chassis.walk_commits([head])
+        defer.returnValue([id for id, commit in commits])
 
-#    @defer.inlineCallbacks
-    def slc_init(self):
-#        yield self.rdfs.init()
-        pass
+    def _check_reply(self, content):
+        if content.get('status') != 'OK':
+            raise ObjectStoreError(content.get('value'))
 
     @defer.inlineCallbacks
     def push(self, repository_name,permit_bracnch=False):
         """
         @brief Push the content of a local repository to the service data store
         @param repository_name - the name (key) of a repository in the local datastore
+        @retval number of objects sent
+        @note Steps: send the commits of the local history, receive the
+        ones the service lacks, send them with their trees and blobs in a
+        pack.
         """
         yield self._check_init()
-        logging.info('pushing: '+repository_name+ ', Local Frontend:'+self.frontend)
-        (content, headers, msg) = yield self.rpc_send('push', repository_name)
-
-        """
-        Steps:
-        Send the commit DAG to the service
-        Receive the Commits which need to be pushed
-        Send the commit trees
-        Receive OK
-        """
-
-        logging.info('Service reply: '+str(content))
-        defer.returnValue(str(content))
+        logging.info('pushing: ' + repository_name)
+        commits = yield self._local_commits(repository_name)
+        (content, headers, msg) = yield self.rpc_send('push',
+                    {'name':repository_name, 'commits':commits})
+        self._check_reply(content)
+        missing = set(content['missing'])
+        have = [id for id in commits if id not in missing]
+        packed = yield self.frontend.make_pack(repository_name, have,
+                                        include_object=not content['exists'])
+        (content, headers, msg) = yield self.rpc_send('push',
+                    {'name':repository_name,
+                     'pack':packed['pack'],
+                     'object':packed['object'],
+                     'head':packed['head'],
+                     'shallow':packed['shallow']})
+        self._check_reply(content)
+        logging.info('Pushed %d objects of %s' % (packed['count'], repository_name))
+        defer.returnValue(packed['count'])
 
     @defer.inlineCallbacks
     def pull(self, repository_name):
         """
         @brief Pull the latest changes from the remote datastore
         @param repository_name - the name (key) of a repository in the remote datastore
+        @retval number of objects received
+        @note Steps: send the commits of the local history, receive a pack
+        of the rest. A repository not in the local store is cloned.
         """
         yield self._check_init()
-        logging.info('pulling: '+repository_name+ ', Local Frontend:'+self.frontend)
-        """
-        Steps:
-        Send the current commit DAG to the service
-        Receive the Commits which need to be pulled
-        """
-
-        (content, headers, msg) = yield self.rpc_send('pull', repository_name)
-        logging.info('Service reply: '+str(content))
-        defer.returnValue(str(content))
-
+        logging.info('pulling: ' + repository_name)
+        if not (yield self.frontend.refs.get(repository_name)):
+            count = yield self.clone(repository_name)
+            defer.returnValue(count)
+        commits = yield self._local_commits(repository_name)
+        (content, headers, msg) = yield self.rpc_send('pull',
+                    {'name':repository_name, 'commits':commits})
+        count = yield self._receive(repository_name, content)
+        defer.returnValue(count)
 
     @defer.inlineCallbacks
     def clone(self, repository_name):
         """
         @brief Clone a repository to the local object store from the remote datastore
         @param repository_name - the name (key) of a repository in the remote datastore
+        @retval number of objects received
         """
         yield self._check_init()
-        logging.info('cloning: '+repository_name+ ', Local Frontend:'+self.frontend)
-        """
-        Steps:
-        Send the repo name
-        Receive the Commits which need to be pulled
-        """
-        (content, headers, msg) = yield self.rpc_send('clone', repository_name)
-        logging.info('Service reply: '+str(content))
-        defer.returnValue(str(content))
-
+        logging.info('cloning: ' + repository_name)
+        (content, headers, msg) = yield self.rpc_send('clone', {'name':repository_name})
+        count = yield self._receive(repository_name, content)
+        defer.returnValue(count)
+
+    def _receive(self, repository_name, content):
+        self._check_reply(content)
+        head = content['head'] and str(content['head'])
+        return self.frontend.receive_pack(repository_name,
+                    str(content['pack']), str(content['object']), head,
+                    shallow=[str(id) for id in content.get('shallow', [])])
 
 
 
@@ -7,12 +7,17 @@
 """
 
 
+import time
+import heapq
+from collections import OrderedDict
 import logging
 logging = logging.getLogger(__name__)
 
 from zope import interface
 
 from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.internet import task
 from twisted.python import reflect
 
 from ion.data import dataobject
@@ -20,6 +25,9 @@ from ion.data.datastore import cas
 
 NULL_CHR = '\x00'
 
+# Object types without references to other objects
+LEAF_TYPES = ('blob', 'uuid')
+
 class ObjectStoreError(Exception):
     """
     Base ObjectStore Exception
@@ -85,6 +93,19 @@ class IObjectStore(cas.ICAStore):
         objectChassis.
         """
 
+    def clone_many(names, baseClass):
+        """
+        @brief Clone many data objects, creating those which do not exist
+        yet with the structure of baseClass.
+        @retval defer.Deferred that succeeds with a list of objectChassis.
+        """
+
+    def commit_many(chassis):
+        """
+        @brief Commit the index of each of a list of objectChassis.
+        @retval defer.Deferred that succeeds with the list of commit ids.
+        """
+
     def update(obj):
         """
         @brief Update the reference/heads of an object
@@ -128,15 +149,52 @@ class Blob(cas.Blob):
         """
         return defer.succeed(self.content)
 
+class LazyBlob(dataobject.LazyValue):
+    """
+    @brief Placeholder for an attribute of a checked out object whose blob
+    was not read. Reads are asynchronous, so the blob is never read on
+    access: prefetch the attribute at checkout or read it with
+    ObjectChassis.load_fields first. Reading (or encoding) the attribute
+    before that raises ObjectStoreError, whatever the backend.
+    """
+    __slots__ = ('objstore', 'id', 'data')
+
+    def __init__(self, objstore, id):
+        self.objstore = objstore
+        self.id = id
+        self.data = None
+
+    @property
+    def encoded(self):
+        if self.data is None:
+            raise ObjectStoreError('Blob %s is not loaded; prefetch it at checkout or use load_fields' % cas.sha1_to_hex(self.id))
+        return self.data
+
 class Tree(cas.Tree):
 
     elementFactory = Element
 
-    def load(self, backend):
+    def load(self, backend, names=None):
         """
-        @brief Call load on all entities.
+        @brief Load the objects of all entities, reading the ones not yet
+        loaded with one get_many, and recurse into those.
+        @param names if given, load only the entities of these names
         """
-        return defer.DeferredList([child.load(backend) for child in self.children])
+        unloaded = [child for child in self.children if not child.obj]
+        if names is not None:
+            unloaded = [child for child in unloaded if child[0] in names]
+        if not unloaded:
+            return defer.succeed(None)
+
+        def cb(objs):
+            for child, obj in zip(unloaded, objs):
+                child.obj = obj
+            return defer.DeferredList([obj.load(backend) for obj in objs],
+                                        fireOnOneErrback=True)
+
+        d = backend.get_many([child[1] for child in unloaded])
+        d.addCallback(cb)
+        return d
 
     def x__getitem__(self, name):
         """
@@ -174,6 +232,191 @@ class ObjectStoreObject(Tree):
     type = 'object' # or 'entity'?
 
 
+class CommitGraph(object):
+    """
+    @brief Index of the commit history of one object: the parents,
+    generation number and timestamp of each commit. The generation of a
+    root commit is 1, of any other commit one more than the largest of its
+    parents, so a commit never descends from one of a greater or equal
+    generation. ObjectChassis keeps it up to date at commit time and
+    stores each commit's entry in the key 'graph.<entry key>', so a commit
+    writes one key and history and ancestry queries take one prefix query
+    instead of one read per commit.
+    """
+
+    def __init__(self, entries=None):
+        """
+        @param entries dict of commit id:(parents, generation, timestamp)
+        """
+        self.entries = entries or {}
+
+    @classmethod
+    def decode(cls, keys):
+        """
+        @param keys list of entry keys (see entry_key)
+        """
+        entries = {}
+        for key in keys:
+            id, gen, parents, ts = str(key).split('.', 3)
+            entries[id] = (parents and parents.split(',') or [], int(gen),
+                            ts and float(ts) or None)
+        return cls(entries)
+
+    def entry_key(self, id):
+        """
+        @brief The entry of commit id as "id.generation.parents.timestamp",
+        the parents comma separated and the timestamp empty if not known.
+        """
+        parents, gen, ts = self.entries[id]
+        if ts is None:
+            ts = ''
+        else:
+            ts = repr(ts)
+        return '%s.%d.%s.%s' % (id, gen, ','.join(parents), ts)
+
+    def entry_keys(self, ids=None):
+        """
+        @retval list of the entry keys of ids (default all commits)
+        """
+        if ids is None:
+            ids = self.entries.keys()
+        return [self.entry_key(id) for id in ids]
+
+    def __contains__(self, id):
+        return id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, id, parents, timestamp=None):
+        """
+        @brief Add a commit whose parents are all in the graph.
+        @param timestamp when the commit was made (None if not known)
+        """
+        entries = self.entries
+        gen = max([entries[p][1] for p in parents] or [0]) + 1
+        entries[id] = (list(parents), gen, timestamp)
+
+    def add_commits(self, commits):
+        """
+        @brief Add commits in any order, each one's parents being in the
+        graph or in commits.
+        @param commits list of (id, parents, timestamp)
+        """
+        pending = dict((id, (parents, ts)) for id, parents, ts in commits
+                        if id not in self.entries)
+        for id in pending.keys():
+            stack = [id]
+            while stack:
+                top = stack[-1]
+                if top in self.entries:
+                    stack.pop()
+                    continue
+                parents, ts = pending[top]
+                missing = [p for p in parents if p not in self.entries]
+                if missing:
+                    stack.extend(missing)
+                else:
+                    self.add(stack.pop(), parents, ts)
+
+    def parents(self, id):
+        return self.entries[id][0]
+
+    def generation(self, id):
+        return self.entries[id][1]
+
+    def timestamp(self, id):
+        return self.entries[id][2]
+
+    def history(self, head):
+        """
+        @retval list of commit ids from head following first parents, head
+        first.
+        """
+        ids = []
+        while head:
+            ids.append(head)
+            parents = self.entries[head][0]
+            head = parents and parents[0]
+        return ids
+
+    def _walk(self, head, min_gen=0):
+        """
+        @brief Commits reachable from head with a generation of at least
+        min_gen, greatest generation first.
+        """
+        entries = self.entries
+        seen = set([head])
+        heap = [(-entries[head][1], head)]
+        while heap:
+            neg_gen, id = heapq.heappop(heap)
+            yield id
+            for p in entries[id][0]:
+                if p not in seen and entries[p][1] >= min_gen:
+                    seen.add(p)
+                    heapq.heappush(heap, (-entries[p][1], p))
+
+    def recent(self, heads, count):
+        """
+        @retval list of the count commits of greatest generation reachable
+        from heads, greatest first.
+        """
+        entries = self.entries
+        seen = set(heads)
+        heap = [(-entries[id][1], id) for id in seen]
+        heapq.heapify(heap)
+        ids = []
+        while heap and len(ids) < count:
+            neg_gen, id = heapq.heappop(heap)
+            ids.append(id)
+            for p in entries[id][0]:
+                if p not in seen:
+                    seen.add(p)
+                    heapq.heappush(heap, (-entries[p][1], p))
+        return ids
+
+    def prune(self, keep):
+        """
+        @retval new CommitGraph of only the commits in keep; parents not
+        kept are dropped, so the oldest kept commits become roots.
+        """
+        keep = set(keep)
+        return CommitGraph(dict((id, ([p for p in parents if p in keep], gen, ts))
+                            for id, (parents, gen, ts) in self.entries.iteritems()
+                            if id in keep))
+
+    def ancestors(self, id):
+        """
+        @retval set of commit ids reachable from id, including id.
+        """
+        return set(self._walk(id))
+
+    def is_ancestor(self, a, b):
+        """
+        @retval True if commit a is b or reachable from b. Commits of
+        generations lower than a's are not walked.
+        """
+        if a == b:
+            return True
+        gen = self.entries[a][1]
+        if gen >= self.entries[b][1]:
+            return False
+        for id in self._walk(b, gen):
+            if id == a:
+                return True
+        return False
+
+    def merge_base(self, a, b):
+        """
+        @retval the common ancestor of commits a and b with the greatest
+        generation, or None if their histories are disjoint.
+        """
+        ancestors = self.ancestors(a)
+        for id in self._walk(b):
+            if id in ancestors:
+                return id
+        return None
+
 class ObjectChassis(object):
     """
     This establishes a context for accessing/modifying/committing an
@@ -184,8 +427,10 @@ class ObjectChassis(object):
 
     objectClass = dataobject.DataObject
 
-    def __init__(self, objstore, keyspace, objectClass=None):
+    def __init__(self, objstore, keyspace, objectClass=None, name=None):
         """
+        @param name of the object in objstore; commits of a named chassis
+        update the attribute indexes of objstore.
         @note
         objstore vs. objs
         objstore implements ICAStore; objs is just the raw key/value
@@ -197,11 +442,15 @@ class ObjectChassis(object):
         """
         self.objstore = objstore
         self.keyspace = keyspace
+        self.name = name
         if objectClass:
             #self.objectClass = objectClass
             pass
         self.index = None
         self.cur_commit = None
+        # cur_commit is known to be the head (see ObjectStore._head_trees)
+        self.at_head = False
+        self.graph = None
 
     def update_head(self, commit_id, head='master'):
         """
@@ -225,8 +474,11 @@ class ObjectChassis(object):
         return self.keyspace.get('refs.' + name)
 
     @defer.inlineCallbacks
-    def checkout(self, head='master', commit_id=None):
+    def checkout(self, head='master', commit_id=None, prefetch=None):
         """
+        @param prefetch names of the attributes to read at checkout; the
+        others are read with load_fields (see LazyBlob). By default all
+        attributes are read.
         """
         if commit_id:
             ref = commit_id
@@ -235,28 +487,111 @@ class ObjectChassis(object):
         if ref:
             commit = yield self.objstore.get(ref)
             tree = yield self.objstore.get(commit.tree)
-            yield tree.load(self.objstore)
-            obj_parts = [(child[0], child.obj.content) for child in tree.children]
-            #self.index = self.objectClass.decode(self.objectClassName, obj_parts)()
-            self.index = self.objectClass.decode(obj_parts)
+            if prefetch is None:
+                # all attribute blobs are read with one get_many
+                yield tree.load(self.objstore)
+            else:
+                yield tree.load(self.objstore, set(prefetch) | set(['Object_Type']))
+                clsname = tree['Object_Type'].content
+                slots = dataobject.lookup_type(clsname, self.objectClass._types).get_codec().slots
+                untyped = [child[0] for child in tree.children
+                            if not child.obj and child[0] not in slots]
+                if untyped:
+                    yield tree.load(self.objstore, untyped)
+            self.checkout_tree(tree, ref)
         else:
             self.index = self.objectClass()
-        self.cur_commit = ref
+            self.cur_commit = ref
+        self.at_head = not commit_id
         defer.returnValue(self.index)
 
+    def checkout_tree(self, tree, commit_id):
+        """
+        @brief Check out commit_id from its (read) attribute tree; blobs of
+        the tree which were not read are left to load_fields.
+        @retval the index
+        """
+        obj_parts = [(child[0], child.obj.content if child.obj
+                        else LazyBlob(self.objstore, child[1]))
+                        for child in tree.children]
+        #self.index = self.objectClass.decode(self.objectClassName, obj_parts)()
+        self.index = self.objectClass.decode(obj_parts)
+        self.index.track_changes((self._store_key(), tree))
+        self.cur_commit = commit_id
+        self.at_head = False
+        return self.index
+
+    def load_fields(self, names=None):
+        """
+        @brief Read the attributes of the index which were not read at
+        checkout (see BaseObjectStore.load_fields).
+        @retval defer.Deferred that fires with the index
+        """
+        return self.objstore.load_fields(self.index, names)
+
     @defer.inlineCallbacks
     def write_tree(self):
         """
         write current index
+        @note If the index tracks changes against the tree it was checked
+        out from, only the attributes set since (and the mutable ones) are
+        encoded; other entries of that tree are reused, and blobs it
+        already holds are not written again.
+        """
+        new_objs, tree = self._tree_objects()
+        # The changed blobs and the tree go to the backend in one write
+        ids = yield self.objstore.put_many(new_objs)
+        tree_id = ids[-1]
+        self.index.track_changes((self._store_key(), tree))
+        defer.returnValue(tree_id)
+
+    def _tree_objects(self):
         """
-        obs = self.index.encode()
-        blobs = [(name, Blob(val)) for name, val in obs]
-        for n, b in blobs:
-            yield self.objstore.put(b)
-        childs = [Element(name, blob) for name, blob in blobs]
+        @brief The attribute tree of the index and the objects of it to
+        write (see write_tree).
+        @retval (list of new blobs followed by the tree, tree)
+        """
+        changes = self.index.get_changes()
+        if changes is None or changes.base is None or not self._in_store(changes.base[0]):
+            # No base tree in this store to reuse entries from
+            obs = self.index.encode()
+            previous = {}
+        else:
+            previous = changes.base[1]._names
+            obs = [('Object_Type', type(self.index).__name__)]
+            obs.extend(self.index.get_codec().encode_changes(self.index, changes, previous))
+        childs = []
+        new_objs = []
+        for name, val in obs:
+            prev = previous.get(name)
+            if val is None:
+                childs.append(prev)
+                continue
+            blob = Blob(val)
+            child = Element(name, blob)
+            if prev is None or prev[1] != child[1]:
+                new_objs.append(blob)
+            childs.append(child)
         tree = Tree(*childs)
-        tree_id = yield self.objstore.put(tree)
-        defer.returnValue(tree_id)
+        new_objs.append(tree)
+        return new_objs, tree
+
+    def _store_key(self):
+        """
+        @brief Identifies the content store trees are written to; a tree can
+        only be diffed against in the store that holds its blobs.
+        @note Holds the backend itself, not its id(), which a backend
+        created after this one is collected can reuse; see _in_store.
+        """
+        return (self.objstore.backend, self.objstore.namespace)
+
+    def _in_store(self, key):
+        """
+        @retval True if key (from _store_key) is of the store of this
+        chassis; backends are compared by identity.
+        """
+        backend, namespace = key
+        return backend is self.objstore.backend and namespace == self.objstore.namespace
 
     def write_blob(self, val):
         return self.objstore.put(Blob(val))
@@ -277,33 +612,140 @@ class ObjectChassis(object):
     @defer.inlineCallbacks
     def commit(self, working_tree=None):
         """
-        """
-        id = yield self.write_tree()
+        @brief Commit the index on top of the current commit, record it in
+        the commit graph and move the head (and the current commit) to it.
+        The changed blobs, the tree and the commit are written with one
+        multi-put, the commit graph entry and the head with another.
+        @note The attribute index entries of the new tree are written
+        before the head moves and those of the tree it replaces removed
+        after, so the indexes never miss the head of an object. Nothing is
+        read or written for them if no indexed attribute changed.
+        """
+        indexed = self.name and self.objstore.indexed_attributes
+        if indexed:
+            old_tree = (yield self.objstore._head_trees([self]))[0]
+        new_objs, tree = self._tree_objects()
         if self.cur_commit:
             parents = [self.cur_commit]
         else:
             parents = []
-        commit = Commit(id, parents)
-        commit_id = yield self.objstore.put(commit)
-        yield self.update_head(commit_id)
+        new_objs.append(Commit(cas.sha1_to_hex(tree.digest()), parents))
+        ids = yield self.objstore.put_many(new_objs)
+        commit_id = ids[-1]
+        self.index.track_changes((self._store_key(), tree))
+        if indexed:
+            added, removed = self.objstore.index_changes(self.name, old_tree, tree)
+            if added:
+                yield self.objstore.indexes.put_many(added)
+        graph = yield self._parent_graph(parents)
+        graph.add(commit_id, parents, time.time())
+        self.graph = graph
+        yield self.keyspace.put_many([('graph.' + graph.entry_key(commit_id), commit_id),
+                                        ('refs.master', commit_id)])
+        if indexed and removed:
+            yield self.objstore.indexes.remove_many(removed)
+        self.cur_commit = commit_id
+        self.at_head = True
         defer.returnValue(commit_id)
 
+    @defer.inlineCallbacks
+    def _parent_graph(self, parents):
+        """
+        @brief A commit graph holding parents, to add a commit on top of
+        them: the one read before, else only the entries of parents (one
+        prefix query each), else (a parent has no entry) the whole graph.
+        @retval defer.Deferred that fires with a CommitGraph
+        """
+        graph = self.graph
+        if graph is not None and not [p for p in parents if p not in graph]:
+            defer.returnValue(graph)
+        keys = []
+        for p in parents:
+            found = yield self.keyspace.query_prefix('graph.%s.' % p, '(.*)$')
+            keys.extend(['%s.%s' % (p, key) for key in found])
+        graph = CommitGraph.decode(keys)
+        if len(graph) < len(parents):
+            graph = yield self.get_graph(parents)
+        defer.returnValue(graph)
+
+    @defer.inlineCallbacks
+    def get_graph(self, heads=None):
+        """
+        @brief Read the commit graph of this object.
+        @param heads commit ids that must be in the graph; commits made
+        before the graph existed (or received without it) are read from the
+        store and added. Default is the head.
+        @retval defer.Deferred that fires with a CommitGraph
+        """
+        keys = yield self.keyspace.query_prefix('graph.', '(.*)$')
+        graph = CommitGraph.decode(keys)
+        if heads is None:
+            heads = [(yield self.get_head())]
+        missing = [id for id in heads if id and id not in graph]
+        if missing:
+            commits, shallow = yield self.walk_commits(missing, stop=graph.entries)
+            graph.add_commits([(id, [] if id in shallow else c.parents, None)
+                                for id, c in commits])
+            yield self.keyspace.put_many([('graph.' + graph.entry_key(id), id)
+                                            for id, c in commits])
+        self.graph = graph
+        defer.returnValue(graph)
+
+    @defer.inlineCallbacks
+    def get_shallow(self):
+        """
+        @brief Ids of the commits of this object whose parents were removed
+        by a garbage collection (see ObjectStore.collect_garbage); the
+        history ends at them.
+        @retval defer.Deferred that fires with a set of commit ids
+        """
+        ids = yield self.keyspace.query_prefix('shallow.', '(.*)$')
+        defer.returnValue(set(ids))
+
+    @defer.inlineCallbacks
+    def walk_commits(self, heads, stop=()):
+        """
+        @brief Walk the history of this object from heads, as
+        CAStore.walk_commits does, not past its shallow commits.
+        @retval defer.Deferred that fires with (list of (id, Commit), set of
+        shallow commit ids)
+        """
+        shallow = yield self.get_shallow()
+        commits = yield self.objstore.walk_commits(heads, stop, shallow)
+        defer.returnValue((commits, shallow))
+
     @defer.inlineCallbacks
     def get_commit_history(self):
-        commits = []
+        """
+        @retval defer.Deferred that fires with the list of commits from the
+        head following first parents, head first. The ids come from the
+        commit graph; the commits are read with one get_many.
+        """
         id = yield self.get_head()
         if not id:
             defer.returnValue([])
-        while True:
-            c = yield self.objstore.get(id)
-            commits.append(c)
-            if c.parents:
-                # ignore multiples...
-                id = c.parents[0]
-                continue
-            break
+        graph = yield self.get_graph([id])
+        commits = yield self.objstore.get_many(graph.history(id))
         defer.returnValue(commits)
 
+    @defer.inlineCallbacks
+    def is_ancestor(self, a, b):
+        """
+        @retval defer.Deferred that fires with True if commit a is b or an
+        ancestor of b.
+        """
+        graph = yield self.get_graph([a, b])
+        defer.returnValue(graph.is_ancestor(a, b))
+
+    @defer.inlineCallbacks
+    def merge_base(self, a, b):
+        """
+        @retval defer.Deferred that fires with the nearest common ancestor
+        of commits a and b, or None.
+        """
+        graph = yield self.get_graph([a, b])
+        defer.returnValue(graph.merge_base(a, b))
+
 class BaseObjectStore(cas.CAStore):
     """
     @brief Interactive interface to an Object Store instance (who's raw
@@ -323,29 +765,33 @@ class BaseObjectStore(cas.CAStore):
             ObjectStoreObject.type:ObjectStoreObject,
             }
 
-    def __init__(self, backend, partition=''):
+    def __init__(self, backend, partition='', **kwargs):
         """
         @param backend instance providing ion.data.store.IStore interface.
         @param partition Logical name spacing in an otherwise flat
         key/value space.
+        @param kwargs options of the content store (compression, cache
+        sizes); see cas.CAStore
         @note Design decision on qualifying/naming a store name space (like
         a git repository tree)
         """
-        cas.CAStore.__init__(self, backend, partition)
+        cas.CAStore.__init__(self, backend, partition, **kwargs)
         self.partition = partition
         self.storemeta = cas.StoreContextWrapper(backend, partition + '.meta.')
         self.refs = cas.StoreContextWrapper(backend, partition + '.refs:')
+        self.indexes = cas.StoreContextWrapper(backend, partition + '.index:')
         self.type = reflect.fullyQualifiedName(self.__class__)
 
     @classmethod
-    def new(cls, backend, name):
+    def new(cls, backend, name, **kwargs):
         """
         @brief Initialize an Object Store in the backend.  
         This is a major operation, like formating a blank hard drive; In
         general, this only needs to be done once to a backend.
+        @param kwargs options of the content store; see __init__
         @retval A Deferred that succeeds with a new instance.
         """
-        inst = cls(backend, name)
+        inst = cls(backend, name, **kwargs)
         d = inst._store_exists()
 
         def _succeed(result):
@@ -362,13 +808,14 @@ class BaseObjectStore(cas.CAStore):
         return d
 
     @classmethod
-    def load(cls, backend, name):
+    def load(cls, backend, name, **kwargs):
         """
         @brief Connect to an existing object store namespace that lives
         inthe given backend.
+        @param kwargs options of the content store; see __init__
         @retval A Deferred that succeeds with an instance of ObjectStore
         """
-        inst = cls(backend, name)
+        inst = cls(backend, name, **kwargs)
         d = inst._store_exists()
 
         def _succeed(result):
@@ -422,6 +869,9 @@ class ObjectStore(BaseObjectStore):
 
     objectChassis = ObjectChassis
 
+    # Attributes whose values are indexed (see find_indexed)
+    indexed_attributes = ()
+
     @defer.inlineCallbacks
     def create(self, name, objectClass):
         """
@@ -438,6 +888,133 @@ class ObjectStore(BaseObjectStore):
         else:
             raise ObjectStoreError('Error creating %s object %s' % (objectClass.__name__, name,))
 
+    @defer.inlineCallbacks
+    def load_fields(self, obj, names=None):
+        """
+        @brief Read the blobs of the attributes of a checked out object
+        which were not read at checkout, with one get_many.
+        @param obj DataObject returned by ObjectChassis.checkout
+        @param names of the attributes to load; all by default
+        @retval defer.Deferred that fires with obj
+        """
+        slots = obj.get_codec().slots
+        lazy = []
+        for name in (names or obj.attributes):
+            slot = slots.get(name)
+            value = getattr(obj, slot, None) if slot else None
+            if isinstance(value, LazyBlob) and value.data is None:
+                lazy.append((slot, value))
+        if lazy:
+            blobs = yield self.get_many([value.id for slot, value in lazy])
+            for (slot, value), blob in zip(lazy, blobs):
+                value.data = blob.content
+                value.load(obj, slot)
+        defer.returnValue(obj)
+
+    def _index_key(self, att, blob_id, name=''):
+        """
+        @brief Key of the index entry of object name for the value of
+        attribute att held in blob blob_id (binary sha1).
+        """
+        return '%s.%s.%s' % (att, cas.sha1_to_hex(blob_id), name)
+
+    def index_changes(self, name, old_tree, new_tree):
+        """
+        @brief Index entries to write and to remove when object name moves
+        from the attribute tree old_tree (None for a new object) to new_tree.
+        @retval (list of (key, name) to put, list of keys to remove)
+        """
+        added = []
+        removed = []
+        for att in self.indexed_attributes:
+            old = old_tree and old_tree._names.get(att)
+            new = new_tree._names.get(att)
+            old_id = old and old[1]
+            new_id = new and new[1]
+            if old_id == new_id:
+                continue
+            if old_id:
+                removed.append(self._index_key(att, old_id, name))
+            if new_id:
+                added.append((self._index_key(att, new_id, name), name))
+        return added, removed
+
+    @defer.inlineCallbacks
+    def find_indexed(self, obj, names):
+        """
+        @brief Names of the objects whose attributes names hold the same
+        values as in obj, from the attribute indexes (one prefix query per
+        attribute, so in the number of matches).
+        @param names indexed attributes of obj to match
+        @retval defer.Deferred that fires with a set of object names
+        @note Values are compared by their encoding; the entries of an
+        object can be ahead of its head, so check the objects found.
+        """
+        codec = obj.get_codec()
+        found = None
+        for att in names:
+            matches = yield self.find_value(att, codec.encode_field(obj, att))
+            if found is None:
+                found = set(matches)
+            else:
+                found.intersection_update(matches)
+            if not found:
+                break
+        defer.returnValue(found or set())
+
+    @defer.inlineCallbacks
+    def find_value(self, att, encoded):
+        """
+        @brief Names of the objects whose attribute att is encoded as encoded
+        ("type\x00value"), from the attribute index.
+        @retval defer.Deferred that fires with a list of object names
+        """
+        yield self.check_indexes()
+        key = self._index_key(att, cas.sha1(Blob(encoded)))
+        names = yield self.indexes.query_prefix(key, '(.*)$')
+        defer.returnValue(names)
+
+    @defer.inlineCallbacks
+    def check_indexes(self):
+        """
+        @brief Rebuild the attribute indexes if the store meta does not
+        record them as covering indexed_attributes, as with objects
+        committed before the attributes were indexed.
+        """
+        if getattr(self, '_indexes_checked', False):
+            return
+        expected = ','.join(self.indexed_attributes)
+        current = yield self.storemeta.get('indexed')
+        if current != expected:
+            yield self.rebuild_indexes()
+            yield self.storemeta.put('indexed', expected)
+        self._indexes_checked = True
+
+    @defer.inlineCallbacks
+    def rebuild_indexes(self):
+        """
+        @brief Drop the attribute indexes and index the master head of every
+        object again.
+        """
+        keys = yield self.indexes.query('(.*)$')
+        if keys:
+            yield self.indexes.remove_many(keys)
+        names, heads, shallow = yield self._list_heads()
+        head_keys = [name + '.refs.master' for name in names
+                        if name + '.refs.master' in heads.get(name, [])]
+        head_ids = yield self.refs.get_many(head_keys)
+        head_ids = [id for id in head_ids if id]
+        added = []
+        if head_ids:
+            commits = yield self.get_many(head_ids)
+            trees = yield self.get_many([commit.tree for commit in commits])
+            for key, tree in zip(head_keys, trees):
+                name = key[:-len('.refs.master')]
+                added.extend(self.index_changes(name, None, tree)[0])
+        if added:
+            yield self.indexes.put_many(added)
+        logging.info('rebuild_indexes: %d objects, %d entries' % (len(head_ids), len(added)))
+
     @defer.inlineCallbacks
     def _dump_object_class(self, objectClass):
         """
@@ -445,11 +1022,9 @@ class ObjectStore(BaseObjectStore):
         """
         obs = objectClass().encode(header=False)
         blobs = [(name, Blob(val)) for name, val in obs]
-        for n, b in blobs:
-            yield self.put(b)
         childs = [Element(name, blob) for name, blob in blobs]
         tree = Tree(*childs)
-        tree_id = yield self.put(tree)
+        yield self.put_many([b for n, b in blobs] + [tree])
         defer.returnValue(tree)
 
     def _load_object_class(self, obj):
@@ -467,20 +1042,33 @@ class ObjectStore(BaseObjectStore):
         The structure of the data object needs to be stored as
         castore/objstore objects some how...
         """
-        uuid_obj = UUID(name)
-        id = yield self.put(uuid_obj)
+        obj_ids = yield self._create_objects([name], objectClass)
+        defer.returnValue(obj_ids[0])
+
+    @defer.inlineCallbacks
+    def _create_objects(self, names, objectClass):
+        """
+        @brief Create the objects names of objectClass; the class and
+        attribute structure they share is written once, their uuids and
+        object trees with one put_many, their refs with another.
+        @retval defer.Deferred that fires with the list of object ids
+        """
         #obj_class = reflect.fullyQualifiedName(objectClass)
         obj_class = objectClass.__name__
         obj_class_obj = Blob(obj_class)
-        yield self.put(obj_class_obj)
         attrs = yield self._dump_object_class(objectClass)
-        obj_tree = ObjectStoreObject(('name', uuid_obj), 
-                                    ('class', obj_class_obj),
-                                    ('attrs', attrs))
-        obj_id = yield self.put(obj_tree)
+        objs = [obj_class_obj]
+        for name in names:
+            uuid_obj = UUID(name)
+            obj_tree = ObjectStoreObject(('name', uuid_obj), 
+                                        ('class', obj_class_obj),
+                                        ('attrs', attrs))
+            objs.extend([uuid_obj, obj_tree])
+        ids = yield self.put_many(objs)
+        obj_ids = ids[2::2]
         #yield self.objs.put(name, obj_id)
-        yield self.refs.put(name, obj_id)
-        defer.returnValue(obj_id)
+        yield self.refs.put_many(zip(names, obj_ids))
+        defer.returnValue(obj_ids)
 
 
     @defer.inlineCallbacks
@@ -496,10 +1084,15 @@ class ObjectStore(BaseObjectStore):
         yield obj_obj.load(self)
         objectClass = self._load_object_class(obj_obj)
         #keyspace = cas.StoreContextWrapper(self.backend, self.partition + '.' + id + ':')
-        keyspace = cas.StoreContextWrapper(self.refs, name + '.')
-        obj = self.objectChassis(self, keyspace, objectClass)
+        obj = self.objectChassis(self, self._keyspace(name), objectClass, name)
         defer.returnValue(obj)
 
+    def _keyspace(self, name):
+        """
+        @brief Namespace of the refs of object name.
+        """
+        return cas.StoreContextWrapper(self.refs, name + '.')
+
     @defer.inlineCallbacks
     def _object_exists(self, name):
         """
@@ -534,6 +1127,413 @@ class ObjectStore(BaseObjectStore):
             obj = yield self._build_object(name)
             defer.returnValue(obj)
 
+    @defer.inlineCallbacks
+    def clone_many(self, names, objectClass):
+        """
+        @brief Clone each of the objects names, first creating (with the
+        structure of objectClass) those which do not exist yet; see create
+        and clone. The existence checks, creations and head reads are each
+        one batched backend operation.
+        @retval defer.Deferred that fires with the list of ObjectChassis,
+        with the head of each object as its current commit. They are not
+        checked out; set the index to commit a new state (see commit_many).
+        """
+        obj_ids = yield self.refs.get_many(names)
+        missing = []
+        for name, obj_id in zip(names, obj_ids):
+            if not obj_id and name not in missing:
+                missing.append(name)
+        if missing:
+            yield self._create_objects(missing, objectClass)
+        heads = yield self.refs.get_many([name + '.refs.master' for name in names])
+        chassis = []
+        for name, head in zip(names, heads):
+            obj = self.objectChassis(self, self._keyspace(name), objectClass, name)
+            obj.cur_commit = head
+            obj.at_head = True
+            chassis.append(obj)
+        defer.returnValue(chassis)
+
+    @defer.inlineCallbacks
+    def commit_many(self, chassis):
+        """
+        @brief Commit the index of each of chassis on top of its current
+        commit, as ObjectChassis.commit does, with the backend operations
+        batched: one write for the new blobs, trees and commits of all of
+        them (a blob several trees hold is written once), one for the
+        commit graph entries and heads.
+        @param chassis list of ObjectChassis of this store, of distinct
+        named objects
+        @retval defer.Deferred that fires with the list of commit ids
+        @note As with commit, the attribute index entries of the new trees
+        are written before the heads move and the replaced ones removed
+        after.
+        """
+        names = [obj.name for obj in chassis]
+        old_trees = [None] * len(chassis)
+        if self.indexed_attributes:
+            old_trees = yield self._head_trees(chassis)
+
+        new_objs = OrderedDict()
+        trees = []
+        parents = []
+        commit_ids = []
+        for obj in chassis:
+            objs, tree = obj._tree_objects()
+            parents.append([obj.cur_commit] if obj.cur_commit else [])
+            objs.append(Commit(cas.sha1_to_hex(tree.digest()), parents[-1]))
+            for o in objs:
+                new_objs.setdefault(o.digest(), o)
+            trees.append(tree)
+            commit_ids.append(cas.sha1_to_hex(objs[-1].digest()))
+        yield self.put_many(new_objs.values())
+        for obj, tree in zip(chassis, trees):
+            obj.index.track_changes((obj._store_key(), tree))
+
+        graphs = []
+        for obj, commit_parents in zip(chassis, parents):
+            graphs.append((yield obj._parent_graph(commit_parents)))
+
+        now = time.time()
+        refs = []
+        added = []
+        removed = []
+        for i, obj in enumerate(chassis):
+            graph = graphs[i]
+            graph.add(commit_ids[i], parents[i], now)
+            obj.graph = graph
+            refs.append((names[i] + '.graph.' + graph.entry_key(commit_ids[i]),
+                            commit_ids[i]))
+            refs.append((names[i] + '.refs.master', commit_ids[i]))
+            if self.indexed_attributes:
+                add, remove = self.index_changes(names[i], old_trees[i], trees[i])
+                added.extend(add)
+                removed.extend(remove)
+        if added:
+            yield self.indexes.put_many(added)
+        yield self.refs.put_many(refs)
+        if removed:
+            yield self.indexes.remove_many(removed)
+        for obj, commit_id in zip(chassis, commit_ids):
+            obj.cur_commit = commit_id
+            obj.at_head = True
+        defer.returnValue(commit_ids)
+
+    @defer.inlineCallbacks
+    def _head_trees(self, chassis):
+        """
+        @brief The attribute trees of the heads of chassis, which the
+        attribute index entries of their objects are of (see commit_many).
+        The head of a chassis whose current commit is the head is not read
+        again, and the tree its index tracks changes against is used if it
+        is the head's; commits read at checkout are in the cache.
+        @retval defer.Deferred that fires with the list of trees, None for
+        an object without commits
+        """
+        unknown = [obj.name for obj in chassis if not obj.at_head]
+        heads = {}
+        if unknown:
+            ids = yield self.refs.get_many([name + '.refs.master' for name in unknown])
+            heads = dict(zip(unknown, ids))
+        head_ids = [obj.cur_commit if obj.at_head else heads[obj.name]
+                    for obj in chassis]
+        stored = [id for id in head_ids if id]
+        commits = {}
+        if stored:
+            commits = dict(zip(stored, (yield self.get_many(stored))))
+        trees = [None] * len(chassis)
+        unread = []
+        for i, (obj, head) in enumerate(zip(chassis, head_ids)):
+            if not head:
+                continue
+            tree_id = commits[head].tree
+            changes = obj.index.get_changes()
+            if (changes is not None and changes.base is not None and
+                    obj._in_store(changes.base[0]) and
+                    cas.sha1_to_hex(changes.base[1].digest()) == tree_id):
+                trees[i] = changes.base[1]
+            else:
+                unread.append(i)
+        if unread:
+            read = yield self.get_many([commits[head_ids[i]].tree for i in unread])
+            for i, tree in zip(unread, read):
+                trees[i] = tree
+        defer.returnValue(trees)
+
+    @defer.inlineCallbacks
+    def make_pack(self, name, have=(), include_object=False, head='master'):
+        """
+        @brief Pack the part of the history of object name that a store
+        holding the commits in have lacks, for transfer to that store.
+        @param have ids of commits the receiving store holds. Trees and
+        blobs of the ones the new history starts from are not packed.
+        @param include_object pack the object's own structure (uuid, class
+        and attributes) too, for a store which does not have the object.
+        @retval defer.Deferred that fires with a dict: pack (see
+        cas.encode_pack), object (id of the object store object), head
+        (commit id of the head), count (number of objects packed), shallow
+        (ids of the packed commits whose parents are not stored here).
+        """
+        obj_id = yield self.refs.get(name)
+        if not obj_id:
+            raise ObjectStoreError('Object %s does not exist' % name)
+        chassis = self.objectChassis(self, self._keyspace(name))
+        head_id = yield chassis.get_head(head)
+        commits, shallow = yield chassis.walk_commits([head_id], stop=have)
+        new_ids = [id for id, commit in commits]
+        cut = [id for id in new_ids if id in shallow]
+        boundary = set([p for id, commit in commits if id not in shallow
+                        for p in commit.parents])
+        boundary.difference_update(new_ids)
+        old_objs = yield self.walk_objects(boundary)
+        if include_object:
+            new_ids.append(obj_id)
+        objs = yield self.walk_objects(new_ids, exclude=[id for id, obj in old_objs])
+        pack = cas.encode_pack([obj for id, obj in objs])
+        defer.returnValue({'pack':pack, 'object':obj_id, 'head':head_id,
+                            'count':len(objs), 'shallow':cut})
+
+    @defer.inlineCallbacks
+    def receive_pack(self, name, pack, obj_id, head_id, head='master', shallow=()):
+        """
+        @brief Store the objects of a pack made by make_pack and move the
+        head of object name to head_id. The object is created if it does
+        not exist here yet.
+        @param shallow ids of packed commits whose parents the sender does
+        not hold (the shallow of make_pack); they are marked shallow here.
+        @note Only fast forwards are accepted: head_id must descend from
+        the current head. Nothing is stored for a rejected pack. A head_id
+        the current head already descends from (the history here is ahead)
+        changes nothing.
+        @retval defer.Deferred that fires with the number of objects
+        stored.
+        """
+        try:
+            objs = self.read_pack(pack)
+        except cas.CAStoreError, e:
+            raise ObjectStoreError('Bad pack for %s: %s' % (name, e))
+        packed = dict([(cas.sha1_to_hex(obj.digest()), obj) for obj in objs])
+        current_obj = yield self.refs.get(name)
+        if not current_obj:
+            if obj_id not in packed and not (yield self._obj_exists(obj_id)):
+                raise ObjectStoreError('Structure of object %s missing from pack' % name)
+        elif current_obj != obj_id:
+            raise ObjectStoreError('Object %s has a different structure here' % name)
+        chassis = self.objectChassis(self, self._keyspace(name))
+        current = yield chassis.get_head(head)
+        cut = [id for id in shallow if id in packed]
+        if head_id and current and head_id != current:
+            graph = yield chassis.get_graph([current])
+            if head_id in graph.ancestors(current):
+                defer.returnValue(0)
+            stored_cut = yield chassis.get_shallow()
+            if not (yield self._descends(head_id, current, packed, stored_cut.union(cut))):
+                raise ObjectStoreError('Head of %s is not a fast forward of %s' % (name, current))
+        if cut:
+            yield chassis.keyspace.put_many([('shallow.' + id, id) for id in cut])
+        ids = yield self.put_many(objs)
+        if not current_obj:
+            yield self.refs.put(name, obj_id)
+        if head_id and head_id != current:
+            yield chassis.update_head(head_id, head)
+        defer.returnValue(len(ids))
+
+    @defer.inlineCallbacks
+    def _descends(self, id, ancestor, packed, shallow=()):
+        """
+        @brief Walk the parents of commit id, a generation at a time, for
+        commit ancestor.
+        @param packed dict of id:Commit of commits not stored yet
+        @param shallow ids of commits not to walk past
+        @retval defer.Deferred that fires with True if ancestor is
+        reachable from id
+        """
+        seen = set()
+        ids = [id]
+        while ids:
+            if ancestor in ids:
+                defer.returnValue(True)
+            seen.update(ids)
+            commits = dict([(i, packed[i]) for i in ids if i in packed])
+            stored = [i for i in ids if i not in packed]
+            if stored:
+                commits.update(zip(stored, (yield self.get_many(stored))))
+            ids = list(set([p for i, c in commits.items() if i not in shallow
+                            for p in c.parents]) - seen)
+        defer.returnValue(False)
+
+    @defer.inlineCallbacks
+    def collect_garbage(self, keep_commits=None, batch_size=500, incremental=False):
+        """
+        @brief Mark and sweep the content objects of this partition. Objects
+        reachable from the refs (the structure and the heads of each
+        object, through commit parents, trees and their children) are kept;
+        all others are deleted.
+        @param keep_commits if given, only the keep_commits most recent
+        commits of each object, and what they reach, are kept. The oldest
+        kept commits become roots of the object's commit graph and are
+        marked shallow (see ObjectChassis.get_shallow), so history walks,
+        packs and pushes stop at them.
+        @param batch_size number of objects read or deleted per request
+        @param incremental give the reactor a turn between batches, so a
+        live service keeps serving during the collection. Objects put while
+        it runs are never deleted.
+        @retval defer.Deferred that fires with a dict: objects (number
+        before), removed (number deleted), bytes (stored bytes deleted).
+        @note Before deleting, the sweep epoch of the partition is changed
+        (see CAStore.new_epoch) and known_ttl seconds waited, so that other
+        stores on the partition (in other processes) have dropped their
+        known filters and write a deleted object again; the epoch is
+        changed again after. Objects those stores reference anew while the
+        collection runs are not spared, so collect in the process that owns
+        the partition.
+        """
+        if incremental:
+            pause = lambda: task.deferLater(reactor, 0, lambda: None)
+        else:
+            pause = lambda: defer.succeed(None)
+        self.written = set()
+        try:
+            all_ids = yield self.objs.query('([0-9a-f]{40})$')
+            roots, walk_parents, shallow = yield self._gc_roots(keep_commits)
+
+            # Mark, one level of the object graph (or batch_size of it)
+            # per read; blobs are not decoded.
+            marked = set()
+            pending = cas._unseen(roots, marked)
+            i = 0
+            while i < len(pending):
+                batch = pending[i:i + batch_size]
+                i += len(batch)
+                datas = yield self.objs.get_many(batch)
+                refs = []
+                for id, data in zip(batch, datas):
+                    if not data:
+                        logging.warn('collect_garbage: object %s not found' % id)
+                        continue
+                    data = self._decompress(data)
+                    if data[:data.find(' ')] in LEAF_TYPES:
+                        continue
+                    obj = self.decode(data)
+                    if isinstance(obj, cas.Commit):
+                        refs.append(obj.tree)
+                        if walk_parents and id not in shallow:
+                            refs.extend(obj.parents)
+                    elif isinstance(obj, cas.Tree):
+                        refs.extend([child[1] for child in obj.children])
+                pending.extend(cas._unseen(refs, marked))
+                yield pause()
+
+            # Sweep. Objects put since the collection started are spared,
+            # checked again just before each delete; the known filters
+            # (this one right away, others within known_ttl) are dropped
+            # first so that puts from now on check the backend. A put
+            # racing a delete (on a backend answering later) can find the
+            # object still there and skip writing it, so objects put by
+            # the time the delete completes are written back.
+            dead = [id for id in all_ids if id not in marked]
+            yield self.new_epoch()
+            if dead and self.known_ttl:
+                yield task.deferLater(reactor, self.known_ttl, lambda: None)
+            removed = nbytes = 0
+            for i in range(0, len(dead), batch_size):
+                batch = [id for id in dead[i:i + batch_size] if id not in self.written]
+                datas = yield self.objs.get_many(batch)
+                batch = [(id, data) for id, data in zip(batch, datas)
+                            if data and id not in self.written]
+                yield self.objs.remove_many([id for id, data in batch])
+                raced = [(id, data) for id, data in batch if id in self.written]
+                if raced:
+                    yield self.objs.put_many(raced)
+                    batch = [(id, data) for id, data in batch if id not in self.written]
+                removed += len(batch)
+                nbytes += sum([len(data) for id, data in batch])
+                yield pause()
+            if removed:
+                # ids read during the sweep may be of deleted objects
+                yield self.new_epoch()
+        finally:
+            self.written = None
+        logging.info('collect_garbage: %d of %d objects removed, %d bytes' %
+                        (removed, len(all_ids), nbytes))
+        defer.returnValue({'objects':len(all_ids), 'removed':removed, 'bytes':nbytes})
+
+    @defer.inlineCallbacks
+    def _list_heads(self):
+        """
+        @retval defer.Deferred that fires with (names of the objects, dict of
+        name to the refs keys of its heads, dict of name to its shallow
+        commit ids)
+        """
+        keys = yield self.refs.query('(.*)$')
+        names = []
+        heads = {}
+        shallow = {}
+        for key in keys:
+            if '.graph.' in key:
+                continue
+            name, sep, id = key.rpartition('.shallow.')
+            if sep:
+                shallow.setdefault(name, set()).add(id)
+                continue
+            name, sep, head = key.rpartition('.refs.')
+            if sep:
+                heads.setdefault(name, []).append(key)
+            else:
+                names.append(key)
+        defer.returnValue((names, heads, shallow))
+
+    @defer.inlineCallbacks
+    def _gc_roots(self, keep_commits=None):
+        """
+        @brief Ids the garbage collection marks from: the structure of each
+        object, and its heads or (with keep_commits) its most recent
+        commits, whose commit graph is pruned to them; the oldest of those
+        are marked shallow.
+        @retval defer.Deferred that fires with (ids, whether commit parents
+        are to be marked, set of shallow commit ids)
+        """
+        names, heads, shallow = yield self._list_heads()
+        head_keys = [key for name in names for key in heads.get(name, [])]
+        values = yield self.refs.get_many(names + head_keys)
+        roots = [id for id in values[:len(names)] if id]
+        head_ids = dict(zip(head_keys, values[len(names):]))
+        if keep_commits is None:
+            roots.extend([id for id in head_ids.values() if id])
+            cut = set()
+            for ids in shallow.values():
+                cut.update(ids)
+            defer.returnValue((roots, True, cut))
+        cut = set()
+        for name in names:
+            ids = [head_ids[key] for key in heads.get(name, []) if head_ids[key]]
+            if not ids:
+                continue
+            chassis = self.objectChassis(self, self._keyspace(name))
+            graph = yield chassis.get_graph(ids)
+            kept = graph.recent(ids, keep_commits)
+            old_cut = shallow.get(name, set())
+            keep = set(kept)
+            new_cut = set([id for id in kept if id in old_cut or
+                            [p for p in graph.parents(id) if p not in keep]])
+            if new_cut - old_cut:
+                yield chassis.keyspace.put_many([('shallow.' + id, id)
+                                                for id in new_cut - old_cut])
+            if old_cut - new_cut:
+                yield chassis.keyspace.remove_many(['shallow.' + id
+                                                for id in old_cut - new_cut])
+            cut.update(new_cut)
+            if len(kept) < len(graph):
+                old_keys = set(graph.entry_keys())
+                pruned = graph.prune(kept)
+                new_keys = set(pruned.entry_keys())
+                yield chassis.keyspace.put_many([('graph.' + key, key.split('.', 1)[0])
+                                                for key in new_keys - old_keys])
+                yield chassis.keyspace.remove_many(['graph.' + key
+                                                for key in old_keys - new_keys])
+            roots.extend(kept)
+        defer.returnValue((roots, False, cut))
+
 class Identity(dataobject.DataObject):
     name = dataobject.TypedAttribute(str)
     age = dataobject.TypedAttribute(int)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+"""
+@file ion/data/datastore/query.py
+@brief Declarative queries of registry resources: attribute predicates
+(eq, in, regex, prefix, range and comparisons), boolean composition,
+projection, sort, limit and offset. A Query is a DataObject, so it is sent
+to a registry service as is and evaluated there (see
+Registry.query_resource).
+@note Predicates are nested DataObjects rather than nested lists; the
+message encoders only carry flat lists of scalars.
+"""
+
+import re
+
+from twisted.internet import defer
+
+from ion.data import dataobject
+from ion.data.dataobject import DataObject, TypedAttribute
+
+ATTRIBUTE_OPS = ('eq', 'in', 'regex', 'prefix', 'range', 'lt', 'le', 'gt', 'ge')
+BOOLEAN_OPS = ('and', 'or', 'not')
+
+class QueryError(Exception):
+    """
+    Raised for a malformed query.
+    """
+
+class Predicate(DataObject):
+    """
+    @brief A term of a query: a test of attribute against values (op in
+    ATTRIBUTE_OPS) or a composition of terms (op in BOOLEAN_OPS).
+    @note range tests low <= value < high with values [low, high].
+    """
+    op = TypedAttribute(str)
+    attribute = TypedAttribute(str)
+    values = TypedAttribute(list)
+    terms = TypedAttribute(list)
+
+class Query(DataObject):
+    """
+    @brief Resources matching where (all if None or without op), sorted
+    by the attribute names in sort ('-name' for descending), from offset,
+    at most limit of them (0 for no limit), with only the attributes in
+    fields (all if empty).
+    @note Pages: limit is the page size, after the sort key of the last
+    result of the previous page and candidates the names of the resources
+    left to check for the next pages, in result order (see next_page).
+    """
+    where = TypedAttribute(Predicate, default=None)
+    fields = TypedAttribute(list)
+    sort = TypedAttribute(list)
+    limit = TypedAttribute(int, default=0)
+    offset = TypedAttribute(int, default=0)
+    after = TypedAttribute(list)
+    candidates = TypedAttribute(list)
+
+dataobject.DataObject._types['Predicate'] = Predicate
+dataobject.DataObject._types['Query'] = Query
+
+def _predicate(op, attribute='', values=(), terms=()):
+    pred = Predicate()
+    pred.op = op
+    pred.attribute = attribute
+    pred.values = list(values)
+    pred.terms = list(terms)
+    return pred
+
+def eq(attribute, value):
+    return _predicate('eq', attribute, [value])
+
+def in_(attribute, values):
+    return _predicate('in', attribute, values)
+
+def regex(attribute, pattern):
+    return _predicate('regex', attribute, [pattern])
+
+def prefix(attribute, value):
+    return _predicate('prefix', attribute, [value])
+
+def between(attribute, low, high):
+    return _predicate('range', attribute, [low, high])
+
+def lt(attribute, value):
+    return _predicate('lt', attribute, [value])
+
+def le(attribute, value):
+    return _predicate('le', attribute, [value])
+
+def gt(attribute, value):
+    return _predicate('gt', attribute, [value])
+
+def ge(attribute, value):
+    return _predicate('ge', attribute, [value])
+
+def and_(*terms):
+    return _predicate('and', terms=terms)
+
+def or_(*terms):
+    return _predicate('or', terms=terms)
+
+def not_(term):
+    return _predicate('not', terms=[term])
+
+def check(pred):
+    """
+    @brief Raise QueryError if pred is not a well formed predicate.
+    """
+    if not isinstance(pred, Predicate):
+        raise QueryError('Not a predicate: %r' % (pred,))
+    if pred.op in BOOLEAN_OPS:
+        if not pred.terms or (pred.op == 'not' and len(pred.terms) != 1):
+            raise QueryError('Bad number of terms for %s' % pred.op)
+        for term in pred.terms:
+            check(term)
+    elif pred.op in ATTRIBUTE_OPS:
+        if not pred.attribute:
+            raise QueryError('No attribute for %s' % pred.op)
+        nvalues = len(pred.values)
+        if (pred.op == 'range' and nvalues != 2) or (pred.op != 'in' and
+                pred.op != 'range' and nvalues != 1):
+            raise QueryError('Bad number of values for %s' % pred.op)
+        if pred.op == 'regex':
+            try:
+                re.compile(pred.values[0])
+            except re.error, e:
+                raise QueryError('Bad regex %r: %s' % (pred.values[0], e))
+    else:
+        raise QueryError('Unknown op %r' % (pred.op,))
+
+def coerce(value, like):
+    """
+    @brief value as the type of like where a message encoding loses it
+    (life cycle states arrive as their names).
+    """
+    if isinstance(like, dataobject.LCState) and isinstance(value, basestring):
+        return dataobject.LCStates.get(str(value), value)
+    return value
+
+def match(pred, obj):
+    """
+    @retval whether DataObject obj satisfies pred. An attribute obj does
+    not have satisfies no attribute test.
+    """
+    op = pred.op
+    if op == 'and':
+        return all([match(term, obj) for term in pred.terms])
+    elif op == 'or':
+        return any([match(term, obj) for term in pred.terms])
+    elif op == 'not':
+        return not match(pred.terms[0], obj)
+    if pred.attribute not in obj.attributes:
+        return False
+    value = getattr(obj, pred.attribute)
+    values = [coerce(v, value) for v in pred.values]
+    if op == 'eq':
+        return value == values[0]
+    elif op == 'in':
+        return value in values
+    elif op == 'regex':
+        return isinstance(value, basestring) and bool(re.search(values[0], value))
+    elif op == 'prefix':
+        return isinstance(value, basestring) and value.startswith(values[0])
+    elif op == 'range':
+        return values[0] <= value < values[1]
+    elif op == 'lt':
+        return value < values[0]
+    elif op == 'le':
+        return value <= values[0]
+    elif op == 'gt':
+        return value > values[0]
+    elif op == 'ge':
+        return value >= values[0]
+    raise QueryError('Unknown op %r' % (op,))
+
+def attributes(pred):
+    """
+    @retval set of the attribute names pred tests
+    """
+    if pred is None:
+        return set()
+    if pred.op in BOOLEAN_OPS:
+        atts = set()
+        for term in pred.terms:
+            atts.update(attributes(term))
+        return atts
+    return set([pred.attribute])
+
+@defer.inlineCallbacks
+def candidates(pred, lookup, indexed):
+    """
+    @brief Names of the objects which may satisfy pred, from exact match
+    lookups of the indexed attributes.
+    @param lookup function of (attribute, value) returning a Deferred
+    which fires with the set of names of the objects holding that value
+    @param indexed names of the attributes lookup can be used for
+    @retval defer.Deferred that fires with a set of names, or None if
+    pred needs a scan of all objects
+    """
+    op = pred.op
+    if op in ('eq', 'in') and pred.attribute in indexed:
+        names = set()
+        for value in pred.values:
+            found = yield lookup(pred.attribute, value)
+            names.update(found)
+        defer.returnValue(names)
+    elif op in ('and', 'or'):
+        sets = []
+        for term in pred.terms:
+            names = yield candidates(term, lookup, indexed)
+            if names is None and op == 'or':
+                defer.returnValue(None)
+            if names is not None:
+                sets.append(names)
+                if op == 'and' and not names:
+                    break
+        if not sets:
+            defer.returnValue(None)
+        names = sets[0]
+        for other in sets[1:]:
+            if op == 'and':
+                names = names & other
+            else:
+                names = names | other
+        defer.returnValue(names)
+    defer.returnValue(None)
+
+def sort_values(obj, keys):
+    """
+    @retval the values of the attributes of obj named in keys, as they
+    are sorted on
+    """
+    values = []
+    for key in keys or []:
+        value = getattr(obj, key.lstrip('-'), None)
+        if isinstance(value, dataobject.LCState):
+            value = str(value)
+        values.append(value)
+    return values
+
+class SortKey(object):
+    """
+    @brief Orders lists of values: in turn, descending where the key of
+    keys at that position starts with '-'; values past the keys ascend.
+    """
+    __slots__ = ('values', 'reverse')
+
+    def __init__(self, values, keys):
+        self.values = values
+        self.reverse = [key.startswith('-') for key in keys or []]
+
+    def __cmp__(self, other):
+        for i, (a, b) in enumerate(zip(self.values, other.values)):
+            c = cmp(a, b)
+            if c:
+                if i < len(self.reverse) and self.reverse[i]:
+                    return -c
+                return c
+        return 0
+
+def sort(objs, keys):
+    """
+    @brief Sort objs in place by the attributes named in keys; a key
+    starting with '-' sorts descending.
+    """
+    objs.sort(key=lambda obj: SortKey(sort_values(obj, keys), keys))
+    return objs
+
+def next_page(resource_query, after, candidates=()):
+    """
+    @param candidates names of the resources left after that result, which
+    the page is found among instead of all of them
+    @retval a Query for the page of the results of resource_query after
+    the result with sort key after
+    """
+    page = Query()
+    page.where = resource_query.where
+    page.fields = list(resource_query.fields or [])
+    page.sort = list(resource_query.sort or [])
+    page.limit = resource_query.limit
+    page.after = list(after)
+    page.candidates = list(candidates)
+    return page
+
+def project(obj, fields):
+    """
+    @retval a new object of the class of obj with only the attributes in
+    fields set from obj, and encoded (see DataObjectCodec.project)
+    """
+    return type(obj).get_codec().project(obj, fields)
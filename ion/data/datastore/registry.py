@@ -7,6 +7,7 @@
 @brief base service for registering ooi resources
 """
 
+import bisect
 import logging
 logging = logging.getLogger(__name__)
 
@@ -16,7 +17,9 @@ from twisted.internet import defer
 
 from ion.data import store
 from ion.data import dataobject
+from ion.data.datastore import cas
 from ion.data.datastore import objstore
+from ion.data.datastore import query
 
 from ion.core import ioninit
 from ion.core import base_process
@@ -69,6 +72,14 @@ class IRegistry(object):
         """
         raise NotImplementedError, "Abstract Interface Not Implemented"
 
+    def register_resources(self,resources):
+        """
+        @brief Register many resource descriptions at once.
+        @param resources list of instances of OOIResource.
+        @retval the resources, registered
+        """
+        raise NotImplementedError, "Abstract Interface Not Implemented"
+
     def get_resource(self,resource_reference):
         """
         @param uuid name of resource.
@@ -85,6 +96,30 @@ class IRegistry(object):
         """
         raise NotImplementedError, "Abstract Interface Not Implemented"
 
+    def query_resource(self,resource_query):
+        """
+        @param resource_query instance of ion.data.datastore.query.Query
+        """
+        raise NotImplementedError, "Abstract Interface Not Implemented"
+
+    def find_resource_page(self,description,regex=True,ignore_defaults=True,attnames=[],page_size=100):
+        """
+        @retval (first page of resources, cursor for find_next or None)
+        """
+        raise NotImplementedError, "Abstract Interface Not Implemented"
+
+    def query_resource_page(self,resource_query):
+        """
+        @retval (first page of resources, cursor for find_next or None)
+        """
+        raise NotImplementedError, "Abstract Interface Not Implemented"
+
+    def find_next(self,cursor):
+        """
+        @retval (next page of resources, cursor for find_next or None)
+        """
+        raise NotImplementedError, "Abstract Interface Not Implemented"
+
 class RegistryBackend(objstore.ObjectChassis):
     """
     """
@@ -97,10 +132,38 @@ class Registry(objstore.ObjectStore, IRegistry, LCStateMixin):
 
     objectChassis = RegistryBackend
 
+    # Exact match (regex=False) searches on these go through the indexes
+    indexed_attributes = ('name', 'lifecycle', 'publisher', 'keywords')
+
+    def __init__(self, backend, partition='', resource_cache=1000, **kwargs):
+        """
+        @param resource_cache most resource commits whose attribute trees
+        are kept read (see get_resource); 0 to disable
+        @param kwargs options of the object store; see ObjectStore
+        """
+        objstore.ObjectStore.__init__(self, backend, partition, **kwargs)
+        self.resources = cas.ObjectCache(resource_cache)
+
     def clear_registry(self):
         logging.info(self.__class__.__name__ + '################################################################# clear_registry called ')
+        self.cache.clear()
+        self.known.clear()
+        self.resources.clear()
         return self.backend.clear_store()
 
+    def _cache_resource(self, id, commit_id, resource):
+        """
+        @brief Keep the attribute tree resource was checked out from or
+        committed as, if all its blobs are read, for commit_id of the
+        resource with identity id.
+        """
+        changes = resource.get_changes()
+        if commit_id and changes is not None and changes.base is not None:
+            tree = changes.base[1]
+            if all([child.obj for child in tree.children]):
+                size = sum([len(child.obj.content) for child in tree.children])
+                self.resources.put((id, commit_id), tree, size)
+
 
 
     @defer.inlineCallbacks
@@ -108,67 +171,107 @@ class Registry(objstore.ObjectStore, IRegistry, LCStateMixin):
         """
         @brief Add a new resource description to the registry. Implemented
         by creating a new (unique) resource object to the store.
-        @note Is the way objectClass is referenced awkward?
+        @note The resource is committed on top of the head without checking
+        it out (see register_resources): only the attributes changed since
+        it was read from this registry are encoded and written.
         """
-        #print 'Dataobject Register Start',dataobject.DataObject._types.has_key('__builtins__')
-        #del dataobject.DataObject._types['__builtins__']
-        #print 'Dataobject Register Removed',dataobject.DataObject._types.has_key('__builtins__')
-
-        if isinstance(resource, self.objectChassis.objectClass):
-
-            id = resource.RegistryIdentity
-            if not id:
-                raise RuntimeError('Can not register a resource which does not have an identity.')
-
-            #print 'Dataobject Register Is Instance',dataobject.DataObject._types.has_key('__builtins__')
+        resources = yield self.register_resources([resource])
+        defer.returnValue(resources[0])
 
-
-            try:
-                res_client = yield self.create(id, self.objectChassis.objectClass)
-            except objstore.ObjectStoreError:
-                res_client = yield self.clone(id)
-
-            #print 'Dataobject Chasis',dataobject.DataObject._types.has_key('__builtins__')
-
-            yield res_client.checkout()
-
-            #print 'Dataobject checkout',dataobject.DataObject._types.has_key('__builtins__')
-
-            res_client.index = resource
-            resource.RegistryCommit = yield res_client.commit()
-        else:
-            resource = None
-
-        defer.returnValue(resource)
+    @defer.inlineCallbacks
+    def register_resources(self, resources):
+        """
+        @brief Register many resources (see register_resource) with the
+        backend operations of all of them batched (see
+        ObjectStore.clone_many and commit_many): the new ones are created
+        together, the attribute blobs and trees of all are written with one
+        multi-put (a value many of them share is written once) and all
+        heads move with one write.
+        @param resources list of instances of objectClass with an identity
+        @retval defer.Deferred that fires with resources, each with its
+        RegistryCommit set; None in place of the ones not of objectClass
+        @note A resource listed more than once is committed once per
+        listing, in order.
+        """
+        objectClass = self.objectChassis.objectClass
+        pending = []
+        for resource in resources:
+            if isinstance(resource, objectClass):
+                if not resource.RegistryIdentity:
+                    raise RuntimeError('Can not register a resource which does not have an identity.')
+                pending.append(resource)
+
+        while pending:
+            batch = []
+            later = []
+            ids = set()
+            for resource in pending:
+                if resource.RegistryIdentity in ids:
+                    later.append(resource)
+                else:
+                    ids.add(resource.RegistryIdentity)
+                    batch.append(resource)
+            chassis = yield self.clone_many([r.RegistryIdentity for r in batch], objectClass)
+            for res_client, resource in zip(chassis, batch):
+                res_client.index = resource
+            commit_ids = yield self.commit_many(chassis)
+            for resource, commit_id in zip(batch, commit_ids):
+                resource.RegistryCommit = commit_id
+                self._cache_resource(resource.RegistryIdentity, commit_id, resource)
+            pending = later
+
+        defer.returnValue([r if isinstance(r, objectClass) else None for r in resources])
 
     @defer.inlineCallbacks
-    def get_resource(self, resource_reference):
+    def get_resource(self, resource_reference, prefetch=None):
         """
         @brief Get resource description object
+        @param prefetch names of the attributes to read now; the others are
+        read with load_fields. By default all attributes are read.
+        @note A commit never changes, so the read attribute trees of recent
+        commits are kept (bounded, least recently used out); a resource
+        is decoded from them again on each get. Without a RegistryCommit,
+        the head is read first (one get), so a cached tree of an older
+        head is never returned. With one, a resource not in the cache is
+        checked to exist (one get); None for an unknown identity.
         """
         resource=None
         if isinstance(resource_reference, dataobject.ResourceReference):
 
             branch = resource_reference.RegistryBranch
-            resource_client = yield self.clone(resource_reference.RegistryIdentity)
-            if resource_client:
-                if not resource_reference.RegistryCommit:
-                    resource_reference.RegistryCommit = yield resource_client.get_head(branch)
-
-                pc = resource_reference.RegistryCommit
-                resource = yield resource_client.checkout(commit_id=pc)
+            id = resource_reference.RegistryIdentity
+            pc = resource_reference.RegistryCommit
+            resource_client = self.objectChassis(self, self._keyspace(id), name=id)
+            tree = None
+            if pc:
+                # Cached trees are of resources which exist
+                tree = self.resources.get((id, pc))
+                if tree is None and not (yield self._object_exists(id)):
+                    defer.returnValue(None)
+            else:
+                pc = yield resource_client.get_head(branch)
+                if pc:
+                    tree = self.resources.get((id, pc))
+            if tree is not None:
+                resource = resource_client.checkout_tree(tree, pc)
+            elif pc:
+                # A commit id is known and the object exists; no clone
+                resource = yield resource_client.checkout(commit_id=pc, prefetch=prefetch)
+                if prefetch is None:
+                    self._cache_resource(id, pc, resource)
+            else:
+                resource_client = yield self.clone(id)
+                if resource_client:
+                    resource = yield resource_client.checkout(commit_id=pc, prefetch=prefetch)
+            if resource is not None:
+                resource_reference.RegistryCommit = pc
                 resource.RegistryBranch = branch
                 resource.RegistryCommit = pc
 
         defer.returnValue(resource)
 
-    @defer.inlineCallbacks
     def get_resource_by_id(self, id):
-        resource_client = yield self.clone(id)
-        resource = yield resource_client.checkout()
-        resource.RegistryCommit = resource_client.cur_commit
-        resource.RegistryBranch = 'master'
-        defer.returnValue(resource)
+        return self.get_resource(dataobject.ResourceReference(RegistryIdentity=id))
 
     @defer.inlineCallbacks
     def set_resource_lcstate(self, resource_reference, lcstate):
@@ -206,36 +309,210 @@ class Registry(objstore.ObjectStore, IRegistry, LCStateMixin):
         defer.returnValue([(yield self.get_resource(ref)) for ref in refs])
 
 
-    @defer.inlineCallbacks
     def find_resource(self,description,regex=True,ignore_defaults=True,attnames=[]):
         """
         @brief Find resource descriptions in the registry meeting the criteria
         in the FindResourceContainer
         """
+        d = self.find_resource_page(description, regex, ignore_defaults, attnames, page_size=0)
+        d.addCallback(lambda page: page[0])
+        return d
+
+    @defer.inlineCallbacks
+    def find_resource_page(self, description, regex=True, ignore_defaults=True,
+                            attnames=[], page_size=100, after=None, candidates=None):
+        """
+        @brief A page of the resources find_resource finds, in order of
+        RegistryIdentity.
+        @param page_size most resources in the page; 0 for all of them
+        @param after RegistryIdentity of the last resource of the previous
+        page
+        @param candidates RegistryIdentity of the resources the previous
+        page left to check (its cursor holds them); the registry is not
+        scanned again
+        @retval (list of resources, cursor for find_next or None after the
+        last page)
+        """
 
         # container for the return arguments
         results=[]
+        last = None
+        rest = []
         if isinstance(description,dataobject.DataObject):
-            refs = yield self._list()
+            # Only the attributes compared are read to filter; the rest of
+            # a match is read when it is returned
+            compared = attnames or description.attributes
+            if ignore_defaults:
+                compared = description.non_default_atts(compared)
+
+            indexed = [att for att in compared if att in self.indexed_attributes
+                        and not isinstance(getattr(description, att), dataobject.DataObject)]
+            if candidates:
+                names = candidates
+            elif indexed and not regex:
+                # Candidates from the indexes; still compared below
+                names = yield self.find_indexed(description, indexed)
+                logging.info(self.__class__.__name__ + ': find_resource found ' + str(len(names)) + ' candidates in the indexes')
+            else:
+                refs = yield self._list()
+                names = [ref.RegistryIdentity for ref in refs]
+                logging.info(self.__class__.__name__ + ': find_resource found ' + str(len(names)) + ' items in registry')
             logging.debug(description)
-
-            # Get the list of descriptions in this registry
-
-            reslist = yield self._list_descriptions()
-            logging.info(self.__class__.__name__ + ': find_resource found ' + str(len(reslist)) + ' items in registry')
             num_match = 1
-            for ref in refs:
-                res = yield self.get_resource(ref)
-                logging.debug("Found #"+str(num_match)+":"+str(res))
-                num_match += 1
+            names = sorted(names)
+            for i, name in enumerate(names):
+                if after and name <= after:
+                    continue
+                ref = dataobject.ResourceReference(RegistryIdentity=name)
+                res = yield self.get_resource(ref, prefetch=compared)
                 matches_desc = description.compared_to(res,
                                         regex=regex,
                                         ignore_defaults=ignore_defaults,
                                         attnames=attnames)
                 if matches_desc:
+                    yield self.load_fields(res)
+                    logging.debug("Found #"+str(num_match)+":"+str(res))
+                    num_match += 1
                     results.append(res)
+                    if page_size and len(results) == page_size:
+                        last = name
+                        rest = names[i + 1:]
+                        break
+
+        cursor = None
+        if rest:
+            cursor = coi_resource_descriptions.FindResourceContainer()
+            cursor.description = description
+            cursor.regex = regex
+            cursor.ignore_defaults = ignore_defaults
+            cursor.attnames = list(attnames)
+            cursor.page_size = page_size
+            cursor.after = [last]
+            cursor.candidates = rest
+        defer.returnValue((results, cursor))
+
+    def find_next(self, cursor):
+        """
+        @brief The page of results after the page cursor was returned with
+        (by find_resource_page or query_resource_page).
+        @retval Deferred, for (list of resources, cursor or None)
+        """
+        if type(cursor).__name__ == coi_resource_descriptions.FindResourceContainer.__name__:
+            return self.find_resource_page(cursor.description, cursor.regex,
+                    cursor.ignore_defaults, cursor.attnames, cursor.page_size,
+                    cursor.after and cursor.after[0], cursor.candidates)
+        return self.query_resource_page(cursor)
+
+    def _find_value(self, att, value):
+        """
+        @brief Names of the resources whose attribute att equals value, from
+        the index of att.
+        """
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        typedatt = self.objectChassis.objectClass.get_typedattributes().get(att)
+        if typedatt:
+            value = query.coerce(value, typedatt.default)
+        d = self.find_value(att, dataobject.value_encoder(type(value))(value))
+        d.addCallback(set)
+        return d
+
+    def query_resource(self, resource_query):
+        """
+        @brief Find the resources matching a query (see
+        ion.data.datastore.query).
+        @retval Deferred, for the list of resources (see
+        query_resource_page)
+        """
+        d = self.query_resource_page(resource_query)
+        d.addCallback(lambda page: page[0])
+        return d
 
-        defer.returnValue(results)
+    @defer.inlineCallbacks
+    def query_resource_page(self, resource_query):
+        """
+        @brief Find the resources matching a query (see
+        ion.data.datastore.query): candidates come from the indexes for
+        exact matches (eq, in) of indexed attributes, or from a scan of
+        the registry; only the attributes tested and sorted on are read
+        to filter. Results are ordered by the sort attributes and then by
+        RegistryIdentity; at most offset + limit of them are held while
+        the candidates are checked. The cursor holds the names of the
+        resources left after the page, in result order, so the next pages
+        neither scan nor read the ones before them again.
+        @retval (list of the resources found, after resource_query.after,
+        from offset and at most limit of them, cursor for find_next or None
+        if the page is not full); with fields, new resources holding only
+        those attributes (and the reference)
+        """
+        where = resource_query.where
+        if where is not None and not where.op:
+            where = None
+        if where is not None:
+            query.check(where)
+        names = None
+        resumed = bool(resource_query.candidates)
+        if resumed:
+            names = list(resource_query.candidates)
+        elif where is not None:
+            names = yield query.candidates(where, self._find_value, self.indexed_attributes)
+        if names is None:
+            refs = yield self._list()
+            names = [ref.RegistryIdentity for ref in refs]
+        if not resumed:
+            names = sorted(names)
+        logging.info(self.__class__.__name__ + ': query_resource checks ' + str(len(names)) + ' resources')
+
+        sort = resource_query.sort or []
+        fields = resource_query.fields or []
+        offset = resource_query.offset
+        limit = resource_query.limit
+        after = None
+        if resource_query.after:
+            after = query.SortKey(list(resource_query.after), sort)
+        compared = query.attributes(where) | set([key.lstrip('-') for key in sort])
+        held = limit and offset + limit
+        # In result order already, the scan stops at the last resource
+        # asked for; else the sort keys of all matches are kept to resume
+        ordered = resumed or not sort
+        page = []
+        matched = []
+        rest = []
+        for i, name in enumerate(names):
+            if after is not None and not sort and name <= after.values[-1]:
+                continue
+            ref = dataobject.ResourceReference(RegistryIdentity=name)
+            res = yield self.get_resource(ref, prefetch=compared | set(fields))
+            if res is None:
+                continue
+            if where is not None and not query.match(where, res):
+                continue
+            key = query.SortKey(query.sort_values(res, sort) + [name], sort)
+            if after is not None and key <= after:
+                continue
+            bisect.insort(page, (key, res))
+            if held and len(page) > held:
+                page.pop()
+            if not ordered:
+                matched.append(key)
+            elif held and len(page) == held:
+                rest = names[i + 1:]
+                break
+        page = page[offset:]
+        if matched and page:
+            last = page[-1][0]
+            rest = [key.values[-1] for key in sorted(matched) if key > last]
+        cursor = None
+        if limit and len(page) == limit and rest:
+            cursor = query.next_page(resource_query, page[-1][0].values, rest)
+        results = [res for key, res in page]
+        if fields:
+            keep = ['RegistryIdentity', 'RegistryCommit', 'RegistryBranch'] + fields
+            results = [query.project(res, keep) for res in results]
+        else:
+            for res in results:
+                yield self.load_fields(res)
+        defer.returnValue((results, cursor))
 
 
 
@@ -282,7 +559,9 @@ class BaseRegistryService(BaseService):
         s = yield self.backend.create_store(**backendargs)
 
         # Now pass the instance of store to create an instance of the registry
-        self.reg = Registry(s)
+        compression = self.spawn_args.get('compression', CONF.getValue('compression', None))
+        resource_cache = self.spawn_args.get('resource_cache', CONF.getValue('resource_cache', 1000))
+        self.reg = Registry(s, compression=compression, resource_cache=resource_cache)
 
         name = self.__class__.__name__
         logging.info(name + " initialized; backend:%s; backend args:%s" % (backendcls, backendargs))
@@ -320,6 +599,33 @@ class BaseRegistryService(BaseService):
             yield self.reply_err(msg, None)
 
 
+    @defer.inlineCallbacks
+    def base_register_resources(self, content, headers, msg):
+        """
+        Service operation: Register a list of resource instances (a
+        ResourceListContainer) with the registry in one batch; reply with
+        the list of their references.
+        """
+        accept_encoding = headers.get('accept-encoding', '')
+        container = dataobject.serializer.decode(content, headers['encoding'])
+        logging.info(self.__class__.__name__ + ' received: op_'+ headers['op'])
+        if type(container).__name__ != coi_resource_descriptions.ResourceListContainer.__name__:
+            yield self.reply_err(msg, 'Invalid resource list')
+            return
+
+        resources = yield self.reg.register_resources(container.resources or [])
+        if None in resources:
+            logging.info(self.__class__.__name__ + ': op_'+ headers['op'] + ' Failed!')
+            yield self.reply_err(msg, None)
+            return
+
+        results = coi_resource_descriptions.ResourceListContainer()
+        results.resources = [resource.reference() for resource in resources]
+        logging.info(self.__class__.__name__ + ': op_'+ headers['op'] + ' Success! ' + str(len(resources)) + ' Registered')
+        encoding, _, data = dataobject.serializer.encode(results, accept_encoding)
+        headers = dict(encoding=encoding)
+        yield self.reply_ok(msg, data, headers)
+
     @defer.inlineCallbacks
     def base_get_resource(self, content, headers, msg):
         """
@@ -387,25 +693,23 @@ class BaseRegistryService(BaseService):
             logging.info(self.__class__.__name__ + ': op_'+ headers['op'] + ' Failed!')
             yield self.reply_err(msg, None)
 
-    @defer.inlineCallbacks
     def base_find_resource(self, content, headers, msg):
         """
         @brief Find resource descriptions in the registry meeting the criteria
         listed in the properties dictionary
         """
-        description = None
-        regex = None
-        ignore_defaults = None
-        attnames = []
-
         logging.debug('Registry Service MSG:'+ str(headers))
         #container = dataobject.Resource.decode(content)
         #This container object is expected to have certain functionality
-        accept_encoding = headers.get('accept-encoding', '')
         container = dataobject.serializer.decode(content, headers['encoding'])
         logging.debug(self.__class__.__name__ + ' received: op_'+ headers['op'] +', container: \n' + str(container))
+        return self._reply_find(container, headers, msg)
 
+    @defer.inlineCallbacks
+    def _reply_find(self, container, headers, msg):
+        accept_encoding = headers.get('accept-encoding', '')
         result_list = []
+        cursor = None
         #This makes things difficult; shouldn't use python class resolution
         #to determine DataObject stuff
         #if isinstance(container,  coi_resource_descriptions.FindResourceContainer):
@@ -415,16 +719,70 @@ class BaseRegistryService(BaseService):
             ignore_defaults = container.ignore_defaults
             attnames = container.attnames
 
-            result_list = yield self.reg.find_resource(description,regex,ignore_defaults, attnames)
+            # One page (all of the results if page_size is 0)
+            result_list, cursor = yield self.reg.find_resource_page(description,
+                                        regex, ignore_defaults, attnames,
+                                        container.page_size,
+                                        container.after and container.after[0],
+                                        container.candidates)
+
+        results = coi_resource_descriptions.ResourceListContainer()
+        results.resources = result_list
+        if cursor:
+            results.after = cursor.after
+            results.candidates = cursor.candidates
+
+        logging.info(self.__class__.__name__ + ': op_'+ headers['op'] + ' Success! ' + str(len(result_list)) + ' Matches Found')
+        encoding, _, data = dataobject.serializer.encode(results, accept_encoding)
+        headers = dict(encoding=encoding)
+        yield self.reply_ok(msg, data, headers)
+
+
+    def base_query_resource(self, content, headers, msg):
+        """
+        @brief Find the resources meeting a query (a Query,
+        ion.data.datastore.query) and reply with the sorted, paged and
+        projected list
+        """
+        resource_query = dataobject.serializer.decode(content, headers['encoding'])
+        logging.debug(self.__class__.__name__ + ' received: op_'+ headers['op'] +', query: \n' + str(resource_query))
+        return self._reply_query(resource_query, headers, msg)
+
+    @defer.inlineCallbacks
+    def _reply_query(self, resource_query, headers, msg):
+        accept_encoding = headers.get('accept-encoding', '')
+        if type(resource_query).__name__ != query.Query.__name__:
+            yield self.reply_err(msg, 'Invalid query')
+            return
+        try:
+            result_list, cursor = yield self.reg.query_resource_page(resource_query)
+        except query.QueryError, e:
+            yield self.reply_err(msg, 'Invalid query: %s' % e)
+            return
 
         results = coi_resource_descriptions.ResourceListContainer()
         results.resources = result_list
+        if cursor:
+            results.after = cursor.after
+            results.candidates = cursor.candidates
 
         logging.info(self.__class__.__name__ + ': op_'+ headers['op'] + ' Success! ' + str(len(result_list)) + ' Matches Found')
         encoding, _, data = dataobject.serializer.encode(results, accept_encoding)
         headers = dict(encoding=encoding)
         yield self.reply_ok(msg, data, headers)
 
+    def base_find_next(self, content, headers, msg):
+        """
+        @brief Reply with the next page of a paged find or query; content is
+        the cursor of the previous page (a FindResourceContainer or a Query
+        with after set)
+        """
+        container = dataobject.serializer.decode(content, headers['encoding'])
+        logging.debug(self.__class__.__name__ + ' received: op_'+ headers['op'] +', cursor: \n' + str(container))
+        if type(container).__name__ == query.Query.__name__:
+            return self._reply_query(container, headers, msg)
+        return self._reply_find(container, headers, msg)
+
 
 class RegistryService(BaseRegistryService):
     """
@@ -435,10 +793,13 @@ class RegistryService(BaseRegistryService):
 
     op_clear_registry = BaseRegistryService.base_clear_registry
     op_register_resource = BaseRegistryService.base_register_resource
+    op_register_resources = BaseRegistryService.base_register_resources
     op_get_resource = BaseRegistryService.base_get_resource
     op_get_resource_by_id = BaseRegistryService.base_get_resource_by_id
     op_set_resource_lcstate = BaseRegistryService.base_set_resource_lcstate
     op_find_resource = BaseRegistryService.base_find_resource
+    op_query_resource = BaseRegistryService.base_query_resource
+    op_find_next = BaseRegistryService.base_find_next
 
 
 # Spawn of the process using the module name
@@ -494,6 +855,41 @@ class BaseRegistryClient(BaseServiceClient):
             logging.info(self.__class__.__name__ + ': '+ op_name + ' Failed!')
             defer.returnValue(None)
 
+    @defer.inlineCallbacks
+    def base_register_resources(self, op_name, resources):
+        """
+        @brief Store many resources in the registry with one request; the
+        service registers them in one batch.
+        @param resources list of Resource instances, each created using the
+        create_new_resource method
+        @retval resources, each with the commit of its registered version
+        set, or None if the service failed
+        """
+        yield self._check_init()
+        logging.info(self.__class__.__name__ + '; Calling: '+ op_name)
+
+        for resource in resources:
+            assert isinstance(resource, dataobject.Resource), 'Invalid argument to base_register_resources'
+        assert isinstance(op_name, str), 'Invalid argument to base_register_resources'
+
+        container = coi_resource_descriptions.ResourceListContainer()
+        container.resources = list(resources)
+        encoding, _, data = dataobject.serializer.encode(container)
+        headers = {'encoding':encoding, 'accept-encoding':encoding}
+        (content, headers, msg) = yield self.rpc_send(op_name, data, headers)
+
+        logging.debug(self.__class__.__name__ + ': '+ op_name + '; Result:' + str(headers))
+
+        if content['status']=='OK':
+            results = dataobject.serializer.decode(content['value'], headers['encoding'])
+            for resource, reference in zip(resources, results.resources or []):
+                resource.RegistryCommit = reference.RegistryCommit
+            logging.info(self.__class__.__name__ + ': '+ op_name + ' Success!')
+            defer.returnValue(resources)
+        else:
+            logging.info(self.__class__.__name__ + ': '+ op_name + ' Failed!')
+            defer.returnValue(None)
+
     @defer.inlineCallbacks
     def base_get_resource(self,op_name ,resource_reference):
         """
@@ -626,6 +1022,111 @@ class BaseRegistryClient(BaseServiceClient):
             defer.returnValue([])
 
 
+    @defer.inlineCallbacks
+    def base_query_resource(self, op_name, resource_query):
+        """
+        @brief Find the resources meeting a query; the registry evaluates it
+        and sends only the resources asked for.
+        @param resource_query instance of ion.data.datastore.query.Query
+        @retval list of resources (with only the attributes in
+        resource_query.fields if given)
+        """
+        yield self._check_init()
+        logging.info(self.__class__.__name__ + '; Calling:'+ op_name)
+
+        assert isinstance(resource_query, query.Query), 'Invalid argument to base_query_resource'
+        assert isinstance(op_name, str), 'Invalid argument to base_query_resource'
+
+        encoding, _, data = dataobject.serializer.encode(resource_query)
+        headers = {'encoding':encoding, 'accept-encoding':encoding}
+        content, headers, msg = yield self.rpc_send(op_name, data, headers)
+
+        logging.debug(self.__class__.__name__ + ': '+ op_name + '; Result:' + str(headers))
+
+        if content['status'] == 'OK':
+            results = dataobject.serializer.decode(content['value'], headers['encoding'])
+            logging.info(self.__class__.__name__ + ': '+ op_name + ' Success!')
+            defer.returnValue(results.resources)
+        else:
+            logging.info(self.__class__.__name__ + ': '+ op_name + ' Failed!')
+            defer.returnValue([])
+
+    @defer.inlineCallbacks
+    def base_find_resource_page(self, op_name, description, regex=True, ignore_defaults=True, attnames=[], page_size=100):
+        """
+        @brief The first page of the resources base_find_resource finds; the
+        others are pulled with base_find_next, one reply per page.
+        @param page_size most resources per page
+        @retval (list of resources, cursor for base_find_next or None)
+        """
+        yield self._check_init()
+        logging.info(self.__class__.__name__ + '; Calling:'+ op_name)
+
+        assert isinstance(description, dataobject.DataObject), 'Invalid argument to base_find_resource_page'
+        assert isinstance(page_size, int) and page_size > 0, 'Invalid argument to base_find_resource_page'
+
+        container = coi_resource_descriptions.FindResourceContainer()
+        container.description = description
+        container.ignore_defaults = ignore_defaults
+        container.regex = regex
+        container.attnames = attnames
+        container.page_size = page_size
+        page = yield self._send_page(op_name, container)
+        defer.returnValue(page)
+
+    @defer.inlineCallbacks
+    def base_query_resource_page(self, op_name, resource_query):
+        """
+        @brief The first page (of resource_query.limit resources) of the
+        results of a query; the others are pulled with base_find_next.
+        @retval (list of resources, cursor for base_find_next or None)
+        """
+        yield self._check_init()
+        logging.info(self.__class__.__name__ + '; Calling:'+ op_name)
+
+        assert isinstance(resource_query, query.Query), 'Invalid argument to base_query_resource_page'
+        assert resource_query.limit > 0, 'Invalid argument to base_query_resource_page'
+
+        page = yield self._send_page(op_name, resource_query)
+        defer.returnValue(page)
+
+    @defer.inlineCallbacks
+    def base_find_next(self, op_name, cursor):
+        """
+        @brief The page after the one cursor came with.
+        @retval (list of resources, cursor or None after the last page)
+        """
+        yield self._check_init()
+        logging.info(self.__class__.__name__ + '; Calling:'+ op_name)
+        page = yield self._send_page(op_name, cursor)
+        defer.returnValue(page)
+
+    @defer.inlineCallbacks
+    def _send_page(self, op_name, container):
+        encoding, _, data = dataobject.serializer.encode(container)
+        headers = {'encoding':encoding, 'accept-encoding':encoding}
+        content, headers, msg = yield self.rpc_send(op_name, data, headers)
+
+        logging.debug(self.__class__.__name__ + ': '+ op_name + '; Result:' + str(headers))
+
+        if content['status'] == 'OK':
+            results = dataobject.serializer.decode(content['value'], headers['encoding'])
+            logging.info(self.__class__.__name__ + ': '+ op_name + ' Success!')
+            cursor = None
+            if results.after:
+                if isinstance(container, query.Query):
+                    cursor = query.next_page(container, results.after,
+                                                results.candidates)
+                else:
+                    container.after = results.after
+                    container.candidates = results.candidates
+                    cursor = container
+            defer.returnValue((results.resources, cursor))
+        else:
+            logging.info(self.__class__.__name__ + ': '+ op_name + ' Failed!')
+            defer.returnValue(([], None))
+
+
 class RegistryClient(BaseRegistryClient,IRegistry,LCStateMixin):
     """
     #@TODO How can we make it so that the client infact uses a local registry
@@ -644,6 +1145,9 @@ class RegistryClient(BaseRegistryClient,IRegistry,LCStateMixin):
     def register_resource(self,resource):
         return self.base_register_resource('register_resource', resource)
 
+    def register_resources(self,resources):
+        return self.base_register_resources('register_resources', resources)
+
     def get_resource(self,resource_reference):
         return self.base_get_resource('get_resource', resource_reference)
 
@@ -653,5 +1157,17 @@ class RegistryClient(BaseRegistryClient,IRegistry,LCStateMixin):
     def find_resource(self, description,regex=True,ignore_defaults=True, attnames=[]):
         return self.base_find_resource('find_resource',description,regex,ignore_defaults,attnames)
 
+    def query_resource(self, resource_query):
+        return self.base_query_resource('query_resource', resource_query)
+
+    def find_resource_page(self, description, regex=True, ignore_defaults=True, attnames=[], page_size=100):
+        return self.base_find_resource_page('find_resource', description, regex, ignore_defaults, attnames, page_size)
+
+    def query_resource_page(self, resource_query):
+        return self.base_query_resource_page('query_resource', resource_query)
+
+    def find_next(self, cursor):
+        return self.base_find_next('find_next', cursor)
+
     def get_resource_by_id(self, id):
         return self.base_get_resource_by_id('get_resource_by_id', id)
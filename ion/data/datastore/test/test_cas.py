@@ -6,6 +6,7 @@
 @brief test object store
 """
 
+import zlib
 import logging
 logging = logging.getLogger(__name__)
 
@@ -30,6 +31,18 @@ class BlobObjectTest(unittest.TestCase):
         thash = sha1(self.encoded)
         self.failUnlessEqual(sha1(self.blob), thash)
 
+    def test_digest(self):
+        self.failUnlessEqual(self.blob.digest(), cas.sha1bin(self.encoded))
+        self.failUnlessEqual(sha1(self.blob, bin=False), cas.sha1hex(self.encoded))
+
+    def test_digest_unencoded(self):
+        # Hashing does not join the encoding; encoding after agrees
+        blob = cas.Blob('foo')
+        self.failUnlessEqual(blob.digest(), cas.sha1bin(self.encoded))
+        self.failUnlessEqual(blob._encoded_cache, None)
+        self.failUnlessEqual(blob.encode(), self.encoded)
+        self.failUnlessEqual(blob.digest(), cas.sha1bin(self.encoded))
+
     def test_encode(self):
         b = cas.Blob('foo')
         self.failUnlessEqual(
@@ -84,6 +97,23 @@ class TreeObjectTest(unittest.TestCase):
         test += '='*20
         self.assertEqual(string,test)
 
+    def test_iter_body(self):
+        body = self.encoded[self.encoded.index('\x00')+1:]
+        entries = cas.Tree.iter_body(body)
+        self.assertEqual(entries.next(), tuple(self.tree.children[0]))
+        self.assertEqual(list(entries), [tuple(self.tree.children[1])])
+
+    def test_decode_many(self):
+        # hashes with null and space bytes in them
+        children = [('child%d' % i, sha1(str(i))[:18] + ' \x00', '100644') for i in range(1000)]
+        tree = cas.Tree(*children)
+        test = cas.Tree.decode_full(tree.encode())
+        self.assertEqual([tuple(c) for c in test.children], children)
+
+    def test_decode_malformed(self):
+        body = self.encoded[self.encoded.index('\x00')+1:]
+        self.failUnlessRaises(cas.CAStoreError, list, cas.Tree.iter_body(body[:-1]))
+
 class CommitObjectTest(unittest.TestCase):
 
     def setUp(self):
@@ -216,6 +246,87 @@ class CAStoreTest(unittest.TestCase):
         cnew_out = yield self.cas.get(cnewid)
         self.failUnlessEqual(cnew.value, cnew_out.value)
 
+    @defer.inlineCallbacks
+    def test_put_many_get_many(self):
+        b = cas.Blob('test content')
+        b2 = cas.Blob('deja vu')
+        t1 = cas.Tree(cas.Element('test', b), cas.Element('hello', b2))
+        ids = yield self.cas.put_many([b, b2, t1])
+        self.failUnlessEqual(ids, [sha1(b, bin=False), sha1(b2, bin=False),
+                                    sha1(t1, bin=False)])
+        self.cas.cache.clear()
+        yield self.cas.get(ids[0])
+        objs = yield self.cas.get_many([sha1(t1), ids[1], ids[0]])
+        self.failUnlessEqual([o.value for o in objs], [t1.value, b2.value, b.value])
+        # the blob read by get came from the cache
+        self.failUnlessEqual(self.cas.cache.stats()['hits'], 1)
+
+    @defer.inlineCallbacks
+    def test_put_existing(self):
+        b = cas.Blob('test content')
+        bid = yield self.cas.put(b)
+        self.failUnless(bid in self.cas.known)
+        exists = yield self.cas._obj_exists(bid)
+        self.failUnless(exists)
+        # Another CAStore on the backend finds it with exists
+        cas2 = cas.CAStore(self.cas.backend)
+        exists = yield cas2._obj_exists(sha1('not there'))
+        self.failIf(exists)
+        exists = yield cas2._obj_exists(bid)
+        self.failUnless(exists)
+        ids = yield cas2.put_many([b, cas.Blob('deja vu')])
+        self.failUnlessEqual(ids[0], bid)
+        self.failUnless(ids[1] in cas2.known)
+        b_out = yield cas2.get(ids[1])
+        self.failUnlessEqual(b_out.content, 'deja vu')
+
+    @defer.inlineCallbacks
+    def test_walk(self):
+        b = cas.Blob('test content')
+        b2 = cas.Blob('deja vu')
+        t1 = cas.Tree(cas.Element('test', b), cas.Element('hello', b2))
+        t2 = cas.Tree(cas.Element('test', b))
+        yield self.cas.put_many([b, b2, t1, t2])
+        c1id = yield self.cas.put(cas.Commit(sha1(t2, bin=False), log='first'))
+        c2id = yield self.cas.put(cas.Commit(sha1(t1, bin=False), parents=[c1id]))
+        commits = yield self.cas.walk_commits([c2id])
+        self.failUnlessEqual([id for id, c in commits], [c2id, c1id])
+        commits = yield self.cas.walk_commits([c2id], stop=[c1id])
+        self.failUnlessEqual([id for id, c in commits], [c2id])
+        objs = yield self.cas.walk_objects([c2id])
+        self.failUnlessEqual([id for id, o in objs], [c2id, sha1(t1, bin=False),
+                                sha1(b, bin=False), sha1(b2, bin=False)])
+        objs = yield self.cas.walk_objects([c2id], exclude=[sha1(b, bin=False)])
+        self.failUnlessEqual(len(objs), 3)
+
+    @defer.inlineCallbacks
+    def test_pack(self):
+        objs = [cas.Blob('test content'), cas.Blob('deja vu')]
+        objs.append(cas.Tree(cas.Element('test', objs[0])))
+        pack = cas.encode_pack(objs)
+        self.failUnlessEqual(list(cas.iter_pack(pack)), [o.encode() for o in objs])
+        ids = yield self.cas.put_pack(pack)
+        self.failUnlessEqual(ids, [sha1(o, bin=False) for o in objs])
+        t_out = yield self.cas.get(ids[2])
+        self.failUnlessEqual(t_out.value, objs[2].value)
+
+    def test_pack_malformed(self):
+        pack = cas.encode_pack([cas.Blob('test content')])
+        self.failUnlessRaises(cas.CAStoreError, list, cas.iter_pack(pack[:-4]))
+        truncated = cas.encode_pack([cas.Blob('test content')])
+        truncated = zlib.compress(zlib.decompress(truncated)[:-1])
+        self.failUnlessRaises(cas.CAStoreError, list, cas.iter_pack(truncated))
+        return self.assertFailure(self.cas.put_pack('not a pack'), cas.CAStoreError)
+
+    @defer.inlineCallbacks
+    def test_get_many_not_found(self):
+        bid = yield self.cas.put(cas.Blob('test content'))
+        try:
+            yield self.cas.get_many([bid, sha1('not there', bin=False)])
+            self.fail()
+        except cas.CAStoreError:
+            pass
+
     @defer.inlineCallbacks
     def test_not_found(self):
         try:
@@ -226,3 +337,149 @@ class CAStoreTest(unittest.TestCase):
 
 
 
+
+    @defer.inlineCallbacks
+    def test_cache(self):
+        b = cas.Blob('cached content')
+        bid = yield self.cas.put(b)
+        b_out = yield self.cas.get(bid)
+        self.assertEqual(self.cas.cache.stats()['misses'], 1)
+        # A hit does not go to the backend
+        yield self.cas.backend.clear_store()
+        b_out2 = yield self.cas.get(bid)
+        self.assertIdentical(b_out, b_out2)
+        self.assertEqual(self.cas.cache.stats()['hits'], 1)
+
+    @defer.inlineCallbacks
+    def test_cache_copies(self):
+        b = cas.Blob('child content')
+        yield self.cas.put(b)
+        tid = yield self.cas.put(cas.Tree(cas.Element('child', b)))
+        self.cas.cache.clear()
+        t1 = yield self.cas.get(tid)
+        # What loading the tree does; the cached entry must not hold it
+        t1.children[0].obj = b
+        t2, = yield self.cas.get_many([tid])
+        self.failIfIdentical(t1, t2)
+        self.assertEqual(t2.children[0].obj, None)
+        self.assertEqual(t2.encode(), t1.encode())
+        c = cas.Commit(tid, ['a' * 40], log='copied')
+        cid = yield self.cas.put(c)
+        self.cas.cache.clear()
+        c1 = yield self.cas.get(cid)
+        c1.tree_obj = t1
+        c2 = yield self.cas.get(cid)
+        self.assertEqual(c2.tree_obj, None)
+        self.assertEqual((c2.tree, c2.parents, c2.log), (tid, ['a' * 40], 'copied'))
+
+    @defer.inlineCallbacks
+    def test_no_cache(self):
+        self.cas = cas.CAStore(self.cas.backend, cache_entries=0)
+        bid = yield self.cas.put(cas.Blob('not cached'))
+        yield self.cas.get(bid)
+        self.assertEqual(len(self.cas.cache), 0)
+
+class CompressionTest(unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.backend = yield store.Store.create_store()
+        self.cas = cas.CAStore(self.backend, compression='zlib', cache_entries=0)
+        self.content = 'compressible content ' * 100
+
+    @defer.inlineCallbacks
+    def test_compressed(self):
+        b = cas.Blob(self.content)
+        bid = yield self.cas.put(b)
+        # the address is the hash of the uncompressed encoding
+        self.assertEqual(bid, sha1(b.encode(), bin=False))
+        stored = yield self.cas.objs.get(bid)
+        self.failUnless(stored.startswith(cas.COMPRESSED + 'z'))
+        self.failUnless(len(stored) < len(b.encode()) / 10)
+        b_out = yield self.cas.get(bid)
+        self.assertEqual(b_out.content, self.content)
+
+    @defer.inlineCallbacks
+    def test_small(self):
+        b = cas.Blob('tiny')
+        bid = yield self.cas.put(b)
+        stored = yield self.cas.objs.get(bid)
+        self.assertEqual(stored, b.encode())
+
+    @defer.inlineCallbacks
+    def test_mixed(self):
+        plain = cas.CAStore(self.backend)
+        ids = yield plain.put_many([cas.Blob(self.content + 'plain')])
+        bid = yield self.cas.put(cas.Blob(self.content))
+        objs = yield plain.get_many([bid, ids[0]])
+        self.assertEqual(objs[0].content, self.content)
+        b_out = yield self.cas.get(ids[0])
+        self.assertEqual(b_out.content, self.content + 'plain')
+
+    @defer.inlineCallbacks
+    def test_unknown_codec(self):
+        self.failUnlessRaises(cas.CAStoreError, cas.CAStore, self.backend,
+                                compression='nonesuch')
+        bid = sha1(cas.Blob('x'), bin=False)
+        yield self.cas.objs.put(bid, cas.COMPRESSED + '?data')
+        try:
+            yield self.cas.get(bid)
+            self.fail()
+        except cas.CAStoreError:
+            pass
+
+class ObjectCacheTest(unittest.TestCase):
+
+    def test_lru_entries(self):
+        cache = cas.ObjectCache(max_entries=2)
+        cache.put('a', 1, 1)
+        cache.put('b', 2, 1)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3, 1)
+        # b was least recently used
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats(), {'entries':2, 'bytes':2, 'hits':3,
+                                         'misses':1, 'evictions':1})
+
+    def test_lru_bytes(self):
+        cache = cas.ObjectCache(max_bytes=10)
+        cache.put('a', 1, 6)
+        cache.put('b', 2, 6)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.bytes, 6)
+        cache.put('c', 3, 11)
+        self.assertEqual(cache.get('c'), None)
+        self.assertEqual(cache.get('b'), 2)
+
+class BloomFilterTest(unittest.TestCase):
+
+    def test_bloom(self):
+        bloom = cas.BloomFilter(capacity=1000, error_rate=0.01)
+        ids = [sha1(str(i), bin=False) for i in range(2000)]
+        for id in ids[:1000]:
+            bloom.add(id)
+        # no false negatives
+        for id in ids[:1000]:
+            self.failUnless(id in bloom)
+        false_positives = len([id for id in ids[1000:] if id in bloom])
+        self.failUnless(false_positives < 30)
+
+    def test_full(self):
+        bloom = cas.BloomFilter(capacity=2)
+        ids = [sha1(str(i), bin=False) for i in range(3)]
+        bloom.add(ids[0])
+        bloom.add(ids[0])
+        bloom.add(ids[1])
+        self.assertEqual(len(bloom), 2)
+        # full filters start over
+        bloom.add(ids[2])
+        self.assertEqual(len(bloom), 1)
+        self.failIf(ids[0] in bloom)
+        self.failUnless(ids[2] in bloom)
+
+    def test_disabled(self):
+        bloom = cas.BloomFilter(capacity=0)
+        bloom.add(sha1('a', bin=False))
+        self.failIf(sha1('a', bin=False) in bloom)
@@ -10,35 +10,62 @@
 from twisted.internet import defer
 from twisted.trial import unittest
 
+from ion.data import store
+from ion.data.datastore import objstore
 from ion.data.datastore.datastore_service import DataStoreServiceClient
 from ion.test.iontest import IonTestCase
+from ion.data.datastore.test.test_objstore import IdentityStore
 
 class DataStoreServiceTest(IonTestCase):
     """
-    Testing example hello service.
+    Testing push, pull and clone through the data store service.
     """
 
     @defer.inlineCallbacks
     def setUp(self):
         yield self._start_container()
+        services = [
+            {'name':'DataStoreService1','module':'ion.data.datastore.datastore_service','class':'DataStoreService'},
+        ]
+        self.sup = yield self._spawn_processes(services)
 
     @defer.inlineCallbacks
     def tearDown(self):
         yield self._stop_container()
 
+    @defer.inlineCallbacks
+    def _frontend(self, name):
+        objectstore = yield IdentityStore.new(store.Store(), name)
+        defer.returnValue(objectstore)
+
     @defer.inlineCallbacks
     def test_push_pull(self):
-        raise unittest.SkipTest('code not completed')
+        local = yield self._frontend('local')
+        obj = yield local.create('LongKeyForRepo', objstore.Identity)
+        ind = yield obj.checkout()
+        ind.name = 'Carlos S'
+        yield obj.commit()
 
-        services = [
-            {'name':'DataStoreService1','module':'ion.data.datastore.datastore_service','class':'DataStoreService','spawnargs':{'MyFrontend':'afrontend'}},
-        ]
+        rsc = DataStoreServiceClient(local, proc=self.sup)
+        count = yield rsc.push('LongKeyForRepo')
+        self.failUnless(count > 0)
+
+        other = yield self._frontend('other')
+        rsc2 = DataStoreServiceClient(other, proc=self.sup)
+        yield rsc2.clone('LongKeyForRepo')
 
-        sup = yield self._spawn_processes(services)
+        ind.email = 'carlos@ooici.biz'
+        yield obj.commit()
+        count = yield rsc.push('LongKeyForRepo')
+        # the commit, its tree and the email blob
+        self.assertEqual(count, 3)
 
-        rsc = DataStoreServiceClient('localFrontend',proc=sup)
-        yield rsc.push("LongKeyForRepo")
-        
-        yield rsc.pull("OtherLongKeyForRepo")
+        count = yield rsc2.pull('LongKeyForRepo')
+        self.assertEqual(count, 3)
+        obj2 = yield other.clone('LongKeyForRepo')
+        ind2 = yield obj2.checkout()
+        self.assertEqual(ind2.email, 'carlos@ooici.biz')
 
-        yield rsc.clone("OtherLongKeyForRepo")
+        # Nothing new
+        count = yield rsc2.pull('LongKeyForRepo')
+        self.assertEqual(count, 0)
@@ -12,16 +12,683 @@ from twisted.internet import defer
 from twisted.trial import unittest
 
 from ion.data import store
+from ion.data import dataobject
 from ion.data.datastore import cas
 from ion.data.datastore import objstore
 
 
 sha1 = cas.sha1
 
+dataobject.DataObject._types['Identity'] = objstore.Identity
+
+class CountingStore(store.Store):
+    """
+    Memory store that counts keys written, and round trips
+    """
+    def __init__(self, **kwargs):
+        store.Store.__init__(self, **kwargs)
+        self.puts = 0
+        self.calls = 0
+
+    def get(self, key):
+        self.calls += 1
+        return store.Store.get(self, key)
+
+    def get_many(self, keys):
+        self.calls += 1
+        return store.Store.get_many(self, keys)
+
+    def put(self, key, value):
+        self.puts += 1
+        self.calls += 1
+        return store.Store.put(self, key, value)
+
+    def put_many(self, items):
+        self.puts += len(items)
+        self.calls += 1
+        return store.Store.put_many(self, items)
+
+    def exists_many(self, keys):
+        self.calls += 1
+        return store.Store.exists_many(self, keys)
+
+    def query_prefix(self, prefix, regex):
+        self.calls += 1
+        return store.Store.query_prefix(self, prefix, regex)
+
+class DelayedRemoveStore(store.Store):
+    """
+    Memory store whose removes complete when the test fires them
+    """
+    def __init__(self, **kwargs):
+        store.Store.__init__(self, **kwargs)
+        self.removing = []
+
+    def remove_many(self, keys):
+        d = defer.Deferred()
+        d.addCallback(lambda _: store.Store.remove_many(self, keys))
+        self.removing.append(d)
+        return d
+
+class IdentityChassis(objstore.ObjectChassis):
+    objectClass = objstore.Identity
+
+class IdentityStore(objstore.ObjectStore):
+    objectChassis = IdentityChassis
+
 class ObjectChassisTest(unittest.TestCase):
     """
     """
 
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.backend_store = CountingStore()
+        self.object_store = yield IdentityStore.new(self.backend_store, 'test_namespace')
+        self.obj = yield self.object_store.create('thing', objstore.Identity)
+        ind = yield self.obj.checkout()
+        ind.name = 'Carlos S'
+        ind.email = 'carlos@ooici.biz'
+        ind.age = 36
+        yield self.obj.commit()
+
+    @defer.inlineCallbacks
+    def test_commit_changed(self):
+        ind = yield self.obj.checkout()
+        ind.age = 37
+        puts = self.backend_store.puts
+        yield self.obj.commit()
+        # one blob, the tree, the commit, its commit graph entry and the
+        # head ref
+        self.assertEqual(self.backend_store.puts - puts, 5)
+        ind2 = yield self.obj.checkout()
+        self.assertEqual(ind2.age, 37)
+        self.assertEqual(ind2.name, 'Carlos S')
+        self.assertEqual(ind2.email, 'carlos@ooici.biz')
+
+    @defer.inlineCallbacks
+    def test_commit_same_value(self):
+        ind = yield self.obj.checkout()
+        ind.name = 'Carlos S'
+        puts = self.backend_store.puts
+        yield self.obj.commit()
+        # the tree is already stored; the commit, graph entry and head ref
+        self.assertEqual(self.backend_store.puts - puts, 3)
+
+    @defer.inlineCallbacks
+    def test_commit_existing_blobs(self):
+        # A store without the filter of known ids asks the backend
+        objstore2 = yield IdentityStore.load(self.backend_store, 'test_namespace')
+        obj2 = yield objstore2.clone('thing')
+        ind = yield obj2.checkout()
+        objstore2.known.clear()
+        ind.age = 36
+        puts = self.backend_store.puts
+        yield obj2.commit()
+        self.assertEqual(self.backend_store.puts - puts, 3)
+
+    @defer.inlineCallbacks
+    def test_round_trips(self):
+        ind = yield self.obj.checkout()
+        ind.age = 37
+        ind.name = 'Carlos'
+        ind.email = 'carlos@ooici.com'
+        calls = self.backend_store.calls
+        yield self.obj.commit()
+        # exists and write of blobs, tree and commit; write of the commit
+        # graph entry and head ref
+        self.assertEqual(self.backend_store.calls - calls, 3)
+        self.obj.objstore.cache.clear()
+        calls = self.backend_store.calls
+        yield self.obj.checkout()
+        # head ref, commit, tree and all blobs
+        self.assertEqual(self.backend_store.calls - calls, 4)
+
+    @defer.inlineCallbacks
+    def test_commit_twice(self):
+        ind = yield self.obj.checkout()
+        ind.age = 37
+        yield self.obj.commit()
+        ind.email = 'carlos@ooici.com'
+        yield self.obj.commit()
+        ind2 = yield self.obj.checkout()
+        self.assertEqual(ind2, ind)
+
+    @defer.inlineCallbacks
+    def test_commit_to_other_store(self):
+        ind = yield self.obj.checkout()
+        ind.age = 37
+        other_store = yield IdentityStore.new(self.backend_store, 'other_namespace')
+        other = yield other_store.create('thing', objstore.Identity)
+        yield other.checkout()
+        other.index = ind
+        yield other.commit()
+        ind2 = yield other.checkout()
+        self.assertEqual(ind2, ind)
+
+    @defer.inlineCallbacks
+    def test_store_key(self):
+        key = self.obj._store_key()
+        self.failUnless(self.obj._in_store(key))
+        # The key holds the backend, so its id is not reused while the base
+        # tree is tracked; another backend of the same namespace differs.
+        self.failUnless(key[0] is self.backend_store)
+        ind = yield self.obj.checkout()
+        ind.age = 37
+        other_store = yield IdentityStore.new(store.Store(), 'test_namespace')
+        other = yield other_store.create('thing', objstore.Identity)
+        self.failIf(other._in_store(key))
+        other.index = ind
+        yield other.commit()
+        ind2 = yield other.checkout()
+        self.assertEqual(ind2, ind)
+
+class LazyCheckoutTest(unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.backend_store = CountingStore()
+        self.object_store = yield IdentityStore.new(self.backend_store, 'test_namespace')
+        self.obj = yield self.object_store.create('thing', objstore.Identity)
+        ind = yield self.obj.checkout()
+        ind.name = 'Carlos S'
+        ind.email = 'carlos@ooici.biz'
+        ind.age = 36
+        yield self.obj.commit()
+        self.object_store.cache.clear()
+
+    @defer.inlineCallbacks
+    def test_prefetch(self):
+        calls = self.backend_store.calls
+        ind = yield self.obj.checkout(prefetch=['name'])
+        # head ref, commit, tree and the type and name blobs
+        self.assertEqual(self.backend_store.calls - calls, 4)
+        self.assertEqual(ind.name, 'Carlos S')
+        self.assertEqual(self.backend_store.calls - calls, 4)
+        # the others are read with load_fields, not on access
+        self.assertRaises(objstore.ObjectStoreError, getattr, ind, 'age')
+        self.assertEqual(self.backend_store.calls - calls, 4)
+        yield self.obj.load_fields(['age'])
+        self.assertEqual(ind.age, 36)
+        self.assertEqual(self.backend_store.calls - calls, 5)
+
+    @defer.inlineCallbacks
+    def test_load_fields(self):
+        ind = yield self.obj.checkout(prefetch=[])
+        calls = self.backend_store.calls
+        yield self.obj.load_fields()
+        self.assertEqual(self.backend_store.calls - calls, 1)
+        self.assertEqual(ind.email, 'carlos@ooici.biz')
+        self.assertEqual(ind.age, 36)
+        self.assertEqual(self.backend_store.calls - calls, 1)
+
+    @defer.inlineCallbacks
+    def test_commit_unread(self):
+        ind = yield self.obj.checkout(prefetch=[])
+        ind.age = 37
+        calls = self.backend_store.calls
+        yield self.obj.commit()
+        self.assertEqual(self.backend_store.calls - calls, 3)
+        ind2 = yield self.obj.checkout()
+        self.assertEqual(ind2.age, 37)
+        self.assertEqual(ind2.name, 'Carlos S')
+
+    @defer.inlineCallbacks
+    def test_not_loaded(self):
+        # Reading an unloaded field fails the same way whether or not the
+        # backend (or the cache) could answer right away
+        yield self.obj.checkout()
+        ind = yield self.obj.checkout(prefetch=[])
+        self.assertRaises(objstore.ObjectStoreError, getattr, ind, 'name')
+        self.assertRaises(objstore.ObjectStoreError, ind.encode)
+        self.object_store.cache.clear()
+        ind = yield self.obj.checkout(prefetch=[])
+        self.assertRaises(objstore.ObjectStoreError, getattr, ind, 'name')
+        yield self.obj.load_fields()
+        self.assertEqual(ind.name, 'Carlos S')
+
+class GarbageCollectTest(unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.backend_store = store.Store()
+        # No wait for other processes before the sweep
+        self.object_store = yield IdentityStore.new(self.backend_store,
+                                        'test_namespace', known_ttl=0)
+        self.obj = yield self.object_store.create('thing', objstore.Identity)
+        ind = yield self.obj.checkout()
+        ind.name = 'Carlos S'
+        ind.email = 'carlos@ooici.biz'
+        for age in (36, 37, 38):
+            ind.age = age
+            yield self.obj.commit()
+
+    def _objects(self):
+        return self.object_store.objs.query('([0-9a-f]{40})$')
+
+    @defer.inlineCallbacks
+    def _check_head(self, ncommits):
+        obj = yield self.object_store.clone('thing')
+        ind = yield obj.checkout()
+        self.assertEqual(ind.age, 38)
+        self.assertEqual(ind.name, 'Carlos S')
+        history = yield obj.get_commit_history()
+        self.assertEqual(len(history), ncommits)
+
+    @defer.inlineCallbacks
+    def test_all_reachable(self):
+        before = yield self._objects()
+        result = yield self.object_store.collect_garbage()
+        self.assertEqual(result, {'objects':len(before), 'removed':0, 'bytes':0})
+        yield self._check_head(3)
+
+    @defer.inlineCallbacks
+    def test_unreachable(self):
+        blob = objstore.Blob('not referenced')
+        id = yield self.object_store.put(blob)
+        result = yield self.object_store.collect_garbage(batch_size=2)
+        self.assertEqual(result['removed'], 1)
+        self.assertEqual(result['bytes'], len(blob.encode()))
+        found = yield self.object_store.objs.exists(id)
+        self.failIf(found)
+        yield self._check_head(3)
+        # Can be stored again
+        yield self.object_store.put(blob)
+        found = yield self.object_store.objs.exists(id)
+        self.failUnless(found)
+
+    @defer.inlineCallbacks
+    def test_keep_commits(self):
+        result = yield self.object_store.collect_garbage(keep_commits=1)
+        # two commits, their trees and the blobs of ages 36 and 37
+        self.assertEqual(result['removed'], 6)
+        yield self._check_head(1)
+        # the entries of the dropped commits go too; the kept one is a root
+        keys = yield self.obj.keyspace.query_prefix('graph.', '(.*)$')
+        self.assertEqual(len(keys), 1)
+        self.assertEqual(objstore.CommitGraph.decode(keys).parents(keys[0].split('.')[0]), [])
+
+    @defer.inlineCallbacks
+    def test_keep_commits_shallow(self):
+        yield self.object_store.collect_garbage(keep_commits=1)
+        head = yield self.obj.get_head()
+        shallow = yield self.obj.get_shallow()
+        self.assertEqual(shallow, set([head]))
+        # Walks stop at the shallow commit instead of reading its parents
+        commits, shallow = yield self.obj.walk_commits([head])
+        self.assertEqual([id for id, c in commits], [head])
+        keys = yield self.obj.keyspace.query_prefix('graph.', '(.*)$')
+        yield self.obj.keyspace.remove_many(['graph.' + key for key in keys])
+        graph = yield self.obj.get_graph()
+        self.assertEqual(graph.parents(head), [])
+
+        # The pruned history packs, and is shallow where it is received
+        remote = yield IdentityStore.new(store.Store(), 'remote', known_ttl=0)
+        packed = yield self.object_store.make_pack('thing', include_object=True)
+        self.assertEqual(packed['shallow'], [head])
+        yield remote.receive_pack('thing', packed['pack'], packed['object'],
+                                    packed['head'], shallow=packed['shallow'])
+        obj = yield remote.clone('thing')
+        ind = yield obj.checkout()
+        self.assertEqual(ind.age, 38)
+        history = yield obj.get_commit_history()
+        self.assertEqual(len(history), 1)
+        shallow = yield obj.get_shallow()
+        self.assertEqual(shallow, set([head]))
+
+        # A full collection does not look for the removed parents
+        result = yield self.object_store.collect_garbage()
+        self.assertEqual(result['removed'], 0)
+
+        # Pruned again, the marker moves to the new oldest commit
+        ind = yield self.obj.checkout()
+        ind.age = 39
+        new_head = yield self.obj.commit()
+        yield self.object_store.collect_garbage(keep_commits=1)
+        shallow = yield self.obj.get_shallow()
+        self.assertEqual(shallow, set([new_head]))
+        history = yield self.obj.get_commit_history()
+        self.assertEqual(len(history), 1)
+
+    @defer.inlineCallbacks
+    def test_other_store_known(self):
+        # A store on the partition in another process holds the id of an
+        # object the collection deletes in its known filter
+        other = yield IdentityStore.load(self.backend_store, 'test_namespace',
+                                            known_ttl=0)
+        blob = objstore.Blob('not referenced')
+        id = yield other.put(blob)
+        result = yield self.object_store.collect_garbage()
+        self.assertEqual(result['removed'], 1)
+        # It reads the new sweep epoch and writes the object again
+        yield other.put(blob)
+        found = yield self.object_store.objs.exists(id)
+        self.failUnless(found)
+
+    @defer.inlineCallbacks
+    def test_incremental(self):
+        d = self.object_store.collect_garbage(keep_commits=1, batch_size=1,
+                                                incremental=True)
+        self.failIf(d.called)
+        # A commit while the collection runs, back to an old value
+        ind = yield self.obj.checkout()
+        ind.age = 36
+        yield self.obj.commit()
+        yield d
+        obj = yield self.object_store.clone('thing')
+        ind = yield obj.checkout()
+        self.assertEqual(ind.age, 36)
+
+    @defer.inlineCallbacks
+    def test_put_during_remove(self):
+        backend = DelayedRemoveStore()
+        object_store = yield IdentityStore.new(backend, 'test_namespace', known_ttl=0)
+        blob = objstore.Blob('not referenced')
+        id = yield object_store.put(blob)
+        d = object_store.collect_garbage()
+        self.assertEqual(len(backend.removing), 1)
+        # The delete is in flight; the backend still holds the blob, so
+        # this put does not write it
+        yield object_store.put(blob)
+        backend.removing[0].callback(None)
+        result = yield d
+        self.assertEqual(result['removed'], 0)
+        found = yield object_store.objs.exists(id)
+        self.failUnless(found)
+
+class IndexedIdentityStore(IdentityStore):
+    indexed_attributes = ('name', 'email')
+
+class AttributeIndexTest(unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.backend_store = store.Store()
+        yield self._make('test_namespace', IdentityStore)
+
+    @defer.inlineCallbacks
+    def _make(self, partition, storeClass):
+        object_store = yield storeClass.new(self.backend_store, partition)
+        people = [('a', 'Carlos S', 'carlos@ooici.biz'),
+                  ('b', 'Carlos S', 'cs@ooici.biz'),
+                  ('c', 'Dorian R', 'dorian@ooici.biz')]
+        for name, person, email in people:
+            obj = yield object_store.create(name, objstore.Identity)
+            ind = yield obj.checkout()
+            ind.name = person
+            ind.email = email
+            yield obj.commit()
+        defer.returnValue(object_store)
+
+    def _find(self, object_store, **atts):
+        ind = objstore.Identity()
+        for att, value in atts.items():
+            setattr(ind, att, value)
+        return object_store.find_indexed(ind, atts.keys())
+
+    @defer.inlineCallbacks
+    def test_find(self):
+        object_store = yield self._make('indexed', IndexedIdentityStore)
+        found = yield self._find(object_store, name='Carlos S')
+        self.assertEqual(found, set(['a', 'b']))
+        found = yield self._find(object_store, name='Carlos S', email='cs@ooici.biz')
+        self.assertEqual(found, set(['b']))
+        found = yield self._find(object_store, name='Nobody')
+        self.assertEqual(found, set())
+
+    @defer.inlineCallbacks
+    def test_update(self):
+        object_store = yield self._make('indexed', IndexedIdentityStore)
+        obj = yield object_store.clone('a')
+        ind = yield obj.checkout()
+        ind.email = 'carlos@ooici.org'
+        yield obj.commit()
+        found = yield self._find(object_store, email='carlos@ooici.biz')
+        self.assertEqual(found, set())
+        found = yield self._find(object_store, email='carlos@ooici.org')
+        self.assertEqual(found, set(['a']))
+        # An unindexed attribute changes no entry
+        keys = yield object_store.indexes.query('(.*)$')
+        ind.age = 36
+        yield obj.commit()
+        self.assertEqual(sorted((yield object_store.indexes.query('(.*)$'))), sorted(keys))
+
+    @defer.inlineCallbacks
+    def test_rebuild(self):
+        # Objects committed before the attributes were indexed
+        keys = yield IdentityStore(self.backend_store, 'test_namespace').indexes.query('(.*)$')
+        self.assertEqual(keys, [])
+        object_store = IndexedIdentityStore(self.backend_store, 'test_namespace')
+        found = yield self._find(object_store, name='Dorian R')
+        self.assertEqual(found, set(['c']))
+        keys = yield object_store.indexes.query('(.*)$')
+        self.assertEqual(len(keys), 6)
+
+    @defer.inlineCallbacks
+    def test_commit_unindexed(self):
+        self.backend_store = CountingStore()
+        object_store = yield self._make('indexed', IndexedIdentityStore)
+        obj = yield object_store.clone('a')
+        ind = yield obj.checkout()
+        ind.age = 40
+        object_store.cache.clear()
+        obj.graph = None
+        calls = self.backend_store.calls
+        yield obj.commit()
+        # the head commit (for the tree the index is of), exists and write
+        # of the objects, parent graph entry, graph entry and head; the
+        # indexes are not touched
+        self.assertEqual(self.backend_store.calls - calls, 5)
+        found = yield self._find(object_store, name='Carlos S')
+        self.assertEqual(found, set(['a', 'b']))
+        ind.email = 'cs@ooici.biz'
+        yield obj.commit()
+        found = yield self._find(object_store, email='cs@ooici.biz')
+        self.assertEqual(found, set(['a', 'b']))
+        found = yield self._find(object_store, email='carlos@ooici.biz')
+        self.assertEqual(found, set())
+
+    @defer.inlineCallbacks
+    def test_commit_many(self):
+        self.backend_store = CountingStore()
+        object_store = yield self._make('indexed', IndexedIdentityStore)
+        chassis = yield object_store.clone_many(['a', 'd', 'e'], objstore.Identity)
+        self.assertEqual([obj.cur_commit is None for obj in chassis], [False, True, True])
+        for obj, email in zip(chassis, ['carlos@ooici.org', 'd@ooici.org', 'e@ooici.org']):
+            obj.index = objstore.Identity()
+            obj.index.name = 'Ocean Observer'
+            obj.index.email = email
+        calls = self.backend_store.calls
+        commit_ids = yield object_store.commit_many(chassis)
+        # Batched: the round trips do not grow with the number of objects
+        self.assertEqual(self.backend_store.calls - calls, 7)
+        history = yield chassis[0].get_commit_history()
+        self.assertEqual(len(history), 2)
+        obj = yield object_store.clone('e')
+        ind = yield obj.checkout()
+        self.assertEqual(ind.email, 'e@ooici.org')
+        self.assertEqual(obj.cur_commit, commit_ids[2])
+        found = yield self._find(object_store, name='Ocean Observer')
+        self.assertEqual(found, set(['a', 'd', 'e']))
+        found = yield self._find(object_store, email='carlos@ooici.biz')
+        self.assertEqual(found, set())
+
+class CommitGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        # a - b - c - e
+        #      \- d -/
+        self.graph = objstore.CommitGraph()
+        self.graph.add_commits([('e', ['c', 'd'], 5), ('d', ['b'], 4),
+                                ('c', ['b'], 3), ('b', ['a'], 2), ('a', [], 1)])
+
+    def test_generation(self):
+        self.assertEqual([self.graph.generation(id) for id in 'abcde'], [1, 2, 3, 3, 4])
+        self.assertEqual(self.graph.timestamp('d'), 4)
+
+    def test_history(self):
+        self.assertEqual(self.graph.history('e'), ['e', 'c', 'b', 'a'])
+        self.assertEqual(self.graph.ancestors('d'), set('abd'))
+
+    def test_is_ancestor(self):
+        self.failUnless(self.graph.is_ancestor('a', 'e'))
+        self.failUnless(self.graph.is_ancestor('d', 'e'))
+        self.failUnless(self.graph.is_ancestor('c', 'c'))
+        self.failIf(self.graph.is_ancestor('c', 'd'))
+        self.failIf(self.graph.is_ancestor('e', 'a'))
+
+    def test_merge_base(self):
+        self.assertEqual(self.graph.merge_base('c', 'd'), 'b')
+        self.assertEqual(self.graph.merge_base('e', 'd'), 'd')
+        self.graph.add('x', [])
+        self.assertEqual(self.graph.merge_base('x', 'e'), None)
+
+    def test_entry_keys(self):
+        self.graph.add('f', ['e'])
+        graph = objstore.CommitGraph.decode(self.graph.entry_keys())
+        self.assertEqual(graph.entries, self.graph.entries)
+        self.assertEqual(self.graph.entry_key('e'), 'e.4.c,d.5')
+        self.assertEqual(self.graph.entry_key('f'), 'f.5.e.')
+
+class ChassisGraphTest(unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.backend_store = CountingStore()
+        self.object_store = yield IdentityStore.new(self.backend_store, 'test_namespace')
+        self.obj = yield self.object_store.create('thing', objstore.Identity)
+        ind = yield self.obj.checkout()
+        self.commits = []
+        for age in range(5):
+            ind.age = age
+            self.commits.append((yield self.obj.commit()))
+
+    @defer.inlineCallbacks
+    def test_history(self):
+        obj = yield self.object_store.clone('thing')
+        self.object_store.cache.clear()
+        calls = self.backend_store.calls
+        history = yield obj.get_commit_history()
+        # head ref, graph entries and the commits
+        self.assertEqual(self.backend_store.calls - calls, 3)
+        self.assertEqual([sha1(c, bin=False) for c in history], self.commits[::-1])
+        self.assertEqual(history[-1].parents, [])
+
+    @defer.inlineCallbacks
+    def test_branches(self):
+        base = self.commits[2]
+        branch = yield self.object_store.clone('thing')
+        ind = yield branch.checkout(commit_id=base)
+        ind.age = 100
+        branch_commit = yield branch.commit()
+        yield branch.update_head(self.commits[-1])
+        merge_base = yield self.obj.merge_base(self.commits[-1], branch_commit)
+        self.assertEqual(merge_base, base)
+        is_ancestor = yield self.obj.is_ancestor(base, branch_commit)
+        self.failUnless(is_ancestor)
+        is_ancestor = yield self.obj.is_ancestor(self.commits[3], branch_commit)
+        self.failIf(is_ancestor)
+
+    @defer.inlineCallbacks
+    def test_graph_entries(self):
+        # one entry per commit; a commit writes only its own
+        keys = yield self.obj.keyspace.query_prefix('graph.', '(.*)$')
+        self.assertEqual(sorted(k.split('.')[0] for k in keys), sorted(self.commits))
+        ind = yield self.obj.checkout()
+        ind.age = 100
+        commit_id = yield self.obj.commit()
+        keys2 = yield self.obj.keyspace.query_prefix('graph.', '(.*)$')
+        self.assertEqual(set(keys2) - set(keys),
+                        set([self.obj.graph.entry_key(commit_id)]))
+        self.assertEqual(self.obj.graph.parents(commit_id), [self.commits[-1]])
+
+    @defer.inlineCallbacks
+    def test_no_graph(self):
+        # histories from before the graph are added to it on first use
+        keys = yield self.obj.keyspace.query_prefix('graph.', '(.*)$')
+        yield self.obj.keyspace.remove_many(['graph.' + key for key in keys])
+        obj = yield self.object_store.clone('thing')
+        history = yield obj.get_commit_history()
+        self.assertEqual(len(history), 5)
+        graph = yield obj.get_graph()
+        self.assertEqual(graph.generation(self.commits[-1]), 5)
+        self.assertEqual(graph.timestamp(self.commits[-1]), None)
+
+class PackTest(unittest.TestCase):
+    """
+    Moving object histories between object stores in packs
+    """
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.local = yield IdentityStore.new(store.Store(), 'local')
+        self.remote = yield IdentityStore.new(store.Store(), 'remote')
+        self.obj = yield self.local.create('thing', objstore.Identity)
+        ind = yield self.obj.checkout()
+        ind.name = 'Carlos S'
+        ind.email = 'carlos@ooici.biz'
+        yield self.obj.commit()
+
+    @defer.inlineCallbacks
+    def _transfer(self, src, dst, have=(), include_object=False):
+        packed = yield src.make_pack('thing', have, include_object)
+        yield dst.receive_pack('thing', packed['pack'], packed['object'], packed['head'])
+        defer.returnValue(packed)
+
+    @defer.inlineCallbacks
+    def test_clone_and_pull(self):
+        packed = yield self._transfer(self.local, self.remote, include_object=True)
+        obj2 = yield self.remote.clone('thing')
+        ind2 = yield obj2.checkout()
+        self.assertEqual(ind2.name, 'Carlos S')
+
+        ind = yield self.obj.checkout()
+        ind.age = 37
+        yield self.obj.commit()
+        packed = yield self._transfer(self.local, self.remote, have=[obj2.cur_commit])
+        # the commit, its tree and the age blob
+        self.assertEqual(packed['count'], 3)
+        ind2 = yield obj2.checkout()
+        self.assertEqual(ind2, ind)
+        history = yield obj2.get_commit_history()
+        self.assertEqual(len(history), 2)
+
+    @defer.inlineCallbacks
+    def test_not_fast_forward(self):
+        yield self._transfer(self.local, self.remote, include_object=True)
+        obj2 = yield self.remote.clone('thing')
+        ind2 = yield obj2.checkout()
+        ind2.age = 1
+        yield obj2.commit()
+        ind = yield self.obj.checkout()
+        ind.age = 2
+        yield self.obj.commit()
+        stored = yield self.remote.objs.query('([0-9a-f]{40})$')
+        try:
+            yield self._transfer(self.local, self.remote)
+            self.fail()
+        except objstore.ObjectStoreError:
+            pass
+        # A rejected pack leaves nothing behind
+        self.assertEqual(len((yield self.remote.objs.query('([0-9a-f]{40})$'))), len(stored))
+
+    @defer.inlineCallbacks
+    def test_pull_when_ahead(self):
+        yield self._transfer(self.local, self.remote, include_object=True)
+        ind = yield self.obj.checkout()
+        ind.age = 2
+        commit_id = yield self.obj.commit()
+        yield self._transfer(self.remote, self.local, have=[commit_id])
+        head = yield self.obj.get_head()
+        self.assertEqual(head, commit_id)
+
+    @defer.inlineCallbacks
+    def test_missing_object(self):
+        try:
+            yield self._transfer(self.local, self.remote)
+            self.fail()
+        except objstore.ObjectStoreError:
+            pass
+
 class ObjectStoreTest(unittest.TestCase):
 
     @defer.inlineCallbacks
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+@file ion/data/datastore/test/test_query.py
+@brief test registry queries
+"""
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from ion.data import dataobject
+from ion.data.datastore import query
+
+class Station(dataobject.Resource):
+    depth = dataobject.TypedAttribute(float)
+
+dataobject.DataObject._types['Station'] = Station
+
+def station(name, depth, lcstate='new'):
+    res = Station()
+    res.name = name
+    res.depth = depth
+    res.lifecycle = dataobject.LCStates[lcstate]
+    return res
+
+class QueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stations = [station('buoy_1', 10.0),
+                         station('buoy_2', 50.0, 'active'),
+                         station('glider_1', 200.0, 'active')]
+
+    def _names(self, pred):
+        return [s.name for s in self.stations if query.match(pred, s)]
+
+    def test_attribute_ops(self):
+        self.assertEqual(self._names(query.eq('name', 'buoy_1')), ['buoy_1'])
+        self.assertEqual(self._names(query.in_('name', ['buoy_1', 'glider_1'])), ['buoy_1', 'glider_1'])
+        self.assertEqual(self._names(query.regex('name', '_[2-9]')), ['buoy_2'])
+        self.assertEqual(self._names(query.prefix('name', 'buoy')), ['buoy_1', 'buoy_2'])
+        self.assertEqual(self._names(query.between('depth', 10.0, 200.0)), ['buoy_1', 'buoy_2'])
+        self.assertEqual(self._names(query.gt('depth', 10.0)), ['buoy_2', 'glider_1'])
+        self.assertEqual(self._names(query.le('depth', 50.0)), ['buoy_1', 'buoy_2'])
+        # An attribute a resource does not have matches nothing
+        self.assertEqual(self._names(query.eq('publisher', 'x')), [])
+
+    def test_boolean_ops(self):
+        pred = query.and_(query.prefix('name', 'buoy'),
+                          query.eq('lifecycle', dataobject.LCStates.active))
+        self.assertEqual(self._names(pred), ['buoy_2'])
+        pred = query.or_(query.eq('name', 'buoy_1'), query.ge('depth', 100.0))
+        self.assertEqual(self._names(pred), ['buoy_1', 'glider_1'])
+        self.assertEqual(self._names(query.not_(query.prefix('name', 'buoy'))), ['glider_1'])
+        self.assertEqual(query.attributes(pred), set(['name', 'depth']))
+
+    def test_lcstate_by_name(self):
+        # Message encodings can turn life cycle states into their names
+        self.assertEqual(self._names(query.in_('lifecycle', ['active'])), ['buoy_2', 'glider_1'])
+
+    def test_check(self):
+        query.check(query.and_(query.eq('name', 'a'), query.between('depth', 1, 2)))
+        self.assertRaises(query.QueryError, query.check, query.and_())
+        self.assertRaises(query.QueryError, query.check, query._predicate('like', 'name', ['a']))
+        self.assertRaises(query.QueryError, query.check, query._predicate('range', 'depth', [1]))
+        self.assertRaises(query.QueryError, query.check, query.regex('name', '('))
+
+    @defer.inlineCallbacks
+    def test_candidates(self):
+        index = {('name', 'buoy_1'):set(['a']), ('name', 'buoy_2'):set(['b'])}
+        lookups = []
+        def lookup(att, value):
+            lookups.append((att, value))
+            return defer.succeed(index.get((att, value), set()))
+        indexed = ('name',)
+        names = yield query.candidates(query.in_('name', ['buoy_1', 'buoy_2']), lookup, indexed)
+        self.assertEqual(names, set(['a', 'b']))
+        pred = query.and_(query.eq('name', 'buoy_1'), query.gt('depth', 1.0))
+        names = yield query.candidates(pred, lookup, indexed)
+        self.assertEqual(names, set(['a']))
+        # A term needing a scan makes the whole or need one
+        pred = query.or_(query.eq('name', 'buoy_1'), query.gt('depth', 1.0))
+        names = yield query.candidates(pred, lookup, indexed)
+        self.assertEqual(names, None)
+        names = yield query.candidates(query.prefix('name', 'b'), lookup, indexed)
+        self.assertEqual(names, None)
+        self.assertEqual(len(lookups), 4)
+
+    def test_sort_and_project(self):
+        query.sort(self.stations, ['lifecycle', '-depth'])
+        self.assertEqual([s.name for s in self.stations], ['glider_1', 'buoy_2', 'buoy_1'])
+        part = query.project(self.stations[0], ['name'])
+        self.assertEqual(type(part), Station)
+        self.assertEqual(part.name, 'glider_1')
+        self.assertEqual(part.depth, 0.0)
+
+    def test_project_encoding(self):
+        part = query.project(self.stations[2], ['name', 'depth'])
+        self.assertEqual(sorted([name for name, value in part.encode()]),
+                            ['Object_Type', 'depth', 'name'])
+        for ser in ('alpha', 'dencoder', 'jsond', 'msgpack-dataobject',
+                    'msgpack-compact'):
+            encoding, _, data = dataobject.serializer.encode(part, serializer=ser)
+            dec = dataobject.serializer.decode(data, encoding)
+            self.assertEqual((dec.name, dec.depth), ('glider_1', 200.0))
+            self.assertEqual(dec.lifecycle, dataobject.LCStates.new)
+        # A field not decoded yet is copied encoded
+        res = Station()
+        res._depth = dataobject.LazyValue(
+                Station.get_codec().encode_field(self.stations[2], 'depth'))
+        part = query.project(res, ['depth'])
+        self.failUnless(part._depth is res._depth)
+        self.assertEqual(part.depth, 200.0)
+
+    def test_encode(self):
+        q = query.Query()
+        q.where = query.and_(query.in_('lifecycle', [dataobject.LCStates.new]),
+                             query.not_(query.regex('name', '^buoy')))
+        q.fields = ['name']
+        q.sort = ['-name']
+        q.limit = 20
+        encoding, _, data = dataobject.serializer.encode(q)
+        q2 = dataobject.serializer.decode(data, encoding)
+        self.assertEqual(q2, q)
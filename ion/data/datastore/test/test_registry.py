@@ -10,6 +10,7 @@ from ion.data import store
 from ion.data.backends import store_service
 from ion.data.backends import cassandra
 from ion.data.datastore import registry
+from ion.data.datastore import query
 from ion.data import dataobject
 
 
@@ -85,6 +86,34 @@ class RegistryTest(unittest.TestCase):
         res1 = yield self.reg.get_resource(ref1)
         self.assertEqual(res1.name, 'foo')
         
+    @defer.inlineCallbacks
+    def test_register_resources(self):
+        res1 = dataobject.Resource.create_new_resource()
+        res1.name = 'foo'
+        res1 = yield self.reg.register_resource(res1)
+        ref1 = res1.reference()
+
+        resources = []
+        for name in ('moo', 'moo'):
+            res = dataobject.Resource.create_new_resource()
+            res.name = name
+            resources.append(res)
+        res1.name = 'foo2'
+        resources.append(res1)
+        resources = yield self.reg.register_resources(resources)
+        self.assertEqual(len(resources), 3)
+
+        for res in resources:
+            res2 = yield self.reg.get_resource(res.reference())
+            self.assertEqual(res2, res)
+        res2 = yield self.reg.get_resource(ref1)
+        self.assertEqual(res2.name, 'foo')
+
+        blank = dataobject.Resource()
+        blank.name = 'moo'
+        results = yield self.reg.find_resource(blank,regex=False,attnames=['name',])
+        self.assertEqual(len(results), 2)
+
     def test_register_select_ancestor(self):
         raise unittest.SkipTest('Not implimented yet!')
 
@@ -166,8 +195,142 @@ class RegistryTest(unittest.TestCase):
         results = yield self.reg.find_resource(blank,attnames=['name',])
         self.assertNotIn(res1, results)
         self.assertIn(res2, results)
+
+    @defer.inlineCallbacks
+    def test_get_resource_cached(self):
+        res = dataobject.Resource.create_new_resource()
+        res.name = 'foo'
+        res = yield self.reg.register_resource(res)
+        ref1 = res.reference()
+
+        res1 = yield self.reg.get_resource(res.reference(head=True))
+        res2 = yield self.reg.get_resource(res.reference(head=True))
+        self.assertEqual(res1, res)
+        self.assertEqual(res2, res)
+        # Each get decodes its own copy
+        res1.name = 'changed'
+        self.assertEqual(res2.name, 'foo')
+
+        # The head moves; the pinned commit still reads the old state
+        yield self.reg.set_resource_lcstate_active(ref1)
+        res = yield self.reg.get_resource(res.reference(head=True))
+        self.assertEqual(res.lifecycle, dataobject.LCStates.active)
+        res = yield self.reg.get_resource(ref1)
+        self.assertEqual(res.lifecycle, dataobject.LCStates.new)
+
+        # A commit of a resource does not make an unknown identity exist
+        ref1.RegistryIdentity = 'not registered'
+        res = yield self.reg.get_resource(ref1)
+        self.assertEqual(res, None)
+
+    @defer.inlineCallbacks
+    def test_registry_find_indexed(self):
+
+        res1 = dataobject.Resource.create_new_resource()
+        res1.name = 'foo'
+        res1 = yield self.reg.register_resource(res1)
+
+        res2 = dataobject.Resource.create_new_resource()
+        res2.name = 'moo'
+        res2 = yield self.reg.register_resource(res2)
+
+        blank = dataobject.Resource()
+        blank.name = 'foo'
+        results = yield self.reg.find_resource(blank,regex=False,attnames=['name',])
+        self.assertEqual(results, [res1])
+
+        # The entries of the old lifecycle state go with the new commit
+        yield self.reg.set_resource_lcstate_active(res1.reference())
+        blank = dataobject.Resource()
+        blank.lifecycle = dataobject.LCStates.active
+        results = yield self.reg.find_resource(blank,regex=False)
+        self.assertEqual([r.name for r in results], ['foo'])
+
+        blank.lifecycle = dataobject.LCStates.new
+        results = yield self.reg.find_resource(blank,regex=False,ignore_defaults=False,attnames=['lifecycle',])
+        self.assertEqual([r.name for r in results], ['moo'])
+
         
-        
+
+    @defer.inlineCallbacks
+    def test_query_resource(self):
+        for name in ('buoy_1', 'buoy_2', 'glider_1'):
+            res = dataobject.Resource.create_new_resource()
+            res.name = name
+            res = yield self.reg.register_resource(res)
+        yield self.reg.set_resource_lcstate_active(res.reference())
+
+        q = query.Query()
+        q.where = query.eq('name', 'buoy_2')
+        results = yield self.reg.query_resource(q)
+        self.assertEqual([r.name for r in results], ['buoy_2'])
+
+        q.where = query.or_(query.eq('name', 'buoy_1'),
+                            query.eq('lifecycle', dataobject.LCStates.active))
+        q.sort = ['-name']
+        results = yield self.reg.query_resource(q)
+        self.assertEqual([r.name for r in results], ['glider_1', 'buoy_1'])
+
+        q.where = query.prefix('name', 'buoy')
+        q.sort = ['name']
+        q.offset = 1
+        q.limit = 1
+        results = yield self.reg.query_resource(q)
+        self.assertEqual([r.name for r in results], ['buoy_2'])
+
+        # Only the projected attributes (and the reference) are returned
+        q = query.Query()
+        q.fields = ['name']
+        q.sort = ['name']
+        results = yield self.reg.query_resource(q)
+        self.assertEqual([r.name for r in results], ['buoy_1', 'buoy_2', 'glider_1'])
+        self.assertEqual(results[2].lifecycle, dataobject.LCStates.new)
+        res = yield self.reg.get_resource(results[2].reference())
+        self.assertEqual(res.lifecycle, dataobject.LCStates.active)
+
+    @defer.inlineCallbacks
+    def test_find_pages(self):
+        names = ['buoy_%d' % i for i in range(5)]
+        for name in names:
+            res = dataobject.Resource.create_new_resource()
+            res.name = name
+            yield self.reg.register_resource(res)
+
+        # The next pages resume from the candidates in the cursor
+        scans = []
+        list_all = self.reg._list
+        def _list():
+            scans.append(True)
+            return list_all()
+        self.reg._list = _list
+
+        blank = dataobject.Resource()
+        blank.name = 'buoy'
+        pages = []
+        results, cursor = yield self.reg.find_resource_page(blank, page_size=2)
+        pages.append([r.name for r in results])
+        self.assertEqual(len(cursor.candidates), 3)
+        while cursor:
+            results, cursor = yield self.reg.find_next(cursor)
+            pages.append([r.name for r in results])
+        self.assertEqual([len(p) for p in pages], [2, 2, 1])
+        self.assertEqual(sorted(sum(pages, [])), names)
+        self.assertEqual(len(scans), 1)
+
+        q = query.Query()
+        q.where = query.prefix('name', 'buoy')
+        q.sort = ['-name']
+        q.fields = ['name']
+        q.limit = 2
+        pages = []
+        results, cursor = yield self.reg.query_resource_page(q)
+        pages.append([r.name for r in results])
+        self.assertEqual(len(cursor.candidates), 3)
+        while cursor:
+            results, cursor = yield self.reg.find_next(cursor)
+            pages.append([r.name for r in results])
+        self.assertEqual(pages, [['buoy_4', 'buoy_3'], ['buoy_2', 'buoy_1'], ['buoy_0']])
+        self.assertEqual(len(scans), 2)
 
 class RegistryCassandraTest(RegistryTest):
     """
@@ -66,6 +66,56 @@ class IStore(object):
         """
         raise NotImplementedError, "Abstract Interface Not Implemented"
 
+    def get_many(self, keys):
+        """
+        @param keys  list of immutable keys
+        @retval Deferred, for list of the values associated with keys, in
+                order, with None for each key not existing.
+        @note This default issues one get per key; backends that can read
+                many keys in one round trip should override it.
+        """
+        d = defer.DeferredList([self.get(key) for key in keys],
+                                fireOnOneErrback=True, consumeErrors=True)
+        d.addCallback(lambda results: [value for (ok, value) in results])
+        d.addErrback(lambda failure: failure.value.subFailure)
+        return d
+
+    def put_many(self, items):
+        """
+        @param items  list of (key, value) pairs, or a dict of key:value
+        @retval Deferred, for success of this operation
+        @note This default issues one put per item; backends that can write
+                many items in one round trip should override it.
+        """
+        if isinstance(items, dict):
+            items = items.items()
+        d = defer.DeferredList([self.put(key, value) for key, value in items],
+                                fireOnOneErrback=True, consumeErrors=True)
+        d.addCallback(lambda _: None)
+        d.addErrback(lambda failure: failure.value.subFailure)
+        return d
+
+    def exists(self, key):
+        """
+        @param key  an immutable key
+        @retval Deferred, for True if a value is associated with key
+        @note This default reads the value; backends should override it.
+        """
+        d = self.get(key)
+        d.addCallback(lambda value: value is not None)
+        return d
+
+    def exists_many(self, keys):
+        """
+        @param keys  list of immutable keys
+        @retval Deferred, for list of bools, True for each key that has a
+                value, in the order of keys
+        @note This default reads the values; backends should override it.
+        """
+        d = self.get_many(keys)
+        d.addCallback(lambda values: [value is not None for value in values])
+        return d
+
     def query(self, regex):
         """
         @param regex  regular expression matching zero or more keys
@@ -73,6 +123,17 @@ class IStore(object):
         """
         raise NotImplementedError, "Abstract Interface Not Implemented"
 
+    def query_prefix(self, prefix, regex):
+        """
+        @param prefix  literal prefix of the keys to search
+        @param regex  regular expression matched after the prefix
+        @retval Deferred, for list of matches of prefix + regex in the keys
+                starting with prefix
+        @note This default queries prefix (escaped) + regex over all keys;
+                backends that can scan a range of keys should override it.
+        """
+        return self.query(re.escape(prefix) + regex)
+
     def remove(self, key):
         """
         @param key  an immutable key associated with a value
@@ -80,6 +141,19 @@ class IStore(object):
         """
         raise NotImplementedError, "Abstract Interface Not Implemented"
 
+    def remove_many(self, keys):
+        """
+        @param keys  list of immutable keys
+        @retval Deferred, for success of this operation
+        @note This default issues one remove per key; backends that can
+                delete many keys in one round trip should override it.
+        """
+        d = defer.DeferredList([self.remove(key) for key in keys],
+                                fireOnOneErrback=True, consumeErrors=True)
+        d.addCallback(lambda _: None)
+        d.addErrback(lambda failure: failure.value.subFailure)
+        return d
+
 
 class Store(IStore):
     """
@@ -104,6 +178,30 @@ class Store(IStore):
         """
         return defer.maybeDeferred(self.kvs.update, {key:value})
 
+    def get_many(self, keys):
+        """
+        @see IStore.get_many
+        """
+        return defer.succeed([self.kvs.get(key) for key in keys])
+
+    def put_many(self, items):
+        """
+        @see IStore.put_many
+        """
+        return defer.maybeDeferred(self.kvs.update, items)
+
+    def exists(self, key):
+        """
+        @see IStore.exists
+        """
+        return defer.succeed(key in self.kvs)
+
+    def exists_many(self, keys):
+        """
+        @see IStore.exists_many
+        """
+        return defer.succeed([key in self.kvs for key in keys])
+
     def query(self, regex):
         """
         @see IStore.query
@@ -120,6 +218,17 @@ class Store(IStore):
                 match_list.extend(m)
         return match_list
 
+    def query_prefix(self, prefix, regex):
+        """
+        @see IStore.query_prefix
+        """
+        pattern = re.escape(prefix) + regex
+        match_list = []
+        for s in self.kvs.keys():
+            if s.startswith(prefix):
+                match_list.extend(re.findall(pattern, s))
+        return defer.succeed(match_list)
+
     def remove(self, key):
         """
         @see IStore.remove
@@ -128,3 +237,11 @@ class Store(IStore):
         if self.kvs.has_key(key):
             del self.kvs[key]
         return defer.succeed(None)
+
+    def remove_many(self, keys):
+        """
+        @see IStore.remove_many
+        """
+        for key in keys:
+            self.kvs.pop(key, None)
+        return defer.succeed(None)
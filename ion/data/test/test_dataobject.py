@@ -2,6 +2,7 @@
 
 from twisted.trial import unittest
 import logging
+import msgpack
 logging = logging.getLogger(__name__)
 
 from twisted.python import reflect
@@ -19,6 +20,7 @@ from ion.core.base_process import ProtocolFactory
 from ion.services.base_service import BaseService, BaseServiceClient
 
 from ion.data.datastore import cas
+from ion.resources import dm_resource_descriptions
 
 """
 Define some data objects for testing
@@ -376,6 +378,34 @@ class TestDataObjectMethods(unittest.TestCase):
         self.assertEqual(atts['boolen'].type,type(self.obj.boolen))
         self.assertEqual(atts['integer'].type,type(self.obj.integer))
 
+    def test_typedattributes_copy(self):
+        atts = PrimaryTypesObject.get_typedattributes()
+        del atts['key']
+        self.assertIn('key', PrimaryTypesObject.get_typedattributes())
+        self.assertEqual(set(PrimaryTypesObject._attnames),
+                set(PrimaryTypesObject.get_typedattributes()))
+
+    def test_track_changes(self):
+        self.assertEqual(self.obj.get_changes(), None)
+        self.obj.track_changes('base')
+        self.obj.name = 'Dorian'
+        self.obj.integer = 7
+        changes = self.obj.get_changes()
+        self.assertEqual(changes, set(['name', 'integer']))
+        self.assertEqual(changes.base, 'base')
+
+    def test_encode_changes(self):
+        codec = ListObject.get_codec()
+        obj = ListObject()
+        obj.track_changes()
+        obj.name = 'changed'
+        enc = dict(codec.encode_changes(obj, obj.get_changes(), set(['name', 'rlist'])))
+        self.assertEqual(enc['name'], 'str\x00changed')
+        # containers can change in place; always encoded
+        self.assertEqual(enc['rlist'], 'list\x00[]')
+        enc = dict(codec.encode_changes(obj, set(), set(['name', 'rlist'])))
+        self.assertEqual(enc['name'], None)
+
 class BinaryObject(dataobject.DataObject):
     name = dataobject.TypedAttribute(str)
     binary = dataobject.TypedAttribute(str)
@@ -391,6 +421,92 @@ class TestBinaryObject(TestSimpleObject):
         self.obj = obj
         self.encoded=[('Object_Type', 'BinaryObject'),('binary', "str\x00\xca\x98T\x17~\x0e41\x83\xcf'\xb6\xba&l\x1d\xd1\x9d\xd8["), ('name', 'str\x00Binary Junk')]
      
+class BufferObject(dataobject.DataObject):
+    name = dataobject.TypedAttribute(str)
+    payload = dataobject.TypedAttribute(buffer)
+
+dataobject.DataObject._types['BufferObject']=BufferObject
+
+class TestBufferObject(TestSimpleObject):
+    def setUp(self):
+        obj = BufferObject()
+        obj.name = 'Binary Payload'
+        obj.payload = buffer('\x00\xff\x80binary\x00')
+        self.obj = obj
+        self.encoded=[('Object_Type', 'BufferObject'),('payload', 'buffer\x00\x00\xff\x80binary\x00'),('name', 'str\x00Binary Payload')]
+
+    def test_default(self):
+        self.assertEqual(BufferObject().payload, buffer(''))
+
+    def test_view(self):
+        dec = dataobject.DataObject.decode(self.obj.encode())
+        self.assertIsInstance(dec.payload, buffer)
+        self.assertEqual(str(dec.payload), '\x00\xff\x80binary\x00')
+
+    def test_nested(self):
+        obj = ListObject()
+        obj.rlist = [self.obj]
+        dec = dataobject.DataObject.decode(obj.encode())
+        self.assertEqual(dec, obj)
+
+    def _nested_round_trip(self, payload):
+        self.obj.payload = buffer(payload)
+        holder = BufferHolder()
+        holder.inner = self.obj
+        dec = dataobject.DataObject.decode(holder.encode())
+        self.assertIsInstance(dec.inner.payload, buffer)
+        self.assertEqual(str(dec.inner.payload), payload)
+
+        obj = ListObject()
+        obj.rlist = [self.obj, buffer(payload)]
+        dec = dataobject.DataObject.decode(obj.encode())
+        self.assertEqual(str(dec.rlist[0].payload), payload)
+        self.assertIsInstance(dec.rlist[1], buffer)
+        self.assertEqual(str(dec.rlist[1]), payload)
+
+    def test_nested_utf8(self):
+        # Valid UTF-8 must not be read as text on the way through json
+        self._nested_round_trip('\xc3\xa9t\xc3\xa9')
+
+    def test_nested_binary(self):
+        self._nested_round_trip('\xff\xfe\x00\x80')
+
+    def test_nested_raw(self):
+        # The payload of a nested buffer is carried as is, not base64
+        payload = '\xff\xfe\x00\x80' * 256
+        self.obj.payload = buffer(payload)
+        holder = BufferHolder()
+        holder.inner = self.obj
+        (name, inner), = holder.encode(header=False)
+        self.assertIn(payload, inner)
+        self.assert_(len(inner) < len(payload) + 64)
+
+    def test_publication(self):
+        # Data messages are published wrapped in a Publication
+        for cls in (dm_resource_descriptions.Publication,
+                    dm_resource_descriptions.DAPMessageObject):
+            dataobject.DataObject._types[cls.__name__] = cls
+        payload = '\x00\xff\x80xdr' * 1024
+        msg = dm_resource_descriptions.DAPMessageObject()
+        msg.dds = 'Dataset {}'
+        msg.dods = buffer(payload)
+        publication = dm_resource_descriptions.Publication()
+        publication.data = msg
+        publication.publisher = 'publisher'
+        wire = msgpack.packb(publication.encode())
+        self.assertIn(payload, wire)
+        self.assert_(len(wire) < len(payload) + 512)
+        dec = dataobject.Resource.decode(msgpack.unpackb(wire))
+        self.assertIsInstance(dec.data.dods, buffer)
+        self.assertEqual(str(dec.data.dods), payload)
+        self.assertEqual(dec.data.dds, 'Dataset {}')
+        self.assertEqual(dec.publisher, 'publisher')
+
+class BufferHolder(dataobject.DataObject):
+    inner = dataobject.TypedAttribute(BufferObject)
+
+dataobject.DataObject._types['BufferHolder']=BufferHolder
+
 class ListObject(dataobject.DataObject):
     name = dataobject.TypedAttribute(str)
     rlist = dataobject.TypedAttribute(list)
@@ -582,6 +698,107 @@ class TestDataContainer(TestSimpleObject):
                     ('dt','DataType1\x00[["f", "float\\u00003.14159"], ["s", "str\\u0000Datatype1"]]'),
                     ('name', 'str\x00a container with datatype1')]       
         
+class TestDataObjectCodec(unittest.TestCase):
+
+    def test_codec_per_class(self):
+        codec = PrimaryTypesObject.get_codec()
+        self.assertIdentical(codec, PrimaryTypesObject.get_codec())
+        self.assertNotIdentical(codec, SimpleObject.get_codec())
+        self.assertEqual(set(codec.fields), set(PrimaryTypesObject().attributes))
+
+    def test_subclass_value(self):
+        obj = DataContainer()
+        obj.dt = DataType2()
+        obj.dt.i = 3
+        dec = dataobject.DataObject.decode(obj.encode())
+        self.assertIsInstance(dec.dt, DataType2)
+        self.assertEqual(obj, dec)
+
+    def test_lookup_type(self):
+        self.assertIdentical(dataobject.lookup_type('int'), int)
+        self.assertIdentical(dataobject.lookup_type('SimpleObject'), SimpleObject)
+        self.failUnlessRaises(KeyError, dataobject.lookup_type, '__import__')
+
+class TestLazyDecode(unittest.TestCase):
+
+    def setUp(self):
+        obj = DataContainer()
+        obj.name = 'lazy container'
+        obj.dt = DataType1()
+        obj.dt.f = 2.5
+        lobj = ListObject()
+        lobj.name = 'lazy list'
+        lobj.rlist = [SimpleObject(), 'a', 3]
+        self.obj = obj
+        self.lobj = lobj
+
+    def test_nested_on_access(self):
+        dec = dataobject.DataObject.decode(self.obj.encode(), lazy=True)
+        self.assertIsInstance(dec._dt, dataobject.LazyValue)
+        self.assertEqual(dec.name, 'lazy container')
+        self.assertIsInstance(dec.dt, DataType1)
+        self.assertEqual(dec.dt.f, 2.5)
+        # decoded once and memoized
+        self.assertIdentical(dec.dt, dec.dt)
+        self.assertEqual(dec, self.obj)
+
+    def test_list_on_access(self):
+        dec = dataobject.DataObject.decode(self.lobj.encode(), lazy=True)
+        self.assertIsInstance(dec._rlist, dataobject.LazyValue)
+        self.assertEqual(dec.rlist, self.lobj.rlist)
+        self.assertEqual(dec, self.lobj)
+
+    def test_encode_untouched(self):
+        encoded = self.obj.encode()
+        dec = dataobject.DataObject.decode(encoded, lazy=True)
+        self.assertEqual(dec.encode(), encoded)
+        self.assertIsInstance(dec._dt, dataobject.LazyValue)
+
+    def test_msgpack_untouched(self):
+        dec = dataobject.DataObject.decode(self.lobj.encode(), lazy=True)
+        enc = dataobject.MsgpackEncoder()
+        self.assertEqual(enc.decode(enc.encode(dec)), self.lobj)
+
+class CompactObject(dataobject.DataObject):
+    _compact = True
+    name = dataobject.TypedAttribute(str, tag=1)
+    key = dataobject.TypedAttribute(str, 'xxx', tag=2)
+    items = dataobject.TypedAttribute(list)
+
+class CompactSubObject(CompactObject):
+    value = dataobject.TypedAttribute(int, 5)
+
+dataobject.DataObject._types['CompactObject']=CompactObject
+
+class TestCompactObject(TestSimpleObject):
+    def setUp(self):
+        obj = CompactObject()
+        obj.name = 'compact'
+        obj.items.append(1)
+        self.obj = obj
+        self.encoded = [('Object_Type', 'CompactObject'),
+                        ('key', 'str\x00xxx'),
+                        ('items', 'list\x00["int\\u00001"]'),
+                        ('name', 'str\x00compact')]
+
+    def test_no_instance_dict(self):
+        self.assertEqual(set(CompactObject.__slots__), set(['_name','_key','_items']))
+        self.failUnlessRaises(AttributeError, setattr, self.obj, 'other', 1)
+        self.assertEqual(self.obj.key, 'xxx')
+
+    def test_not_inherited(self):
+        # Subclasses must opt in again; without the flag they get a dict
+        obj = CompactSubObject()
+        obj.other = 1
+        self.assertEqual(obj.value, 5)
+        self.assertEqual(obj.key, 'xxx')
+
+    def test_decode_drops_unknown(self):
+        obj = dataobject.DataObject.decode(self.obj.encode())
+        self.assertEqual(obj, self.obj)
+        dec = CompactObject.get_codec().decode_into(CompactObject(), [('other', 'str\x00x')])
+        self.failIf(hasattr(dec, 'other'))
+
 class ResponseService(BaseService):
     """Example service implementation
     """
@@ -762,3 +979,128 @@ class TestResource(unittest.TestCase):
 class TestDEncoder(unittest.TestCase):
     """
     """
+
+class TestMsgpackEncoder(unittest.TestCase):
+
+    def _round_trip(self, obj):
+        content_type, content_encoding, data = dataobject.serializer.encode(obj,
+                serializer='msgpack-dataobject')
+        self.assertEqual(content_type, 'application/ion-msgpack-dataobject')
+        dec = dataobject.serializer.decode(data, content_type)
+        self.assertEqual(type(obj), type(dec))
+        self.assertEqual(obj, dec)
+        return dec
+
+    def test_primary_types(self):
+        obj = PrimaryTypesObject()
+        obj.name = 'David'
+        obj.floating = 3.14159
+        obj.integer = 42
+        obj.boolen = False
+        dec = self._round_trip(obj)
+        self.assertIsInstance(dec.integer, int)
+        self.assertIsInstance(dec.floating, float)
+
+    def test_nested(self):
+        obj = NestedObject()
+        obj.rset = SetObject()
+        obj.rset.rset = set(['a', 3, 4.0])
+        dec = self._round_trip(obj)
+        self.assertIsInstance(dec.rset.rset, set)
+
+    def test_list_of_objects(self):
+        obj = ListObject()
+        obj.rlist = ['a', 3, 4.0, PrimaryTypesObject(), {'b':[1, 2]}]
+        self._round_trip(obj)
+
+    def test_resource(self):
+        res = dataobject.Resource.create_new_resource()
+        res.name = 'foo'
+        res.lifecycle = dataobject.LCStates.active
+        dec = self._round_trip(res)
+        self.assertEqual(dec.lifecycle, dataobject.LCStates.active)
+
+    def test_buffer(self):
+        obj = BufferObject()
+        obj.payload = buffer('\xff' * 1024)
+        dec = self._round_trip(obj)
+        self.assertIsInstance(dec.payload, buffer)
+
+class TestMsgpackCompactEncoder(TestMsgpackEncoder):
+
+    def _round_trip(self, obj):
+        content_type, content_encoding, data = dataobject.serializer.encode(obj,
+                serializer='msgpack-compact')
+        self.assertEqual(content_type, 'application/ion-msgpack-compact')
+        dec = dataobject.serializer.decode(data, content_type)
+        self.assertEqual(type(obj), type(dec))
+        self.assertEqual(obj, dec)
+        return dec
+
+    def test_smaller(self):
+        res = dataobject.Resource.create_new_resource()
+        ct, ce, full = dataobject.serializer.encode(res, serializer='msgpack-dataobject')
+        ct, ce, compact = dataobject.serializer.encode(res, serializer='msgpack-compact')
+        self.assert_(len(compact) < len(full))
+
+    def test_smaller_short_names(self):
+        # One byte tags beat even short field names
+        for obj in (SimpleObject(), PrimaryTypesObject(), CompactObject()):
+            ct, ce, full = dataobject.serializer.encode(obj, serializer='msgpack-dataobject')
+            ct, ce, compact = dataobject.serializer.encode(obj, serializer='msgpack-compact')
+            self.assert_(len(compact) < len(full), type(obj).__name__)
+
+    def test_tags_deterministic(self):
+        codec = PrimaryTypesObject.get_codec()
+        self.assertEqual(codec.tags, {'boolen':1, 'floating':2, 'integer':3,
+                                        'key':4, 'name':5})
+        self.assertEqual(codec.fingerprint,
+                dataobject.schema_fingerprint(PrimaryTypesObject.get_typedattributes()))
+        self.assertNotEqual(codec.fingerprint, SimpleObject.get_codec().fingerprint)
+        # Declared tags hold; the other fields are numbered after them
+        self.assertEqual(CompactObject.get_codec().tags, {'name':1, 'key':2, 'items':3})
+        self.assertEqual(CompactObject.get_codec().declared, {1:'name', 2:'key'})
+
+    def test_duplicate_tag(self):
+        def make():
+            class Clash(dataobject.DataObject):
+                name = dataobject.TypedAttribute(str, tag=1)
+                key = dataobject.TypedAttribute(str, tag=1)
+            return Clash.get_codec()
+        self.failUnlessRaises(dataobject.DataObjectError, make)
+        # Another layout under a fingerprint already registered
+        fingerprint = SimpleObject.get_codec().fingerprint
+        self.failUnlessRaises(dataobject.DataObjectError,
+                dataobject.register_layout, fingerprint, ('key', 'name', 'other'))
+
+    def _other_layout(self, fingerprint, cls_name='SimpleObject'):
+        # A newer layout of SimpleObject which also has a 'retired' field
+        data = msgpack.packb({cls_name:[fingerprint,
+                {1:'seabird', 2:'David', 3:'gone'}]})
+        return dataobject.serializer.decode(data, 'application/ion-msgpack-compact')
+
+    def test_other_layout(self):
+        dataobject.register_layout(12345, ('key', 'name', 'retired'))
+        obj = self._other_layout(12345)
+        self.assertIsInstance(obj, SimpleObject)
+        self.assertEqual(obj.key, 'seabird')
+        self.assertEqual(obj.name, 'David')
+        # Named by the registered layout, kept like any undeclared field
+        self.assertEqual(obj.retired, 'gone')
+
+    def test_unknown_layout(self):
+        # Not registered here: numbered tags can not be named, so they
+        # are dropped rather than given to the wrong fields
+        obj = self._other_layout(54321)
+        self.assertIsInstance(obj, SimpleObject)
+        self.assertEqual(obj.key, 'xxx')
+        self.assertEqual(obj.name, 'blank')
+        self.failIf(hasattr(obj, 'retired'))
+
+        # Fields declared with a tag decode in any layout
+        data = msgpack.packb({'CompactObject':[54321,
+                {1:'compact', 2:'seabird', 9:'round'}]})
+        obj = dataobject.serializer.decode(data, 'application/ion-msgpack-compact')
+        self.assertEqual(obj.name, 'compact')
+        self.assertEqual(obj.key, 'seabird')
+        self.assertEqual(obj.items, [])
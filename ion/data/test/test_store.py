@@ -80,6 +80,32 @@ class IStoreTest(unittest.TestCase):
         self.failUnlessEqual(self.value, b)
         yield self.ds.remove(self.key)
 
+    @defer.inlineCallbacks
+    def test_put_many_get_many(self):
+        key2 = str(uuid4())
+        yield self.ds.put_many([(self.key, self.value), (key2, 'value2')])
+        rc = yield self.ds.get_many([key2, str(uuid4()), self.key])
+        self.failUnlessEqual(rc, ['value2', None, self.value])
+        yield self.ds.remove(key2)
+
+    @defer.inlineCallbacks
+    def test_remove_many(self):
+        key2 = str(uuid4())
+        yield self.ds.put_many([(self.key, self.value), (key2, 'value2')])
+        yield self.ds.remove_many([self.key, key2, str(uuid4())])
+        rc = yield self.ds.exists_many([self.key, key2])
+        self.failUnlessEqual(rc, [False, False])
+
+    @defer.inlineCallbacks
+    def test_exists(self):
+        rc = yield self.ds.exists(self.key)
+        self.failIf(rc)
+        yield self.ds.put(self.key, self.value)
+        rc = yield self.ds.exists(self.key)
+        self.failUnless(rc)
+        rc = yield self.ds.exists_many([str(uuid4()), self.key])
+        self.failUnlessEqual(rc, [False, True])
+
     @defer.inlineCallbacks
     def test_query(self):
         # Write a key, query for it, verify contents
@@ -90,6 +116,22 @@ class IStoreTest(unittest.TestCase):
 #        print 'type rl[0][0]', type(rl[0][0])
         self.failUnlessEqual(rl[0], self.key)
 
+    @defer.inlineCallbacks
+    def test_query_prefix(self):
+        yield self.ds.put_many([(self.key + '.a', self.value),
+                                (self.key + '.b', self.value),
+                                ('x' + self.key + '.c', self.value)])
+        rl = yield self.ds.query_prefix(self.key + '.', '(\w*)$')
+        self.failUnlessEqual(sorted(rl), ['a', 'b'])
+
+    @defer.inlineCallbacks
+    def test_query_prefix_literal(self):
+        # Regex characters in the prefix (here '.', '(' and '+') are literal
+        yield self.ds.put_many([('obj(1).a+b', self.value),
+                                ('obj(1)xa+b', self.value)])
+        rl = yield self.ds.query_prefix('obj(1).a+', '(\w*)$')
+        self.failUnlessEqual(rl, ['b'])
+
 
 
 class CassandraStoreTestSuperCols(IStoreTest):
@@ -100,6 +142,14 @@ class CassandraStoreTestSuperCols(IStoreTest):
         return d
 
 
+class CassandraStoreTestSharded(IStoreTest):
+
+    def _setup_backend(self):
+        clist = ['amoeba.ucsd.edu:9160']
+        d = cassandra.CassandraStore.create_store(cass_host_list=clist, shards=16)
+        return d
+
+
 class CassandraStoreTestNoSuperCols(IStoreTest):
 
     def _setup_backend(self):
@@ -0,0 +1,5 @@
+"""
+@file ion/play/benchmark/__init__.py
+@brief Stand alone micro benchmarks of the ion data layer. Run a module
+with python -m, e.g. python -m ion.play.benchmark.dataobject_codec
+"""
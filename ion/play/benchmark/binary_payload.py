@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+@file ion/play/benchmark/binary_payload.py
+@brief Round trip throughput of a DAP data message with a 10 MB xdr grid:
+base64 in a str attribute (the old ds2dap_msg) against the binary (buffer)
+attribute, through the alpha and msgpack-dataobject serializers, alone and
+wrapped in a Publication as PubSubClient.publish sends it.
+@note The round trip includes packing the message content with msgpack as
+the messaging layer does.
+"""
+
+import base64
+import struct
+import time
+
+import msgpack
+
+from ion.data import dataobject
+from ion.data.dataobject import DataObject, TypedAttribute
+from ion.resources import dm_resource_descriptions as dm
+
+class Base64DAPMessageObject(dm.DataMessageObject):
+    """DAPMessageObject as it was, with base64 dods"""
+    _compact = True
+    das = TypedAttribute(str)
+    dds = TypedAttribute(str)
+    dods = TypedAttribute(str)
+
+def sample_grid(nbytes=10 * 2**20):
+    """xdr float32 grid of about nbytes"""
+    n = nbytes / 4
+    return struct.pack('>%df' % n, *[float(i % 1000) for i in xrange(n)])
+
+def base64_alpha(grid):
+    msg = Base64DAPMessageObject()
+    msg.dods = base64.b64encode(grid)
+    wire = msgpack.packb(msg.encode())
+    dec = DataObject.decode(msgpack.unpackb(wire))
+    return base64.b64decode(dec.dods), len(wire)
+
+def buffer_alpha(grid):
+    msg = dm.DAPMessageObject()
+    msg.dods = buffer(grid)
+    wire = msgpack.packb(msg.encode())
+    dec = DataObject.decode(msgpack.unpackb(wire))
+    return dec.dods, len(wire)
+
+def buffer_msgpack(grid):
+    msg = dm.DAPMessageObject()
+    msg.dods = buffer(grid)
+    ct, ce, data = dataobject.serializer.encode(msg, serializer='msgpack-dataobject')
+    wire = msgpack.packb(data)
+    dec = dataobject.serializer.decode(msgpack.unpackb(wire), ct)
+    return dec.dods, len(wire)
+
+def _publish(msg):
+    publication = dm.Publication()
+    publication.data = msg
+    publication.publisher = 'benchmark'
+    wire = msgpack.packb(publication.encode())
+    dec = dataobject.Resource.decode(msgpack.unpackb(wire))
+    return dec.data, len(wire)
+
+def base64_publication(grid):
+    msg = Base64DAPMessageObject()
+    msg.dods = base64.b64encode(grid)
+    dec, size = _publish(msg)
+    return base64.b64decode(dec.dods), size
+
+def buffer_publication(grid):
+    msg = dm.DAPMessageObject()
+    msg.dods = buffer(grid)
+    dec, size = _publish(msg)
+    return dec.dods, size
+
+def main(duration=2.0):
+    for cls in (dm.DAPMessageObject, Base64DAPMessageObject, dm.Publication):
+        dataobject.DataObject._types[cls.__name__] = cls
+    grid = sample_grid()
+    print '%-18s %12s %12s' % ('payload', 'wire MB', 'MB/s')
+    for func in (base64_alpha, buffer_alpha, buffer_msgpack,
+                    base64_publication, buffer_publication):
+        dods, size = func(grid)
+        assert str(dods) == grid
+        count = 0
+        start = time.time()
+        while time.time() < start + duration:
+            func(grid)
+            count += 1
+        rate = count * len(grid) / (time.time() - start) / 2**20
+        print '%-18s %12.2f %12.1f' % (func.__name__, size / float(2**20), rate)
+
+if __name__ == '__main__':
+    main()
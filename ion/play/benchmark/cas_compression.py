@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+@file ion/play/benchmark/cas_compression.py
+@brief Bytes stored (and so sent to the backend) and put/get time of
+CAStore objects with each compression codec, for the kinds of content we
+store: XDR encoded DAP data, HTML pages of the visualization consumers,
+resource attribute blobs and small attribute values.
+@note Runs on the in memory Store; pass cass_host (host:port) to run on a
+Cassandra backend as well.
+"""
+
+import math
+import struct
+import time
+
+from twisted.internet import defer
+
+from ion.data import store
+from ion.data.datastore import cas
+
+def dap_payload(n=10000):
+    """XDR (big endian float32) grid of a smooth field"""
+    values = [20 + 5 * math.sin(i / 50.0) + 0.01 * (i % 7) for i in xrange(n)]
+    return struct.pack('>%df' % n, *values)
+
+def html_payload(rows=500):
+    parts = ['<html><head><title>Station data</title></head><body><table>']
+    for i in xrange(rows):
+        parts.append('<tr><td class="time">2010-06-%02dT%02d:00:00Z</td>'
+                     '<td class="value">%.2f</td></tr>' % (i % 28 + 1, i % 24, 20 + (i % 13) * 0.25))
+    parts.append('</table></body></html>')
+    return ''.join(parts)
+
+def resource_payload(station):
+    return ('Dataset of the sea surface temperature of the ocean observing '
+            'initiative, station %d. Keywords: ocean, temperature, sensor. ' % station) * 40
+
+SAMPLES = [
+        ('dap', [dap_payload()]),
+        ('html', [html_payload()]),
+        ('resource', [resource_payload(i) for i in xrange(50)]),
+        ('small', [str(i) for i in xrange(1000)]),
+        ]
+
+@defer.inlineCallbacks
+def measure(backend, compression, contents):
+    castore = cas.CAStore(backend, 'bench_%s' % compression, compression=compression,
+                            cache_entries=0)
+    blobs = [cas.Blob(c) for c in contents]
+    for b in blobs:
+        b.encode()
+    start = time.time()
+    ids = yield castore.put_many(blobs)
+    put_s = time.time() - start
+    start = time.time()
+    objs = yield castore.get_many(ids)
+    get_s = time.time() - start
+    assert [o.content for o in objs] == contents
+    stored = yield castore.objs.get_many(ids)
+    defer.returnValue((sum([len(s) for s in stored]), put_s, get_s))
+
+@defer.inlineCallbacks
+def run(backend, name):
+    codecs = [None] + sorted(cas.CODECS.keys())
+    print '%s backend' % name
+    print '%-10s %-6s %12s %8s %10s %10s' % ('content', 'codec', 'bytes', 'ratio', 'put ms', 'get ms')
+    for content, contents in SAMPLES:
+        raw = None
+        for codec in codecs:
+            size, put_s, get_s = yield measure(backend, codec, contents)
+            raw = raw or size
+            print '%-10s %-6s %12d %8.2f %10.2f %10.2f' % (content, codec,
+                    size, float(size) / raw, put_s * 1e3, get_s * 1e3)
+
+def main(cass_host=None):
+    backends = [(store.Store(), 'memory')]
+    if cass_host:
+        from ion.data.backends import cassandra
+        cassandra.CassandraStore.create_store(cass_host_list=[cass_host]).addCallback(
+                lambda s: backends.append((s, 'cassandra')))
+    for backend, name in backends:
+        run(backend, name)
+
+if __name__ == '__main__':
+    import sys
+    main(*sys.argv[1:])
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+@file ion/play/benchmark/cas_encode.py
+@brief Time to write a Tree of N blobs to a CAStore the way
+ObjectChassis.write_tree does (an Element and a put per blob, then the
+tree): objects that re-hash their encoding on every sha1() (as before)
+versus objects that keep the hash computed with the encoding.
+"""
+
+import time
+
+from ion.data import store
+from ion.data.datastore import cas
+
+NULL_CHR = cas.NULL_CHR
+
+class LegacyMixin(object):
+    """
+    @brief Encoding by string concatenation; sha1 recomputed from the
+    encoded value on every call, as cas did before.
+    """
+    def encode(self):
+        if not self._encoded_cache:
+            body = self._encode_body()
+            header = "%s %d%s" % (self.type, len(body), NULL_CHR,)
+            self._encoded_cache = "%s%s" % (header, body,)
+        return self._encoded_cache
+
+    def digest(self):
+        return cas.sha1bin(self.encode())
+
+class LegacyBlob(LegacyMixin, cas.Blob):
+    pass
+
+class LegacyTree(LegacyMixin, cas.Tree):
+    def _encode_body(self):
+        body = ""
+        for (name, obj_hash, mode) in self.children:
+            body += "%s %s\x00%s" % (mode, name, obj_hash,)
+        return body
+
+def write_tree(castore, blob_class, tree_class, values):
+    elements = []
+    for n, value in enumerate(values):
+        blob = blob_class(value)
+        elements.append(cas.Element('attr%d' % n, blob))
+        castore.put(blob)
+    tree = tree_class(*elements)
+    d = castore.put(tree)
+    return d.result
+
+def main(repeat=3):
+    print '%-10s %10s %12s %12s %8s' % ('children', 'blob size', 'before s', 'after s', 'speedup')
+    for n, size in ((1000, 200), (100000, 200), (100, 2**20)):
+        values = ['str\x00value %d ' % i + 'x' * size for i in xrange(n)]
+        times = []
+        ids = []
+        for classes in ((LegacyBlob, LegacyTree), (cas.Blob, cas.Tree)):
+            best = None
+            for i in xrange(int(repeat)):
+                castore = cas.CAStore(store.Store())
+                start = time.time()
+                tree_id = write_tree(castore, classes[0], classes[1], values)
+                elapsed = time.time() - start
+                best = elapsed if best is None else min(best, elapsed)
+            ids.append(tree_id)
+            times.append(best)
+        assert ids[0] == ids[1]
+        print '%-10d %10d %12.4f %12.4f %7.2fx' % (n, size, times[0], times[1], times[0] / times[1])
+
+if __name__ == '__main__':
+    main()
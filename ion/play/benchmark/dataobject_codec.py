@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+@file ion/play/benchmark/dataobject_codec.py
+@brief Measure DataObject encode/decode ops/sec for the compiled codec plan
+versus the reflective encoding it replaced.
+"""
+
+import time
+
+try:
+    import json
+except:
+    import simplejson as json
+
+from ion.data import dataobject
+from ion.data.dataobject import DataObject, NULL_CHR
+from ion.resources import dm_resource_descriptions as dm
+
+def legacy_encode(obj, header=True):
+    """
+    @brief The reflective DataObject.encode, kept here as the baseline.
+    """
+    encoded = []
+    if header:
+        encoded.append(('Object_Type', "%s" % (type(obj).__name__)))
+    for name in [key[1:] for key in obj.__dict__]:
+        value = getattr(obj, name)
+        if isinstance(value, DataObject):
+            value_enc = legacy_encode(value, header=False)
+            encoded.append((name, "%s%s%s" % (type(value).__name__, NULL_CHR, json.dumps(value_enc),)))
+        elif isinstance(value, (list, tuple, set)):
+            list_enc = []
+            for val in value:
+                if isinstance(val, DataObject):
+                    val_enc = legacy_encode(val, header=False)
+                    list_enc.append("%s%s%s" % (type(val).__name__, NULL_CHR, json.dumps(val_enc),))
+                else:
+                    list_enc.append("%s%s%s" % (type(val).__name__, NULL_CHR, str(val)))
+            encoded.append((name, "%s%s%s" % (type(value).__name__, NULL_CHR, json.dumps(list_enc),)))
+        elif isinstance(value, dict):
+            encoded.append((name, "%s%s%s" % (type(value).__name__, NULL_CHR, json.dumps(value),)))
+        else:
+            encoded.append((name, "%s%s%s" % (type(value).__name__, NULL_CHR, str(value),)))
+    return encoded
+
+def legacy_decode(attrs, header=True, clsobj=None):
+    """
+    @brief The reflective DataObject.decode (eval per type name), kept here
+    as the baseline.
+    """
+    types = DataObject._types
+    attrs = list(attrs)
+    if header:
+        header, clsname = attrs.pop(0)
+        clsobj = eval(str(clsname), types.copy())
+    obj = clsobj()
+    for name, value in attrs:
+        stype, default = value.split(NULL_CHR)
+        mytype = eval(str(stype), types.copy())
+        if not default:
+            value = mytype()
+        elif issubclass(mytype, DataObject):
+            value = legacy_decode(json.loads(default), header=False, clsobj=mytype)
+        elif issubclass(mytype, (list, set, tuple)):
+            objs = []
+            for item in json.loads(default):
+                itype, ival = item.split(NULL_CHR)
+                itype = eval(str(itype), types.copy())
+                if issubclass(itype, DataObject):
+                    objs.append(legacy_decode(json.loads(ival), header=False, clsobj=itype))
+                else:
+                    objs.append(itype(str(ival)))
+            value = mytype(objs)
+        elif issubclass(mytype, dict):
+            value = json.loads(default)
+        elif issubclass(mytype, bool):
+            value = eval(str(default))
+        else:
+            value = mytype(str(default))
+        setattr(obj, name, value)
+    return obj
+
+def sample_objects():
+    res = dataobject.Resource.create_new_resource()
+    res.name = 'benchmark resource'
+
+    topic = dm.PubSubTopicResource.create('benchmark topic', 'ctd, seabird')
+    topic.queue = dm.Queue()
+    topic.queue.name = 'benchmark_queue'
+    topic.queue.type = 'fanout'
+    topic = topic.create_new_reference()
+
+    msg = dm.DAPMessageObject()
+    msg.notification = 'new data'
+    msg.timestamp = 1281000000.25
+    msg.das = 'Attributes { }'
+    msg.dds = 'Dataset { Float32 temp[time = 10]; } sample;'
+    msg.dods = buffer('x' * 1024)
+    return [res, topic, msg]
+
+def ops_per_sec(func, arg, duration=1.0):
+    count = 0
+    start = time.time()
+    end = start + duration
+    while time.time() < end:
+        for i in xrange(100):
+            func(arg)
+        count += 100
+    return count / (time.time() - start)
+
+def main(duration=1.0):
+    dataobject.DataObject._types.update({
+        'Queue':dm.Queue,
+        'AOI':dm.AOI,
+        'PubSubTopicResource':dm.PubSubTopicResource,
+        'DAPMessageObject':dm.DAPMessageObject,
+        })
+    print '%-22s %-7s %12s %12s %8s' % ('class', 'op', 'before/s', 'after/s', 'speedup')
+    for obj in sample_objects():
+        encoded = obj.encode()
+        assert legacy_encode(obj) == encoded
+        assert legacy_decode(encoded) == obj
+        name = type(obj).__name__
+        before = ops_per_sec(legacy_encode, obj, duration)
+        after = ops_per_sec(lambda o: o.encode(), obj, duration)
+        print '%-22s %-7s %12.0f %12.0f %7.2fx' % (name, 'encode', before, after, after / before)
+        before = ops_per_sec(legacy_decode, encoded, duration)
+        after = ops_per_sec(DataObject.decode, encoded, duration)
+        print '%-22s %-7s %12.0f %12.0f %7.2fx' % (name, 'decode', before, after, after / before)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+@file ion/play/benchmark/dataobject_memory.py
+@brief Memory and attribute access cost of 1M StringMessageObject instances
+with compact (slot) storage versus the same typed attributes in an instance
+dict. Each variant is measured in a forked child so they do not share heap.
+@note Linux only (reads /proc/self/statm).
+"""
+
+import os
+import time
+import resource
+
+from ion.data.dataobject import DataObject, TypedAttribute
+from ion.resources.dm_resource_descriptions import StringMessageObject
+
+class DictStringMessageObject(DataObject):
+    """StringMessageObject layout without compact storage"""
+    notification = TypedAttribute(str)
+    timestamp = TypedAttribute(float)
+    data = TypedAttribute(str)
+
+def rss_bytes():
+    return int(open('/proc/self/statm').read().split()[1]) * resource.getpagesize()
+
+def measure(cls, count):
+    start = rss_bytes()
+    objs = []
+    for i in xrange(count):
+        o = cls()
+        o.notification = 'sample'
+        o.timestamp = 1.0
+        o.data = 'x'
+        objs.append(o)
+    used = rss_bytes() - start
+    t0 = time.time()
+    for o in objs:
+        o.data = o.notification
+    access = count / (time.time() - t0)
+    return used, access
+
+def in_child(func, *args):
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        os.write(wfd, repr(func(*args)))
+        os._exit(0)
+    os.close(wfd)
+    result = ''
+    while True:
+        chunk = os.read(rfd, 4096)
+        if not chunk:
+            break
+        result += chunk
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    return eval(result)
+
+def main(count=1000000):
+    count = int(count)
+    print '%-26s %14s %10s %14s' % ('class', 'MB', 'bytes/obj', 'set+get/s')
+    for cls in (DictStringMessageObject, StringMessageObject):
+        used, access = in_child(measure, cls, count)
+        print '%-26s %14.1f %10.0f %14.0f' % (cls.__name__, used / 1e6, float(used) / count, access)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+@file ion/play/benchmark/git_corpus.py
+@brief Read and decode (cas.Commit, cas.Tree) the whole commit and tree
+history of a git repository through GitDB, as a corpus of real world
+histories for the CAStore object decoders.
+@note Pass the root of a packed repository (git gc); the default is the
+repository this file is in.
+"""
+
+import os
+import time
+
+from ion.data.datastore import cas
+from ion.play.objstore import git
+
+def walk(db, head):
+    """
+    @retval (number of commits, number of trees) reachable from head
+    """
+    commits = trees = 0
+    seen = set()
+    pending = [head]
+    tree_ids = []
+    while pending:
+        id = pending.pop()
+        if id in seen:
+            continue
+        seen.add(id)
+        commit = db.read(id)
+        commits += 1
+        tree_ids.append(commit.tree)
+        pending.extend(commit.parents)
+    while tree_ids:
+        id = tree_ids.pop()
+        if id in seen:
+            continue
+        seen.add(id)
+        tree = db.read(id)
+        trees += 1
+        for name, sha, mode in tree.children:
+            if mode.startswith('4'):
+                tree_ids.append(cas.sha1_to_hex(sha))
+    return commits, trees
+
+def main(root=None, head='master'):
+    if root is None:
+        root = os.path.join(os.path.dirname(__file__), '..', '..', '..')
+    db = git.Git(os.path.abspath(root))
+    print '%d packed objects' % len(db.objstore)
+    for label in ('cold', 'warm'):
+        start = time.time()
+        commits, trees = walk(db, db.get_head(head))
+        secs = time.time() - start
+        print '%-5s %6d commits %7d trees %8.3f s %10.0f objects/s' % (label,
+                commits, trees, secs, (commits + trees) / secs)
+    print 'delta base cache', db.objstore.base_cache.stats()
+    print 'object cache', db.cache.stats()
+
+if __name__ == '__main__':
+    import sys
+    main(*sys.argv[1:])
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+"""
+@file ion/play/benchmark/lazy_decode.py
+@brief Eager versus lazy DataObject.decode of a SubscriptionResource when
+the reader only looks at its name (as a consumer reading notification and
+timestamp would), and when it reads everything.
+"""
+
+from ion.data import dataobject
+from ion.data.dataobject import DataObject
+from ion.resources import dm_resource_descriptions as dm
+from ion.play.benchmark.dataobject_codec import ops_per_sec
+from ion.play.benchmark.serializers import sample_subscription
+
+def read_name(obj):
+    return obj.name
+
+def read_all(obj):
+    for q in obj.queues:
+        q.name
+    return obj.topic1.queue.name, obj.topic2.queue.name, obj.topic3.queue.name
+
+def main(duration=1.0):
+    for cls in (dm.SubscriptionResource, dm.PubSubTopicResource, dm.Queue, dm.AOI):
+        dataobject.DataObject._types[cls.__name__] = cls
+    print '%-8s %-10s %12s %12s %8s' % ('queues', 'reads', 'eager/s', 'lazy/s', 'speedup')
+    for nqueues in (20, 200):
+        encoded = sample_subscription(nqueues).encode()
+        assert DataObject.decode(encoded, lazy=True) == DataObject.decode(encoded)
+        for reader in (read_name, read_all):
+            eager = ops_per_sec(lambda e: reader(DataObject.decode(e)), encoded, duration)
+            lazy = ops_per_sec(lambda e: reader(DataObject.decode(e, lazy=True)), encoded, duration)
+            print '%-8d %-10s %12.0f %12.0f %7.2fx' % (nqueues, reader.__name__, eager, lazy, lazy / eager)
+
+if __name__ == '__main__':
+    main()
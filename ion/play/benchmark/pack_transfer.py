@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+@file ion/play/benchmark/pack_transfer.py
+@brief Cloning object histories between object stores: one pack per
+object (what DataStoreService sends) versus copying the objects one at a
+time (one message per object over the service).
+@note Both stores use the in memory backend, so this measures the local
+cost (walking, packing, storing) and counts the messages a remote
+transfer would need; network latency multiplies the per object count.
+"""
+
+import time
+import zlib
+
+from twisted.internet import defer
+
+from ion.data import store
+from ion.data import dataobject
+from ion.data.datastore import objstore
+
+class Resource(dataobject.DataObject):
+    name = dataobject.TypedAttribute(str)
+    description = dataobject.TypedAttribute(str)
+    version = dataobject.TypedAttribute(int)
+    keywords = dataobject.TypedAttribute(list)
+
+dataobject.DataObject._types['Resource'] = Resource
+
+class ResourceChassis(objstore.ObjectChassis):
+    objectClass = Resource
+
+class ResourceStore(objstore.ObjectStore):
+    objectChassis = ResourceChassis
+
+@defer.inlineCallbacks
+def make_histories(objectstore, nobjects, ncommits):
+    names = []
+    for i in xrange(nobjects):
+        name = 'resource%d' % i
+        obj = yield objectstore.create(name, Resource)
+        res = yield obj.checkout()
+        res.name = name
+        res.description = 'A resource of the benchmark ' * 4
+        res.keywords = ['benchmark', 'pack']
+        for v in xrange(ncommits):
+            res.version = v
+            yield obj.commit()
+        names.append(name)
+    defer.returnValue(names)
+
+@defer.inlineCallbacks
+def copy_objects(src, dst, name):
+    """
+    @brief The baseline: every object of the history read and written by
+    itself.
+    @retval number of objects (messages)
+    """
+    obj_id = yield src.refs.get(name)
+    head = yield src.objectChassis(src, src._keyspace(name)).get_head()
+    commits = yield src.walk_commits([head])
+    objs = yield src.walk_objects([id for id, c in commits] + [obj_id])
+    for id, obj in objs:
+        o = yield src.get(id)
+        yield dst.put(o)
+    yield dst.refs.put(name, obj_id)
+    yield dst.objectChassis(dst, dst._keyspace(name)).update_head(head)
+    defer.returnValue(len(objs))
+
+@defer.inlineCallbacks
+def copy_pack(src, dst, name, sizes):
+    packed = yield src.make_pack(name, include_object=True)
+    sizes[0] += len(zlib.decompress(packed['pack']))
+    sizes[1] += len(packed['pack'])
+    yield dst.receive_pack(name, packed['pack'], packed['object'], packed['head'])
+    defer.returnValue(1)
+
+@defer.inlineCallbacks
+def run(nobjects, ncommits):
+    src = yield ResourceStore.new(store.Store(), 'src')
+    names = yield make_histories(src, nobjects, ncommits)
+
+    dst = yield ResourceStore.new(store.Store(), 'dst')
+    start = time.time()
+    messages = 0
+    for name in names:
+        messages += (yield copy_objects(src, dst, name))
+    per_object = time.time() - start, messages
+
+    dst = yield ResourceStore.new(store.Store(), 'dst')
+    sizes = [0, 0]
+    start = time.time()
+    messages = 0
+    for name in names:
+        messages += (yield copy_pack(src, dst, name, sizes))
+    packed = time.time() - start, messages
+
+    obj = yield dst.clone(names[-1])
+    res = yield obj.checkout()
+    assert res.version == ncommits - 1
+    defer.returnValue((per_object, packed, sizes))
+
+def main(nobjects=1000, ncommits=5):
+    nobjects, ncommits = int(nobjects), int(ncommits)
+    results = []
+    run(nobjects, ncommits).addCallback(results.append)
+    (obj_s, obj_msgs), (pack_s, pack_msgs), (raw, compressed) = results[0]
+    print '%d objects with %d commits each' % (nobjects, ncommits)
+    print '%-12s %10s %10s' % ('transfer', 'seconds', 'messages')
+    print '%-12s %10.3f %10d' % ('per object', obj_s, obj_msgs)
+    print '%-12s %10.3f %10d' % ('pack', pack_s, pack_msgs)
+    print 'pack bytes %d raw, %d compressed' % (raw, compressed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""
+@file ion/play/benchmark/serializers.py
+@brief Compare wire size and encode/decode cost of the registered DataObject
+serializers for a nested resource (SubscriptionResource).
+"""
+
+import time
+
+import msgpack
+
+from ion.data import dataobject
+from ion.resources import dm_resource_descriptions as dm
+from ion.play.benchmark.dataobject_codec import ops_per_sec
+
+def sample_subscription(nqueues=20):
+    sub = dm.SubscriptionResource.create_new_resource()
+    sub.name = 'benchmark subscription'
+    for n, topic in enumerate(('topic1', 'topic2', 'topic3')):
+        t = dm.PubSubTopicResource.create('ctd %d' % n, 'ctd, seabird, temperature')
+        t.queue = dm.Queue()
+        t.queue.name = 'queue_%d' % n
+        t.queue.type = 'fanout'
+        t.queue.args = {'durable':True, 'auto_delete':False}
+        setattr(sub, topic, t)
+    for n in range(nqueues):
+        q = dm.Queue()
+        q.name = 'subscriber_queue_%d' % n
+        q.type = 'direct'
+        q.args = {'exclusive':False, 'prefetch':n}
+        sub.queues.append(q)
+    sub.workflow = {'consumer1':{'module':'ion.services.dm.distribution.consumers',
+                                 'consumeclass':'LoggingConsumer',
+                                 'attach':'topic1'}}
+    return sub
+
+def main(duration=1.0):
+    for cls in (dm.SubscriptionResource, dm.PubSubTopicResource, dm.Queue, dm.AOI):
+        dataobject.DataObject._types[cls.__name__] = cls
+    sub = sample_subscription()
+    print '%-20s %10s %12s %12s' % ('serializer', 'bytes', 'encode/s', 'decode/s')
+    for name in ('alpha', 'msgpack-dataobject', 'msgpack-compact'):
+        content_type, content_encoding, data = dataobject.serializer.encode(sub, serializer=name)
+        assert dataobject.serializer.decode(data, content_type) == sub
+        # Size on the wire: the message content is msgpack'd by carrot
+        size = len(msgpack.packb(data))
+        enc = ops_per_sec(lambda o: dataobject.serializer.encode(o, serializer=name), sub, duration)
+        dec = ops_per_sec(lambda d: dataobject.serializer.decode(d, content_type), data, duration)
+        print '%-20s %10d %12.0f %12.0f' % (name, size, enc, dec)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+@file ion/play/benchmark/tree_parser.py
+@brief Tree body parsing time against number of children: the list-pop
+parser cas used to have versus the index based Tree.iter_body.
+@note The list-pop parser is quadratic; it is skipped above legacy_max
+children.
+"""
+
+import time
+
+from ion.data.datastore import cas
+
+NULL_CHR = cas.NULL_CHR
+
+def legacy_parser(raw):
+    """
+    @brief The two part processing loop Tree._decode_body_parser used
+    before iter_body, kept here as the baseline.
+    """
+    raw = list(raw)
+    def read_to_null(raw):
+        buf = ''
+        while raw:
+            char = raw.pop(0)
+            if char == NULL_CHR:
+                break
+            buf += char
+        return buf, raw
+
+    def read_sha1(raw):
+        hash, raw = ''.join(raw[0:20]), raw[20:]
+        return hash, raw
+
+    children = []
+    while True:
+        mode_name, raw = read_to_null(raw)
+        mode, name = mode_name.split()
+        hash, raw = read_sha1(raw)
+        children.append((name, hash, mode))
+        if not raw:
+            break
+    return children
+
+def sample_body(nchildren):
+    tree = cas.Tree(*[('child%d' % i, cas.sha1(str(i)), '100644')
+                        for i in xrange(nchildren)])
+    return tree._encode_body()
+
+def timed(func, arg):
+    start = time.time()
+    result = func(arg)
+    return time.time() - start, result
+
+def main(legacy_max=1000):
+    print '%-10s %14s %14s %16s' % ('children', 'list-pop s', 'iter_body s', 'iter_body us/child')
+    for n in (10, 1000, 100000):
+        body = sample_body(n)
+        new, children = timed(cas.Tree._decode_body_parser, body)
+        assert len(children) == n
+        if n <= legacy_max:
+            old, legacy = timed(legacy_parser, body)
+            assert legacy == children
+            old = '%14.4f' % old
+        else:
+            old = '%14s' % 'skipped'
+        print '%-10d %s %14.4f %16.3f' % (n, old, new, new / n * 1e6)
+
+if __name__ == '__main__':
+    main()
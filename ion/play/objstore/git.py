@@ -3,46 +3,393 @@
 @author Dorian Raymer
 @brief Example application showing the CAStore implementation power.
 Read git objects using ion.data.objstore CAStore and Storable objects.
-@todo To really show off, need to be able to read git packfiles (otherwise,
-most repositories history's will be unreadable...only their last commit will
-[probably] be readable)
+@note Objects are read from loose object files and from packfiles (with
+their v2 .idx index); a repository that has been packed (git gc, clone) is
+readable through its whole history.
 """
 import os
+import glob
+import mmap
 import zlib
 import time
+import struct
+import binascii
+
+from twisted.internet import defer
 
 from ion.data.datastore import cas
 
+# Packfile object type numbers
+OBJ_COMMIT = 1
+OBJ_TREE = 2
+OBJ_BLOB = 3
+OBJ_TAG = 4
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+
+TYPE_NAMES = {
+        OBJ_COMMIT:'commit',
+        OBJ_TREE:'tree',
+        OBJ_BLOB:'blob',
+        OBJ_TAG:'tag',
+        }
+
+IDX_MAGIC = '\377tOc'
+
+class GitError(cas.CAStoreError):
+    """
+    Malformed or unsupported git repository data
+    """
+
+def _varint(data, pos):
+    """
+    @brief Read a little endian base 128 size (delta header).
+    @retval (value, position after it)
+    """
+    value = shift = 0
+    while True:
+        c = ord(data[pos])
+        pos += 1
+        value |= (c & 0x7f) << shift
+        shift += 7
+        if not c & 0x80:
+            return value, pos
+
+def apply_delta(base, delta):
+    """
+    @brief Rebuild an object from its delta base and a git delta: a
+    sequence of copy (from base) and insert (literal) instructions.
+    @param base content of the base object
+    @param delta inflated delta data
+    @retval content of the object
+    """
+    src_size, pos = _varint(delta, 0)
+    dst_size, pos = _varint(delta, pos)
+    if src_size != len(base):
+        raise GitError("Delta base size %d, expected %d" % (len(base), src_size))
+    parts = []
+    end = len(delta)
+    while pos < end:
+        c = ord(delta[pos])
+        pos += 1
+        if c & 0x80:
+            offset = size = 0
+            for i in (0, 1, 2, 3):
+                if c & (1 << i):
+                    offset |= ord(delta[pos]) << (8 * i)
+                    pos += 1
+            for i in (0, 1, 2):
+                if c & (0x10 << i):
+                    size |= ord(delta[pos]) << (8 * i)
+                    pos += 1
+            parts.append(base[offset:offset + (size or 0x10000)])
+        elif c:
+            parts.append(delta[pos:pos + c])
+            pos += c
+        else:
+            raise GitError("Invalid delta instruction")
+    data = ''.join(parts)
+    if len(data) != dst_size:
+        raise GitError("Delta result size %d, expected %d" % (len(data), dst_size))
+    return data
+
+def _mmap(path):
+    f = open(path, 'rb')
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+
+class PackIndex(object):
+    """
+    @brief Version 2 pack index (.idx): the sorted binary sha1s of the
+    objects of a packfile and their offsets in it. The file is memory
+    mapped; a lookup is a binary search in the range of the fan out table
+    for the first byte of the sha1.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.map = _mmap(path)
+        if self.map[:4] != IDX_MAGIC:
+            raise GitError("Unsupported pack index (version 1) %s" % path)
+        version, = struct.unpack('>L', self.map[4:8])
+        if version != 2:
+            raise GitError("Unsupported pack index version %d %s" % (version, path))
+        self.fanout = struct.unpack('>256L', self.map[8:8 + 1024])
+        self.count = self.fanout[255]
+        self._shas = 8 + 1024
+        self._offsets = self._shas + 24 * self.count # past shas and crcs
+        self._large_offsets = self._offsets + 4 * self.count
+
+    def __len__(self):
+        return self.count
+
+    def _sha(self, i):
+        pos = self._shas + 20 * i
+        return self.map[pos:pos + 20]
+
+    def find(self, sha):
+        """
+        @param sha binary (20 byte) sha1
+        @retval offset of the object in the packfile, None if not in it
+        """
+        first = ord(sha[0])
+        lo = self.fanout[first - 1] if first else 0
+        hi = self.fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_sha = self._sha(mid)
+            if mid_sha < sha:
+                lo = mid + 1
+            elif mid_sha > sha:
+                hi = mid
+            else:
+                return self._offset(mid)
+        return None
+
+    def _offset(self, i):
+        pos = self._offsets + 4 * i
+        offset, = struct.unpack('>L', self.map[pos:pos + 4])
+        if offset & 0x80000000:
+            pos = self._large_offsets + 8 * (offset & 0x7fffffff)
+            offset, = struct.unpack('>Q', self.map[pos:pos + 8])
+        return offset
+
+    def iter_shas(self):
+        """
+        @brief Generate the binary sha1s of the objects, in sorted order
+        """
+        for i in xrange(self.count):
+            yield self._sha(i)
+
+class PackFile(object):
+    """
+    @brief Memory mapped packfile. Objects are read by offset; delta
+    chains (OFS_DELTA and REF_DELTA) are resolved from the nearest base in
+    the delta base cache, and the bases rebuilt on the way are cached.
+    """
+
+    def __init__(self, path, index, base_cache, external=None):
+        """
+        @param path of the .pack file
+        @param index PackIndex of the pack
+        @param base_cache cas.ObjectCache shared by the packs of a
+        repository; keys are (path, offset)
+        @param external function of a binary sha1 returning (type name,
+        content) for REF_DELTA bases outside this pack (thin packs)
+        """
+        self.path = path
+        self.index = index
+        self.base_cache = base_cache
+        self.external = external
+        self.map = _mmap(path)
+        if self.map[:4] != 'PACK':
+            raise GitError("Not a packfile %s" % path)
+        version, count = struct.unpack('>LL', self.map[4:12])
+        if version not in (2, 3):
+            raise GitError("Unsupported packfile version %d %s" % (version, path))
+        if count != len(index):
+            raise GitError("Packfile %s does not match its index" % path)
+
+    def _header(self, offset):
+        """
+        @brief Decode the object header at offset.
+        @retval (type number, inflated size, offset of the data, base)
+        where base is the offset (OFS_DELTA) or binary sha1 (REF_DELTA) of
+        the delta base, else None
+        """
+        data = self.map
+        c = ord(data[offset])
+        pos = offset + 1
+        type = (c >> 4) & 7
+        size = c & 0x0f
+        shift = 4
+        while c & 0x80:
+            c = ord(data[pos])
+            pos += 1
+            size |= (c & 0x7f) << shift
+            shift += 7
+        base = None
+        if type == OBJ_OFS_DELTA:
+            c = ord(data[pos])
+            pos += 1
+            rel = c & 0x7f
+            while c & 0x80:
+                c = ord(data[pos])
+                pos += 1
+                rel = ((rel + 1) << 7) | (c & 0x7f)
+            base = offset - rel
+        elif type == OBJ_REF_DELTA:
+            base = data[pos:pos + 20]
+            pos += 20
+        return type, size, pos, base
+
+    def _inflate(self, pos, size):
+        """
+        @brief Inflate the zlib stream at pos of an object of size bytes,
+        reading no more of the map than it takes.
+        """
+        d = zlib.decompressobj()
+        parts = []
+        got = 0
+        step = max(size + 64, 4096)
+        while got < size or not parts:
+            chunk = self.map[pos:pos + step]
+            if not chunk:
+                raise GitError("Truncated object data in %s" % self.path)
+            part = d.decompress(chunk)
+            parts.append(part)
+            got += len(part)
+            pos += len(chunk)
+            if d.unused_data:
+                break
+        if got != size:
+            raise GitError("Object size %d, expected %d in %s" % (got, size, self.path))
+        return ''.join(parts)
+
+    def read(self, offset):
+        """
+        @brief Read the object at offset.
+        @retval (type name, content)
+        """
+        path = self.path
+        chain = []
+        while True:
+            cached = self.base_cache.get((path, offset))
+            if cached is not None:
+                type, data = cached
+                break
+            type, size, pos, base = self._header(offset)
+            if type == OBJ_OFS_DELTA:
+                chain.append((offset, pos, size))
+                offset = base
+            elif type == OBJ_REF_DELTA:
+                chain.append((offset, pos, size))
+                base_offset = self.index.find(base)
+                if base_offset is not None:
+                    offset = base_offset
+                elif self.external is not None:
+                    type, data = self.external(base)
+                    break
+                else:
+                    raise GitError("Delta base %s not found" % binascii.hexlify(base))
+            elif type in TYPE_NAMES:
+                type = TYPE_NAMES[type]
+                data = self._inflate(pos, size)
+                if chain:
+                    self.base_cache.put((path, offset), (type, data), len(data))
+                break
+            else:
+                raise GitError("Unknown object type %d at offset %d in %s" % (type, offset, path))
+        while chain:
+            offset, pos, size = chain.pop()
+            data = apply_delta(data, self._inflate(pos, size))
+            if chain:
+                # a base of the next delta
+                self.base_cache.put((path, offset), (type, data), len(data))
+        return type, data
+
+    def get(self, sha):
+        """
+        @param sha binary sha1
+        @retval (type name, content), None if not in this pack
+        """
+        offset = self.index.find(sha)
+        if offset is None:
+            return None
+        return self.read(offset)
+
 class GitObjectStore(object):
 
-    def __init__(self, root):
+    def __init__(self, root, cache_entries=4096, cache_bytes=96 * 2**20):
+        """
+        @param cache_entries, cache_bytes bounds of the delta base cache
+        shared by the packs
+        """
         self.prefix = os.path.join(root, '.git', 'objects')
+        self.base_cache = cas.ObjectCache(cache_entries, cache_bytes)
+        self.packs = []
+        for idx_path in sorted(glob.glob(os.path.join(self.prefix, 'pack', 'pack-*.idx'))):
+            pack_path = idx_path[:-4] + '.pack'
+            if os.path.exists(pack_path):
+                self.packs.append(PackFile(pack_path, PackIndex(idx_path),
+                                            self.base_cache, self._read_bin))
 
     def _full_path(self, obj_id):
         sub_dir, file_path = obj_id[:2], obj_id[2:]
         return os.path.join(self.prefix, sub_dir, file_path)
 
+    def read(self, obj_id):
+        """
+        @param obj_id hex sha1
+        @retval (type name, content)
+        """
+        return self._read_bin(binascii.unhexlify(obj_id), obj_id)
+
+    def _read_bin(self, sha, obj_id=None):
+        for pack in self.packs:
+            obj = pack.get(sha)
+            if obj is not None:
+                return obj
+        path = self._full_path(obj_id or binascii.hexlify(sha))
+        if not os.path.exists(path):
+            raise GitError("Object %s not found" % (obj_id or binascii.hexlify(sha)))
+        obj = zlib.decompress(open(path, 'rb').read())
+        null = obj.index(cas.NULL_CHR)
+        type, size = obj[:null].split()
+        return type, obj[null + 1:]
+
     def get(self, obj_id):
-        objz = open(self._full_path(obj_id)).read()
-        obj = zlib.decompress(objz)
-        return obj
-        
+        """
+        @retval encoded object (header and content, as in a loose object)
+        """
+        type, data = self.read(obj_id)
+        return "%s %d%s%s" % (type, len(data), cas.NULL_CHR, data)
+
     def put(self, file_path, file):
         return
 
+    def __len__(self):
+        """
+        @brief Number of packed objects
+        """
+        return sum([len(pack.index) for pack in self.packs])
+
 class GitRefStore(object):
 
     def __init__(self, root):
         self.prefix = os.path.join(root, '.git', 'refs')
+        self.packed_refs = os.path.join(root, '.git', 'packed-refs')
 
     def _full_path(self, ref, ref_type='heads'):
         return os.path.join(self.prefix, ref_type, ref)
 
+    def _packed(self, ref_type='heads'):
+        """
+        @brief refs of ref_type moved to packed-refs (by git gc)
+        """
+        refs = {}
+        if os.path.exists(self.packed_refs):
+            prefix = 'refs/%s/' % ref_type
+            for line in open(self.packed_refs):
+                if line[0] in '#^':
+                    continue
+                id, name = line.split()
+                if name.startswith(prefix):
+                    refs[name[len(prefix):]] = id
+        return refs
+
     def get(self, ref, ref_type='heads'):
-        return open(self._full_path(ref, ref_type)).read().strip()
+        path = self._full_path(ref, ref_type)
+        if os.path.exists(path):
+            return open(path).read().strip()
+        return self._packed(ref_type).get(ref)
 
     def list(self, ref_type='heads'):
-        return os.listdir(self._full_path(''))
+        names = set(self._packed(ref_type))
+        names.update(os.listdir(self._full_path('', ref_type)))
+        return sorted(names)
 
 
 class GitDB(cas.CAStore):
@@ -51,16 +398,51 @@ class GitDB(cas.CAStore):
 
     Implements store.IStore interface
     """
-    
-    def __init__(self, project_root):
+
+    def __init__(self, project_root, cache_entries=10000, cache_bytes=32 * 2**20):
         """
         @param project_root full path to root of git repository (the
         directory containing the .git directory
+        @param cache_entries, cache_bytes bounds of the cache of decoded
+        objects
         """
         assert os.path.isdir(project_root)
         self.root = project_root
         self.objstore = GitObjectStore(project_root)
         self.refstore = GitRefStore(project_root)
+        self.cache = cas.ObjectCache(cache_entries, cache_bytes)
+
+    def read(self, id):
+        """
+        @param id hex or binary sha1
+        @retval decoded object
+        @note git commits carry headers (author, committer) that
+        cas.Commit does not encode, so objects are not re-hashed to verify
+        them.
+        """
+        if len(id) == 20:
+            id = cas.sha1_to_hex(id)
+        obj = self.cache.get(id)
+        if obj is None:
+            type, data = self.objstore.read(id)
+            try:
+                obj = self.TYPES[type]._decode_body(data)
+            except KeyError:
+                raise GitError("Can not decode %s object %s" % (type, id))
+            self.cache.put(id, obj, len(data))
+        return obj
+
+    def get(self, id):
+        try:
+            return defer.succeed(self.read(id))
+        except cas.CAStoreError:
+            return defer.fail()
+
+    def get_many(self, ids):
+        try:
+            return defer.succeed([self.read(id) for id in ids])
+        except cas.CAStoreError:
+            return defer.fail()
 
 class Git(GitDB):
     """
@@ -81,19 +463,16 @@ class Git(GitDB):
         return self.get_head()
 
     def get_commit(self, id):
-        commit = self.objstore.get(id)
-        commit_obj = self.decode(commit)
-        return commit_obj
+        return self.read(id)
 
     def get_tree(self, id):
-        o = self.objstore.get(id)
-        return self.decode(o)
+        return self.read(id)
 
     def get_commit_history(self):
         commits = []
         id = self.get_head()
         if not id:
-            return 
+            return
         while True:
             c = self.get_commit(id)
             commits.append(c)
@@ -103,11 +482,14 @@ class Git(GitDB):
                 continue
             break
         return commits
-        
+
     def log(self):
         commits = self.get_commit_history()
+        id = self.get_head()
         for commit in commits:
-            print 'commit', objstore.sha1hex(commit.value)
+            # git commits do not re-encode to their id (see GitDB.read)
+            print 'commit', id
+            id = commit.parents and commit.parents[0]
             print 'tree', commit.tree
             for k,v in commit.other.items():
                 if k in ('author', 'committer'):
@@ -118,9 +500,8 @@ class Git(GitDB):
             print commit.log
 
     def get_obj_info(self, id):
-        o = self.objstore.get(id)
-        obj = self.decode(o)
-        return obj.type
+        type, data = self.objstore.read(id)
+        return type
 
     def list_files(self):
         c = self.get_commit(self.head)
@@ -131,10 +512,6 @@ class Git(GitDB):
         t = self.get_tree(c.tree)
         for child in t.children:
             name = child[0]
-            type = self.get_obj_info(objstore.sha1_to_hex(child[1]))
+            type = self.get_obj_info(cas.sha1_to_hex(child[1]))
             ls[name] = type
         return ls
-
-
-        
-
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+"""
+@file ion/play/test/test_git.py
+@test ion.play.objstore.git reading loose objects and packfiles
+"""
+
+import os
+import zlib
+import struct
+import shutil
+import hashlib
+import tempfile
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from ion.data.datastore import cas
+from ion.play.objstore import git
+
+def git_sha(type, content):
+    return hashlib.sha1('%s %d\x00%s' % (type, len(content), content)).digest()
+
+def varint(n):
+    out = []
+    while True:
+        c = n & 0x7f
+        n >>= 7
+        if n:
+            out.append(chr(c | 0x80))
+        else:
+            out.append(chr(c))
+            return ''.join(out)
+
+def obj_header(type, size):
+    c = (type << 4) | (size & 0x0f)
+    size >>= 4
+    out = []
+    while size:
+        out.append(chr(c | 0x80))
+        c = size & 0x7f
+        size >>= 7
+    out.append(chr(c))
+    return ''.join(out)
+
+def ofs_encode(rel):
+    out = [chr(rel & 0x7f)]
+    rel >>= 7
+    while rel:
+        rel -= 1
+        out.append(chr(0x80 | (rel & 0x7f)))
+        rel >>= 7
+    return ''.join(reversed(out))
+
+def make_delta(base, prefix, suffix):
+    """
+    Delta of prefix + base[:-1] + suffix: an insert, a copy, an insert
+    """
+    copy = len(base) - 1
+    return (varint(len(base)) + varint(len(prefix) + copy + len(suffix)) +
+            chr(len(prefix)) + prefix +
+            chr(0x80 | 0x01 | 0x10 | 0x20) + chr(0) + chr(copy & 0xff) + chr(copy >> 8) +
+            chr(len(suffix)) + suffix)
+
+def write_pack(path, entries):
+    """
+    @param entries list of (sha, type, base, data); base is the index of
+    an earlier entry for OFS_DELTA, the binary sha1 for REF_DELTA
+    """
+    body = ['PACK', struct.pack('>LL', 2, len(entries))]
+    pos = 12
+    offsets = []
+    for sha, type, base, data in entries:
+        offsets.append(pos)
+        header = obj_header(type, len(data))
+        if type == git.OBJ_OFS_DELTA:
+            header += ofs_encode(pos - offsets[base])
+        elif type == git.OBJ_REF_DELTA:
+            header += base
+        chunk = header + zlib.compress(data)
+        body.append(chunk)
+        pos += len(chunk)
+    pack = ''.join(body)
+    pack += hashlib.sha1(pack).digest()
+    open(path + '.pack', 'wb').write(pack)
+
+    index = sorted([(e[0], off) for e, off in zip(entries, offsets)])
+    fanout = [0] * 256
+    for sha, off in index:
+        for b in range(ord(sha[0]), 256):
+            fanout[b] += 1
+    idx = [git.IDX_MAGIC, struct.pack('>L', 2), struct.pack('>256L', *fanout)]
+    idx.extend([sha for sha, off in index])
+    idx.extend([struct.pack('>L', 0) for sha, off in index])
+    idx.extend([struct.pack('>L', off) for sha, off in index])
+    open(path + '.idx', 'wb').write(''.join(idx) + pack[-20:] + '\x00' * 20)
+
+class GitPackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        objects = os.path.join(self.root, '.git', 'objects')
+        os.makedirs(os.path.join(objects, 'pack'))
+        os.makedirs(os.path.join(self.root, '.git', 'refs', 'heads'))
+
+        self.contents = {}
+        base = 'line of a file that is changed in each version\n' * 20
+        v2 = 'v2 ' + base[:-1] + ' end v2\n'
+        v3 = 'v3 ' + v2[:-1] + ' end v3\n'
+        v4 = 'v4 ' + base[:-1] + ' end v4\n'
+        shas = [git_sha('blob', c) for c in (base, v2, v3, v4)]
+        tree = '100644 file\x00' + shas[2]
+        tree_sha = git_sha('tree', tree)
+        commit = ('tree %s\nauthor A <a@b> 1276000000 +0000\n'
+                  'committer A <a@b> 1276000000 +0000\n\nthe log\n' % cas.sha1_to_hex(tree_sha))
+        commit_sha = git_sha('commit', commit)
+        entries = [
+                (shas[0], git.OBJ_BLOB, None, base),
+                (shas[1], git.OBJ_OFS_DELTA, 0, make_delta(base, 'v2 ', ' end v2\n')),
+                (shas[2], git.OBJ_REF_DELTA, shas[1], make_delta(v2, 'v3 ', ' end v3\n')),
+                (shas[3], git.OBJ_OFS_DELTA, 0, make_delta(base, 'v4 ', ' end v4\n')),
+                (tree_sha, git.OBJ_TREE, None, tree),
+                (commit_sha, git.OBJ_COMMIT, None, commit),
+                ]
+        write_pack(os.path.join(objects, 'pack', 'pack-test'), entries)
+        for content, sha in zip((base, v2, v3, v4), shas):
+            self.contents[cas.sha1_to_hex(sha)] = content
+        self.tree_id = cas.sha1_to_hex(tree_sha)
+        self.commit_id = cas.sha1_to_hex(commit_sha)
+
+        loose = 'a loose blob\n'
+        self.loose_id = cas.sha1_to_hex(git_sha('blob', loose))
+        self.contents[self.loose_id] = loose
+        os.makedirs(os.path.join(objects, self.loose_id[:2]))
+        open(os.path.join(objects, self.loose_id[:2], self.loose_id[2:]), 'wb').write(
+                zlib.compress('blob %d\x00%s' % (len(loose), loose)))
+
+        open(os.path.join(self.root, '.git', 'packed-refs'), 'w').write(
+                '# pack-refs with: peeled\n%s refs/heads/master\n' % self.commit_id)
+        self.git = git.Git(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_read_blobs(self):
+        for id, content in self.contents.items():
+            type, data = self.git.objstore.read(id)
+            self.assertEqual(type, 'blob')
+            self.assertEqual(data, content)
+            self.assertEqual(cas.sha1_to_hex(git_sha(type, data)), id)
+
+    def test_base_cache(self):
+        v3 = [id for id, c in self.contents.items() if c.startswith('v3 ')][0]
+        self.git.objstore.read(v3)
+        # the base and v2 were rebuilt on the way to v3
+        self.assertEqual(len(self.git.objstore.base_cache), 2)
+        self.git.objstore.read(v3)
+        self.assertEqual(self.git.objstore.base_cache.hits, 1)
+
+    def test_commit_and_tree(self):
+        self.assertEqual(self.git.get_heads(), ['master'])
+        self.assertEqual(self.git.head, self.commit_id)
+        commit = self.git.get_commit(self.commit_id)
+        self.assertEqual(commit.tree, self.tree_id)
+        self.assertEqual(commit.log, 'the log\n')
+        self.assertEqual(self.git.list_files(), {'file':'blob'})
+        self.assertEqual(len(self.git.get_commit_history()), 1)
+
+    @defer.inlineCallbacks
+    def test_get(self):
+        objs = yield self.git.get_many(self.contents.keys())
+        self.assertEqual([o.content for o in objs], self.contents.values())
+        yield self.failUnlessFailure(self.git.get('00' * 20), git.GitError)
+
+    def test_apply_delta(self):
+        base = 'abcdefgh'
+        self.assertEqual(git.apply_delta(base, make_delta(base, 'x', 'y')), 'xabcdefgy')
+        self.assertRaises(git.GitError, git.apply_delta, base + 'z', make_delta(base, 'x', 'y'))
@@ -21,8 +21,13 @@ class SetResourceLCStateContainer(DataObject):
 class ResourceListContainer(DataObject):
     """
     @ Brief a message object used to pass a list of resource description objects
+    @ note after is the resume key of the next page of a paged find; empty
+    after the last page. candidates are the names of the resources left
+    to check for the next pages.
     """
     resources = TypedAttribute(list, default=None)
+    after = TypedAttribute(list)
+    candidates = TypedAttribute(list)
 
 
 class FindResourceContainer(DataObject):
@@ -34,6 +39,12 @@ class FindResourceContainer(DataObject):
     regex = TypedAttribute(bool, default=True)
     ignore_defaults = TypedAttribute(bool, default=True)
     attnames = TypedAttribute(list)
+    # Paged find: most resources per reply (0 for all), the
+    # RegistryIdentity of the last resource of the previous page and those
+    # of the resources left to check
+    page_size = TypedAttribute(int, default=0)
+    after = TypedAttribute(list)
+    candidates = TypedAttribute(list)
 
 
 """
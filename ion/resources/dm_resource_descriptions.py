@@ -47,23 +47,29 @@ Pub Sub Messaging objects!
 class DataMessageObject(DataObject):
     """
     Base Class for Data PubSub Message Objects
+    @note Message objects are created per sample; they use compact (slot)
+    storage, so only their typed attributes can be set.
     """
+    _compact = True
     notification = TypedAttribute(str)
     timestamp = TypedAttribute(float)
     
     
 class DAPMessageObject(DataMessageObject):
     """Container object for messaging DAP data"""
+    _compact = True
     das = TypedAttribute(str)
     dds = TypedAttribute(str)
-    dods = TypedAttribute(str)
+    dods = TypedAttribute(buffer) # xdr encoded data, binary
 
 class StringMessageObject(DataMessageObject):
     """Container object for messaging STRING data"""
+    _compact = True
     data = TypedAttribute(str)
     
 class DictionaryMessageObject(DataMessageObject):
     """Container object for messaging DICTIONARY data"""
+    _compact = True
     data = TypedAttribute(dict)
     
     
@@ -71,6 +77,7 @@ class Publication(DataObject):
     """
     A container message for things published
     """
+    _compact = True
     topic_ref = TypedAttribute(ResourceReference) # The registered reference to a topic
     data = TypedAttribute(DataMessageObject) # Any Data Object!
     publisher = TypedAttribute(str) # The identity of the publisher
@@ -243,7 +243,8 @@ class BaseConsumer(BaseProcess):
         #self.received_msg.append(content) # Do not keep the messages!
 
         # Unpack the message and turn it into data
-        datamessage = dataobject.DataObject.decode(content)
+        # Nested attributes are only decoded if the consumer reads them
+        datamessage = dataobject.DataObject.decode(content, lazy=True)
         if isinstance(datamessage, DAPMessageObject):
             data = dap_tools.dap_msg2ds(datamessage)
         elif isinstance(datamessage, (StringMessageObject, DictionaryMessageObject)):
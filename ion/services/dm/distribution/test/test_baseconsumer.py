@@ -169,7 +169,7 @@ class BaseConsumerTest(IonTestCase):
         child1_id = yield self.test_sup.spawn_child(child1)
 
         dmsg = DataMessageObject()
-        dmsg.notifcation = 'Junk'
+        dmsg.notification = 'Junk'
         dmsg.timestamp = pu.currenttime()
         dmsg = dmsg.encode()
         
@@ -197,7 +197,7 @@ class BaseConsumerTest(IonTestCase):
         child1_id = yield self.test_sup.spawn_child(child1)
 
         dmsg = DataMessageObject()
-        dmsg.notifcation = 'Junk'
+        dmsg.notification = 'Junk'
         dmsg.timestamp = pu.currenttime()
         dmsg = dmsg.encode()
         
@@ -270,7 +270,7 @@ class BaseConsumerTest(IonTestCase):
         self.assertIn(self.queue2,dc1.dataReceivers)
         
         dmsg = DataMessageObject()
-        dmsg.notifcation = 'Junk'
+        dmsg.notification = 'Junk'
         dmsg.timestamp = pu.currenttime()
         dmsg = dmsg.encode()
         
@@ -315,7 +315,7 @@ class BaseConsumerTest(IonTestCase):
         child1_id = yield self.test_sup.spawn_child(child1)
 
         dmsg = DataMessageObject()
-        dmsg.notifcation = 'Junk'
+        dmsg.notification = 'Junk'
         dmsg.timestamp = pu.currenttime()
         dmsg = dmsg.encode()
         
@@ -356,7 +356,7 @@ class BaseConsumerTest(IonTestCase):
         child1_id = yield self.test_sup.spawn_child(child1)
 
         dmsg = DataMessageObject()
-        dmsg.notifcation = 'Junk'
+        dmsg.notification = 'Junk'
         dmsg.timestamp = pu.currenttime()
         dmsg = dmsg.encode()
         
@@ -20,7 +20,6 @@ from pydap.parsers.dds import DDSParser
 from pydap.parsers.das import DASParser
 from pydap.xdr import DapUnpacker
 from pydap.responses import netcdf
-import base64
 import StringIO
 
 # Import value types
@@ -55,8 +54,8 @@ def ds2dap_msg(pydap_dataset,headeronly=False):
         #    dods = dap_gen(pydap_dataset)
         dods = dap_gen(pydap_dataset)
 
-        msg.dods = base64.b64encode(dods)
-        #msg.dods = dods    
+        # Binary payload attribute, no base64
+        msg.dods = buffer(dods)
     return (msg)
 
 def dap_gen(ds):
@@ -87,8 +86,7 @@ def dap_msg2ds(msg):
     
     if msg.dods:
         # This block is from open_dods in client.py
-        dataset.data = DapUnpacker(base64.b64decode(msg.dods), dataset).getvalue()
-        #dataset.data = DapUnpacker(msg.dods, dataset).getvalue()
+        dataset.data = DapUnpacker(msg.dods, dataset).getvalue()
         
     return dataset
 
@@ -110,7 +108,7 @@ def read_msg_from_dap_files(filename):
     msg=dm_resource_descriptions.DAPMessageObject()
     msg.das = das
     msg.dds = dds
-    msg.dods = xdrdata   
+    msg.dods = buffer(xdrdata)
     
     return msg
 
@@ -129,8 +127,7 @@ def write_dap_files_from_msg(filename,msg):
     das_file.close()
     #This breaks on some system 
     dods_file = open(".".join((filestem,"dods")), "w")
-    for line in msg.dods:
-        dods_file.write(line)
+    dods_file.write(msg.dods)
     dods_file.close()    
     return 0
 